@@ -1,53 +1,64 @@
+from collections import OrderedDict, defaultdict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Set, Tuple
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt, JWTError
 import hashlib
+import os
+import time
 from app.models import TokenData, UserInDB
-from app.db import db
+from app.db import PLACEHOLDER_PASSWORD_HASHES, db, run_db
+from app.hashing import check_password, hash_pool, hash_password, needs_rehash
 
 # Security
 security = HTTPBearer()
 
-# SIMPLE password hashing for testing (NOT for production!)
+# Legacy unsalted hashes, still accepted and upgraded at the next login
 def simple_hash(password: str) -> str:
-    """Simple hash for testing - in production use bcrypt"""
+    """SHA-256 hex digest, the format of hashes stored before bcrypt"""
     return hashlib.sha256(password.encode()).hexdigest()
 
 def verify_password(plain_password, hashed_password):
-    """Verify password with simple hash"""
-    return simple_hash(plain_password) == hashed_password
+    """Verify a password against a bcrypt or legacy hash (blocks; see hash_pool)"""
+    return check_password(plain_password, hashed_password)
 
 def get_password_hash(password):
-    """Hash password with simple method"""
-    return simple_hash(password)
+    """bcrypt hash of a password (blocks; see hash_pool)"""
+    return hash_password(password)
 
 # Update database with simple hashes
 def update_db_hashes():
-    """Update all password hashes in database to simple hashes"""
-    for user in db.users:
-        username = user["username"]  # Get username first
-        if username == "john_doe" or username == "Jessica_Jimenez":  # FIXED
-            user["hashed_password"] = simple_hash("password123")
-        elif username == "admin_user":
-            user["hashed_password"] = simple_hash("password123")
+    """Give the seed users their password123 hash (legacy, upgraded at first login)"""
+    for username in ("john_doe", "Jessica_Jimenez", "admin_user"):
+        user = db.get_user_by_username(username)
+        # Only seed users still on their placeholder hash; a password
+        # changed since (and replayed from the journal) must be kept
+        if user and user["hashed_password"] in PLACEHOLDER_PASSWORD_HASHES:
+            db.update_user(user["id"], {"hashed_password": simple_hash("password123")})
 
-# Update the hashes
-update_db_hashes()
+# Update the hashes (a restored snapshot already has them)
+if db.seeded:
+    update_db_hashes()
 
 def get_user(username: str) -> Optional[UserInDB]:
-    for user in db.users:
-        if user["username"] == username:
-            return UserInDB(**user)
+    user = db.get_user_by_username(username)
+    if user:
+        return UserInDB(**user)
     return None
 
-def authenticate_user(username: str, password: str):
-    user = get_user(username)
-    if not user:
+async def authenticate_user(username: str, password: str):
+    user = await run_db(get_user, username)
+    # A seed user whose hash was never replaced has no password yet
+    if not user or user.hashed_password in PLACEHOLDER_PASSWORD_HASHES:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await hash_pool.run(verify_password, password, user.hashed_password):
         return False
+    # Upgrade legacy and outdated hashes while the password is at hand,
+    # unless the pool is too busy to spare the time
+    if needs_rehash(user.hashed_password) and not hash_pool.full():
+        hashed = await hash_pool.run(get_password_hash, password)
+        await run_db(db.update_user, user.id, {"hashed_password": hashed})
     return user
 
 # JWT Configuration
@@ -61,29 +72,126 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    # Issue time to the microsecond, compared with revocations of all of a
+    # user's sessions (see is_user_revoked)
+    to_encode.update({"exp": expire, "iat": time.time()})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# Refresh-token sessions, kept by the store so that every worker sees them;
+# access tokens name theirs in the "sid" claim
+session_store = db.open_sessions(access_ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+# Verified tokens cached per worker; 0 turns the cache off. An entry lasts
+# until its token expires or TOKEN_CACHE_TTL seconds pass, whichever is
+# first: the TTL bounds how long a user changed through another worker
+# stays cached here.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "60"))
+
+
+class TokenCache:
+    """LRU of verified bearer tokens and the users they resolved to.
+
+    A hit skips the signature check, the user lookup and building the
+    UserInDB. invalidate_user drops every token of a user once the user is
+    updated or deactivated.
+    """
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, Tuple[UserInDB, float]]" = OrderedDict()
+        self.tokens_of: Dict[int, Set[str]] = defaultdict(set)
+        # Bumped by every invalidation; a lookup that started before one
+        # may have read the old user and is not cached
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[UserInDB]:
+        entry = self.entries.get(token)
+        if entry is None or entry[1] <= time.time():
+            if entry is not None:
+                self._drop(token)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(token)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, token: str, user: UserInDB, expires: float, epoch: int):
+        if not self.max_entries or epoch != self.epoch:
+            return
+        self.entries[token] = (user, min(expires, time.time() + self.ttl))
+        self.entries.move_to_end(token)
+        self.tokens_of[user.id].add(token)
+        while len(self.entries) > self.max_entries:
+            self._drop(next(iter(self.entries)))
+
+    def invalidate_user(self, user_id: int):
+        self.epoch += 1
+        for token in self.tokens_of.pop(user_id, ()):
+            self.entries.pop(token, None)
+
+    def _drop(self, token: str):
+        user, _ = self.entries.pop(token)
+        tokens = self.tokens_of[user.id]
+        tokens.discard(token)
+        if not tokens:
+            del self.tokens_of[user.id]
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+token_cache = TokenCache()
+
+
+async def revoke_sessions(user_id: int, session_id: Optional[str] = None):
+    """Revoke one session of a user, or all of them, effective at once here
+    and on other workers at their next poll."""
+    await run_db(session_store.revoke, user_id, session_id)
+    # Tokens of the revoked sessions may be cached
+    token_cache.invalidate_user(user_id)
+
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    token = credentials.credentials
+    if session_store.poll_due():
+        # Cached tokens of sessions other workers revoked
+        for user_id in await run_db(session_store.poll_revoked):
+            token_cache.invalidate_user(user_id)
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    epoch = token_cache.epoch
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         role: str = payload.get("role")
         if username is None:
             raise credentials_exception
+        session_id = payload.get("sid")
+        if session_id is not None and session_store.is_revoked(session_id):
+            raise credentials_exception
         token_data = TokenData(username=username, role=role)
     except JWTError:
         raise credentials_exception
     
-    user = get_user(username=token_data.username)
+    user = await run_db(get_user, username=token_data.username)
     if user is None:
         raise credentials_exception
+    # Tokens from before the iat claim count as issued at 0
+    if session_store.is_user_revoked(user.id, payload.get("iat", 0.0)):
+        raise credentials_exception
+    token_cache.put(token, user, payload.get("exp", float("inf")), epoch)
     return user
 
 async def get_current_active_user(current_user: UserInDB = Depends(get_current_user)):
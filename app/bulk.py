@@ -0,0 +1,316 @@
+# app/bulk.py
+"""
+Streaming bulk import and export as NDJSON or CSV
+
+The request body is read as it arrives and never held whole: records are
+validated as their lines come in, applied to the store in batches, and
+one result line per record is streamed back after each batch.
+
+Exports walk the store in id order a chunk at a time, so memory stays flat
+however large the catalog or order history grows.
+"""
+import asyncio
+import csv
+import json
+import os
+import tempfile
+import zlib
+from io import StringIO
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Sequence, Tuple, Union
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from starlette.responses import StreamingResponse
+
+from app.db import db, run_db
+from app.models import ProductCreate
+
+# Records applied per store call (one index merge / transaction each)
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+
+# Records read from the store per export chunk
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
+IMPORT_FORMATS = EXPORT_FORMATS = ("ndjson", "csv")
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CSV_MEDIA_TYPE = "text/csv"
+
+# Read size when streaming spooled results back
+RESULT_CHUNK_SIZE = 64 * 1024
+
+# Separator of the values of a list column (tags) in CSV
+CSV_LIST_SEPARATOR = "|"
+
+# A parsed record's fields, or why it could not be parsed
+Parsed = Tuple[int, Union[Dict[str, Any], str]]
+
+
+class ImportResponse(StreamingResponse):
+    """StreamingResponse that leaves `receive` to the request body.
+
+    The stock one listens for a client disconnect while it streams, which
+    would swallow the body chunks the import has yet to read.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def read_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[List[bytes]]:
+    """Complete lines of a streamed body, a chunk's worth at a time."""
+    rest = b""
+    async for chunk in chunks:
+        lines = (rest + chunk).split(b"\n")
+        rest = lines.pop()
+        if lines:
+            yield lines
+    if rest:
+        yield [rest]
+
+
+async def ndjson_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[List[Parsed]]:
+    line_no = 0
+    async for lines in read_lines(chunks):
+        parsed = []
+        for line in lines:
+            line_no += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                parsed.append((line_no, f"Invalid JSON: {e}"))
+                continue
+            if not isinstance(record, dict):
+                parsed.append((line_no, "Expected a JSON object"))
+                continue
+            parsed.append((line_no, validate_product(record)))
+        yield parsed
+
+
+async def csv_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[List[Parsed]]:
+    """Rows of a CSV body with a header line, keyed by the header's column names.
+
+    Empty cells are left out (so defaults apply), and tags are separated by
+    CSV_LIST_SEPARATOR. Quoted values may span lines.
+    """
+    header = None
+    line_no = start = quotes = 0
+    pending: List[str] = []
+    async for lines in read_lines(chunks):
+        parsed = []
+        for line in lines:
+            line_no += 1
+            if not pending:
+                start = line_no
+            text = line.decode("utf-8", errors="replace").rstrip("\r")
+            pending.append(text)
+            # An odd number of quotes so far means a quoted value continues
+            quotes += text.count('"')
+            if quotes % 2:
+                continue
+            row = next(csv.reader(["\n".join(pending)]), [])
+            pending, quotes = [], 0
+            if header is None:
+                header = [name.strip() for name in row]
+                continue
+            if not any(value.strip() for value in row):
+                continue
+            if len(row) != len(header):
+                parsed.append((start, f"Expected {len(header)} columns, got {len(row)}"))
+                continue
+            parsed.append((start, validate_product(csv_fields(header, row))))
+        yield parsed
+    if pending:
+        yield [(start, "Unterminated quoted value")]
+
+
+def csv_fields(header: List[str], row: List[str]) -> Dict[str, Any]:
+    fields: Dict[str, Any] = {}
+    for name, value in zip(header, row):
+        if value == "":
+            continue
+        if name == "tags":
+            fields[name] = [tag.strip() for tag in value.split(CSV_LIST_SEPARATOR) if tag.strip()]
+        else:
+            fields[name] = value
+    return fields
+
+
+def validate_product(record: Dict[str, Any]) -> Union[Dict[str, Any], str]:
+    """Product fields ready for db.import_products, or a validation error.
+
+    An `id` makes the record an upsert of that product.
+    """
+    product_id = record.get("id")
+    if isinstance(product_id, str) and product_id.strip().isdigit():
+        product_id = int(product_id)
+    if product_id is not None and (type(product_id) is not int or product_id < 1):
+        return "id: must be a positive integer"
+    try:
+        product = ProductCreate(**record)
+    except ValidationError as e:
+        return "; ".join(
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+        )
+    fields = dict(product)
+    fields["createdAt"] = "2024-01-15"  # as create_product sets it
+    if product_id is not None:
+        fields["id"] = product_id
+    return fields
+
+
+async def import_products(chunks: AsyncIterator[bytes], format: str) -> AsyncIterator[bytes]:
+    """Apply a streamed NDJSON or CSV body and yield NDJSON results.
+
+    Every record gets a line - {"line", "id", "status": "created" or
+    "updated"} or {"line", "status": "error", "error"} - in input order,
+    and a final {"summary": {...}} line gives the totals.
+
+    The import runs as its own task and appends results to a temporary
+    file that the response is read from. Most HTTP/1.1 clients send the
+    whole body before reading the response; writing to them directly would
+    stall the import once the socket buffers fill.
+    """
+    spool = tempfile.TemporaryFile(buffering=0)
+    written = asyncio.Event()
+
+    async def run():
+        try:
+            async for results in _import(chunks, format):
+                spool.write(results)
+                written.set()
+        finally:
+            written.set()
+
+    task = asyncio.ensure_future(run())
+    offset = 0
+    try:
+        while True:
+            data = os.pread(spool.fileno(), RESULT_CHUNK_SIZE, offset)
+            if data:
+                offset += len(data)
+                yield data
+            elif task.done():
+                task.result()  # re-raise a failed import
+                return
+            else:
+                written.clear()
+                await written.wait()
+    finally:
+        task.cancel()
+        spool.close()
+
+
+async def _import(chunks: AsyncIterator[bytes], format: str) -> AsyncIterator[bytes]:
+    records = csv_records(chunks) if format == "csv" else ndjson_records(chunks)
+    counts = {"created": 0, "updated": 0, "failed": 0}
+    batch: List[Parsed] = []
+    async for parsed in records:
+        batch.extend(parsed)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            yield await _apply(batch, counts)
+            batch = []
+    if batch:
+        yield await _apply(batch, counts)
+    yield (json.dumps({"summary": counts}) + "\n").encode()
+
+
+async def _apply(batch: List[Parsed], counts: Dict[str, int]) -> bytes:
+    products = [fields for _, fields in batch if not isinstance(fields, str)]
+    applied = iter(await run_db(db.import_products, products) if products else ())
+    results = []
+    for line_no, fields in batch:
+        if isinstance(fields, str):
+            counts["failed"] += 1
+            results.append({"line": line_no, "status": "error", "error": fields})
+            continue
+        product_id, created = next(applied)
+        status = "created" if created else "updated"
+        counts[status] += 1
+        results.append({"line": line_no, "id": product_id, "status": status})
+    return "".join(json.dumps(result) + "\n" for result in results).encode()
+
+
+def export_response(
+    name: str,
+    fetch: Callable[[int, int], List[Dict[str, Any]]],
+    fields: Sequence[str],
+    format: str,
+    gzip: bool = False
+) -> StreamingResponse:
+    """A download of `name` streamed from export_records."""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    headers = {"Content-Disposition": f'attachment; filename="{name}.{format}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export_records(fetch, fields, format, gzip),
+        media_type=CSV_MEDIA_TYPE if format == "csv" else NDJSON_MEDIA_TYPE,
+        headers=headers
+    )
+
+
+async def export_records(
+    fetch: Callable[[int, int], List[Dict[str, Any]]],
+    fields: Sequence[str],
+    format: str,
+    gzip: bool = False
+) -> AsyncIterator[bytes]:
+    """Every record `fetch` pages through, as NDJSON or CSV (with a header line).
+
+    `fetch(after_id, limit)` returns the next records in id order. Between
+    chunks the event loop gets to run other requests, and the in-memory
+    store is never iterated across an await: each chunk resumes past the
+    last id seen. With `gzip` the output is one gzip stream.
+    """
+    compressor = zlib.compressobj(wbits=31) if gzip else None  # 31: gzip header and trailer
+    encode = _csv_rows if format == "csv" else _ndjson_rows
+    after_id = 0
+    data = (_csv_text([fields]) if format == "csv" else "").encode()
+    while True:
+        records = await run_db(fetch, after_id, EXPORT_CHUNK_SIZE)
+        if records:
+            after_id = records[-1]["id"]
+            data += encode(records, fields).encode()
+        if compressor is not None:
+            data = compressor.compress(data)
+            if len(records) < EXPORT_CHUNK_SIZE:
+                data += compressor.flush()
+        if data:
+            yield data
+            data = b""
+        if len(records) < EXPORT_CHUNK_SIZE:
+            return
+        await asyncio.sleep(0)
+
+
+def _ndjson_rows(records: List[Dict[str, Any]], fields: Sequence[str]) -> str:
+    return "".join(json.dumps(dict(record)) + "\n" for record in records)
+
+
+def _csv_rows(records: List[Dict[str, Any]], fields: Sequence[str]) -> str:
+    return _csv_text([_csv_value(record[name]) for name in fields] for record in records)
+
+
+def _csv_text(rows: Iterable[Sequence[str]]) -> str:
+    text = StringIO()
+    csv.writer(text, lineterminator="\n").writerows(rows)
+    return text.getvalue()
+
+
+def _csv_value(value: Any) -> str:
+    """A cell as csv_records reads it back: lists of names joined by
+    CSV_LIST_SEPARATOR, other lists (order items) as JSON."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, list):
+        if all(isinstance(item, str) for item in value):
+            return CSV_LIST_SEPARATOR.join(value)
+        return json.dumps(value)
+    return str(value)
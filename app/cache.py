@@ -0,0 +1,147 @@
+# app/cache.py
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from app.db import db, run_db
+from app.singleflight import SingleFlight
+
+# Number of responses kept; 0 disables the cache
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+
+# Public catalog reads whose output depends only on the URL and the catalog
+CACHEABLE_PATHS = re.compile(r"^/products/(categories|facets|batch|\d+)?$")
+
+
+class CachedResponse(NamedTuple):
+    version: int
+    status: int
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+    etag: bytes
+
+
+class ResponseCache:
+    """LRU of serialized responses, each tagged with the catalog version it was built at.
+
+    An entry older than the current version is a miss, so product writes
+    invalidate everything at once without the cache knowing which
+    responses they touched.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Any, CachedResponse]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key: Any, version: int) -> Optional[CachedResponse]:
+        entry = self.entries.get(key)
+        if entry is None or entry.version != version:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: Any, entry: CachedResponse):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+        }
+
+
+def cache_key(scope: Dict[str, Any]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    """Path plus sorted query parameters, so ?a=1&b=2 and ?b=2&a=1 share an entry."""
+    query = parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)
+    return scope["path"], tuple(sorted(query))
+
+
+def etag_matches(scope: Dict[str, Any], etag: bytes) -> bool:
+    for name, value in scope["headers"]:
+        if name == b"if-none-match":
+            candidates = [tag.strip().removeprefix(b"W/") for tag in value.split(b",")]
+            return etag in candidates or b"*" in candidates
+    return False
+
+
+class ResponseCacheMiddleware:
+    """Serve repeat catalog reads from ResponseCache.
+
+    Wraps the app at the ASGI level, so the routers are untouched: a miss
+    runs the route as usual and keeps the bytes of a 200 response. Every
+    cached response carries a strong ETag (a hash of its body), and a
+    matching If-None-Match is answered with 304 and no body.
+
+    Concurrent misses for the same URL at the same catalog version share a
+    single run of the route through SingleFlight, even with the cache
+    itself disabled, so a burst of identical reads costs one computation.
+    """
+
+    def __init__(self, app, cache: Optional[ResponseCache] = None, flights: Optional[SingleFlight] = None):
+        self.app = app
+        self.cache = cache or ResponseCache()
+        self.flights = flights or SingleFlight()
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "GET"
+            or not CACHEABLE_PATHS.match(scope["path"])
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        key = cache_key(scope)
+        version = await run_db(db.get_catalog_version)
+        entry = self.cache.get(key, version) if self.cache.max_entries else None
+        if entry is None:
+            entry = await self.flights.run((key, version), lambda: self._render(scope, receive, key, version))
+        await self._respond(scope, send, entry)
+
+    async def _render(self, scope, receive, key, version: int) -> CachedResponse:
+        """Run the route and capture its response; only a 200 is kept in the cache."""
+        messages = []
+
+        async def capture(message):
+            messages.append(message)
+
+        await self.app(scope, receive, capture)
+        start = messages[0]
+        body = b"".join(m.get("body", b"") for m in messages[1:])
+        headers = [(name, value) for name, value in start.get("headers", []) if name != b"content-length"]
+        etag = b'"' + hashlib.blake2b(body, digest_size=16).hexdigest().encode() + b'"'
+        entry = CachedResponse(version, start["status"], headers, body, etag)
+        if entry.status == 200 and self.cache.max_entries:
+            self.cache.put(key, entry)
+        return entry
+
+    async def _respond(self, scope, send, entry: CachedResponse):
+        if entry.status != 200:
+            headers = entry.headers + [(b"content-length", str(len(entry.body)).encode())]
+            await send({"type": "http.response.start", "status": entry.status, "headers": headers})
+            await send({"type": "http.response.body", "body": entry.body})
+            return
+        if etag_matches(scope, entry.etag):
+            self.cache.not_modified += 1
+            await send({"type": "http.response.start", "status": 304, "headers": [(b"etag", entry.etag)]})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        headers = entry.headers + [
+            (b"content-length", str(len(entry.body)).encode()),
+            (b"etag", entry.etag),
+        ]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": entry.body})
@@ -0,0 +1,140 @@
+# app/columns.py
+import os
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+# The mirror is used whenever NumPy is installed; PRODUCT_COLUMNS=0 turns
+# it off and leaves every query on the sorted indexes.
+ENABLED = np is not None and os.getenv("PRODUCT_COLUMNS", "1") != "0"
+
+
+class ProductColumns:
+    """Columnar mirror of the product catalog in NumPy arrays.
+
+    One row per product holds its id, price, stock, rating, active flag and
+    category code. Filters become vectorized boolean masks over the rows,
+    and a page is picked with argpartition, so only the rows that can land
+    on it are fully sorted. Ties are ordered by ascending id, as on the
+    sorted-index path.
+    """
+
+    # Product fields mirrored here
+    FIELDS = ("price", "stock", "rating", "isActive", "category")
+    # Sort orders answered from the columns; others use the sorted indexes
+    SORT_KEYS = ("id", "price", "rating")
+
+    def __init__(self, products: Iterable[Dict[str, Any]] = ()):
+        products = list(products)
+        self.size = len(products)
+        self.codes: Dict[str, int] = {}
+        self.row_of: Dict[int, int] = {}
+        capacity = max(16, self.size)
+        self.id = np.zeros(capacity, dtype=np.int64)
+        self.price = np.zeros(capacity, dtype=np.float64)
+        self.stock = np.zeros(capacity, dtype=np.int64)
+        self.rating = np.zeros(capacity, dtype=np.float64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.category = np.zeros(capacity, dtype=np.int32)
+        for row, product in enumerate(products):
+            self._set(row, product)
+
+    def _code(self, category: str) -> int:
+        return self.codes.setdefault(category.lower(), len(self.codes))
+
+    def _set(self, row: int, product: Dict[str, Any]):
+        self.row_of[product["id"]] = row
+        self.id[row] = product["id"]
+        self.price[row] = product["price"]
+        self.stock[row] = product["stock"]
+        self.rating[row] = product.get("rating", 0)
+        self.active[row] = product["isActive"]
+        self.category[row] = self._code(product["category"])
+
+    def add(self, product: Dict[str, Any]):
+        if self.size == len(self.id):
+            # Amortized growth, like a list
+            for name in ("id", "price", "stock", "rating", "active", "category"):
+                column = getattr(self, name)
+                grown = np.zeros(len(column) * 2, dtype=column.dtype)
+                grown[:len(column)] = column
+                setattr(self, name, grown)
+        self._set(self.size, product)
+        self.size += 1
+
+    def update(self, product: Dict[str, Any]):
+        self._set(self.row_of[product["id"]], product)
+
+    def query(
+        self,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        is_active: Optional[bool] = None,
+        within: Optional[Set[int]] = None,
+        sort_by: str = "id",
+        reverse: bool = False,
+        offset: int = 0,
+        limit: int = 10,
+        after: Optional[Tuple[Any, int]] = None
+    ) -> Tuple[int, List[int]]:
+        """Filter and sort in the columns. Returns (total, ids of the page).
+
+        `within` restricts the result to a set of ids found elsewhere (tag
+        and text search). `after` is a (key, id) cursor: the page starts
+        just past it, and `total` still counts every match.
+        """
+        n = self.size
+        sort_column = getattr(self, sort_by if sort_by in self.SORT_KEYS else "id")
+        masks = []
+        if category:
+            code = self.codes.get(category.lower())
+            if code is None:
+                return 0, []
+            masks.append(self.category[:n] == code)
+        if is_active is not None:
+            masks.append(self.active[:n] == is_active)
+        if min_price is not None:
+            masks.append(self.price[:n] >= min_price)
+        if max_price is not None:
+            masks.append(self.price[:n] <= max_price)
+        if within is not None:
+            mask = np.zeros(n, dtype=bool)
+            row_of = self.row_of
+            mask[np.fromiter((row_of[i] for i in within), dtype=np.int64, count=len(within))] = True
+            masks.append(mask)
+
+        if masks:
+            mask = masks[0]
+            for other in masks[1:]:
+                mask &= other
+            rows = np.flatnonzero(mask)
+        else:
+            rows = np.arange(n)
+        total = len(rows)
+        if after is not None:
+            after_key, after_id = after
+            keys = sort_column[rows]
+            past = keys < after_key if reverse else keys > after_key
+            past |= (keys == after_key) & (self.id[rows] > after_id)
+            rows = rows[past]
+        remaining = len(rows)
+        end = min(offset + limit, remaining)
+        if offset >= end:
+            return total, []
+
+        ids = self.id[rows]
+        keys = sort_column[rows]
+        if reverse:
+            keys = -keys
+        if end < remaining:
+            # Only rows keyed at or below the end-th smallest key can be on
+            # the page; keeping every tie at the boundary keeps it stable
+            boundary = keys[np.argpartition(keys, end - 1)[end - 1]]
+            candidates = np.flatnonzero(keys <= boundary)
+            ids, keys = ids[candidates], keys[candidates]
+        order = np.lexsort((ids, keys))
+        return total, ids[order[offset:end]].tolist()
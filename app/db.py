@@ -1,15 +1,198 @@
 # app/db.py
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Set, Tuple
+from collections import Counter
+from itertools import islice
+import contextlib
 import datetime
+import glob
+import logging
+import marshal
+import os
+import re
+import string
+import threading
+from fastapi.concurrency import run_in_threadpool
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, the directory is not guarded
+    fcntl = None
+from app.columns import ENABLED as COLUMNS_ENABLED, ProductColumns
+from app.errors import DuplicateUserError, OrderConflictError
+from app.facets import FacetCounts
+from app.indexes import ProductIndex, is_past, top_k
+from app.journal import Journal, replay
+from app.planner import plan_for, query_shape
+from app.records import CartRecord, OrderTable, ProductRecord, decode_records, encode_records
+from app.search import SearchIndex
+from app.sessions import SessionStore
+from app.suggest import SuggestIndex
+from app.snapshot import Snapshot, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+# State is persisted under DATA_DIR as a snapshot plus a journal of the
+# mutations since. Set DATA_DIR to an empty string to run purely in memory.
+DATA_DIR = os.getenv("DATA_DIR", "data")
+JOURNAL_FLUSH_INTERVAL = float(os.getenv("JOURNAL_FLUSH_INTERVAL", "0.01"))
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "300"))
+
+TABLES = ("products", "users", "carts", "orders")
+COUNTERS = {
+    "products": "product_counter",
+    "users": "user_counter",
+    "carts": "cart_counter",
+    "orders": "order_counter",
+}
+
+# Attributes built on first use: a table restored from the snapshot, the
+# product indexes, NumPy mirror and suggest trie (built from the products
+# table), or the username and email lookups (built from the users table)
+LAZY_ATTRIBUTES = {
+    "products": "products",
+    "products_by_id": "products",
+    "users": "users",
+    "users_by_id": "users",
+    "carts": "carts",
+    "carts_by_id": "carts",
+    "orders": "orders",
+    "product_index": "product_indexes",
+    "search_index": "product_indexes",
+    "product_facets": "product_indexes",
+    "product_columns": "product_columns",
+    "suggest_index": "suggest_index",
+    "users_by_username": "user_keys",
+    "users_by_email": "user_keys",
+}
+
+# Tables held as slotted records; users stay plain dicts and orders are
+# stored column-wise (OrderTable)
+RECORD_TYPES = {
+    "products": ProductRecord,
+    "carts": CartRecord,
+}
+
+# Seed users' stored hash until app.auth gives them their password123 one.
+# Neither bcrypt nor a SHA-256 hex digest, so no password verifies against it.
+PLACEHOLDER_PASSWORD_HASH = "!"
+# The placeholder of earlier files: the bcrypt hash of "secret" from the
+# FastAPI docs, which would verify
+LEGACY_PLACEHOLDER_PASSWORD_HASH = "$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW"
+PLACEHOLDER_PASSWORD_HASHES = (PLACEHOLDER_PASSWORD_HASH, LEGACY_PLACEHOLDER_PASSWORD_HASH)
+
+SNAPSHOT_FILE = "snapshot.bin"
+LOCK_FILE = "LOCK"
+JOURNAL_FILE_RE = re.compile(r"journal\.(\d+)\.log$")
+
+
+# Emails are compared ignoring ASCII case, as SQLite's NOCASE collation does
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def _email_key(email: str) -> str:
+    return email.translate(ASCII_LOWER)
 
 
 # In-memory database
 class Database:
-    def __init__(self):
-        self.reset_database()
+    # Calls never block on I/O, so routers run them inline (see run_db)
+    blocking = False
+
+    def __init__(self, data_dir: Optional[str] = None):
+        self._lock = threading.RLock()
+        self._snapshot = None
+        self._stop = threading.Event()
+        # Held by a snapshot from encoding through the rename and journal
+        # cleanup, so two snapshots never share the temp file or rotate
+        # the journal under each other
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_thread: Optional[threading.Thread] = None
+        self._writes_since_snapshot = 0
+        # Open (and exclusively locked) while this store owns data_dir
+        self._dir_lock = None
+        self.data_dir = data_dir
+        self.generation = 0
+        # Bumped by every product write; cached catalog responses carry it
+        self.catalog_version = 0
+        self.journal = None
+        self.seeded = False
+        if data_dir:
+            self.open_storage(data_dir)
+        else:
+            self.reset_database()
+
+    def __getattr__(self, name):
+        group = LAZY_ATTRIBUTES.get(name)
+        if group is None:
+            raise AttributeError(name)
+        with self._lock:
+            if name not in self.__dict__:
+                if group == "product_indexes":
+                    self._index_products()
+                elif group == "product_columns":
+                    self.product_columns = ProductColumns(self.products) if COLUMNS_ENABLED else None
+                elif group == "suggest_index":
+                    self.suggest_index = SuggestIndex(self.products)
+                elif group == "user_keys":
+                    self._index_users()
+                else:
+                    self._load_table(group)
+        return self.__dict__[name]
+
+    def _load_table(self, table: str):
+        snapshot = self._snapshot
+        if snapshot is None:
+            raise AttributeError(table)
+        records = self._decode_table(table, snapshot.load(table))
+        setattr(self, table, records)
+        if table != "orders":
+            setattr(self, table + "_by_id", {r["id"]: r for r in records})
+        if all(t in self.__dict__ for t in TABLES):
+            snapshot.close()
+            self._snapshot = None
+
+    @staticmethod
+    def _encode_table(table: str, records) -> Any:
+        if table == "orders":
+            return records.dump()
+        if table in RECORD_TYPES:
+            return encode_records(records)
+        return records
+
+    @staticmethod
+    def _decode_table(table: str, data) -> Any:
+        if table == "orders":
+            return OrderTable.load(data)
+        if table in RECORD_TYPES:
+            return decode_records(RECORD_TYPES[table], data)
+        return data
+
+    def _index_users(self):
+        # Usernames match exactly, emails ignoring case. Data from before
+        # the keys were unique may still repeat one; the later user gets a
+        # renamed value, as the SQLite store's migration does.
+        self.users_by_username = {}
+        self.users_by_email = {}
+        for user in self.users:
+            for field, keys, key in self._user_keys(user):
+                if key in keys:
+                    renamed = f"{user[field]}~{user['id']}"
+                    logger.warning("User %s shares %s %r; renamed to %r", user["id"], field, user[field], renamed)
+                    user[field] = renamed
+                    self._log("update", "users", {field: renamed}, user["id"])
+            self._user_keys_add(user)
+
+    def _index_products(self):
+        # Secondary indexes for product filters and search, and facet counts
+        self.product_index = ProductIndex()
+        self.product_index.build(self.products)
+        self.search_index = SearchIndex()
+        self.search_index.build(self.products)
+        self.product_facets = FacetCounts()
+        self.product_facets.build(self.products)
 
     def reset_database(self):
-        self.products = [
+        self.seeded = True
+        products = [
             {
                 "id": 1,
                 "name": "iPhone 15",
@@ -82,7 +265,7 @@ class Database:
                 "id": 1,
                 "username": "john_doe",
                 "email": "john@example.com",
-                "hashed_password": "$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW",  # "password123"
+                "hashed_password": PLACEHOLDER_PASSWORD_HASH,
                 "role": "customer",
                 "is_active": True,
                 "created_at": "2024-01-01"
@@ -91,14 +274,14 @@ class Database:
                 "id": 2,
                 "username": "admin_user",
                 "email": "admin@example.com",
-                "hashed_password": "$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW",  # "password123"
+                "hashed_password": PLACEHOLDER_PASSWORD_HASH,
                 "role": "admin",
                 "is_active": True,
                 "created_at": "2024-01-01"
             }
         ]
 
-        self.carts = [
+        carts = [
             {
                 "id": 1,
                 "user_id": 1,
@@ -120,7 +303,7 @@ class Database:
             }
         ]
 
-        self.orders = [
+        orders = [
             {
                 "id": 1,
                 "user_id": 1,
@@ -140,11 +323,613 @@ class Database:
             }
         ]
 
+        self.products = [ProductRecord(**p) for p in products]
+        self.carts = [CartRecord(**c) for c in carts]
+        self.orders = OrderTable(orders)
+
+        # Primary-key indexes; the lists keep insertion order for listings.
+        # OrderTable keeps its own.
+        self.products_by_id = {p["id"]: p for p in self.products}
+        self.users_by_id = {u["id"]: u for u in self.users}
+        self.carts_by_id = {c["id"]: c for c in self.carts}
+        self.__dict__.pop("product_index", None)
+        self.__dict__.pop("search_index", None)
+        self.__dict__.pop("product_facets", None)
+        self.__dict__.pop("product_columns", None)
+        self.__dict__.pop("suggest_index", None)
+        self.__dict__.pop("users_by_username", None)
+        self.__dict__.pop("users_by_email", None)
+
         self.product_counter = len(self.products)
         self.user_counter = len(self.users)
         self.cart_counter = len(self.carts)
         self.order_counter = len(self.orders)
 
+    def open_storage(self, data_dir: str):
+        """Restore state from `data_dir` and journal new mutations there.
+
+        The snapshot is only memory-mapped here; its tables are decoded when
+        first touched, so startup time does not grow with the dataset.
+        Journals from the snapshot's generation onwards are replayed on top,
+        before any product index exists, so replay is a plain list/dict apply.
+        """
+        os.makedirs(data_dir, exist_ok=True)
+        self._dir_lock = _lock_data_dir(data_dir)
+        snapshot_path = os.path.join(data_dir, SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            self._snapshot = Snapshot(snapshot_path)
+            self.generation = self._snapshot.meta["generation"]
+            for table, counter in COUNTERS.items():
+                setattr(self, counter, self._snapshot.meta["counters"][table])
+        else:
+            self.reset_database()
+
+        journals = self._journal_files()
+        for generation, path in journals:
+            if generation < self.generation:
+                # Already folded into the snapshot
+                os.remove(path)
+                continue
+            for record in replay(path):
+                self._writes_since_snapshot += 1
+                table = record["table"]
+                if record["op"] == "insert":
+                    data = record["data"]
+                    if table == "orders":
+                        self.orders.append(data)
+                    else:
+                        if table in RECORD_TYPES:
+                            data = RECORD_TYPES[table](**data)
+                        getattr(self, table).append(data)
+                        getattr(self, table + "_by_id")[data["id"]] = data
+                    counter = COUNTERS[table]
+                    setattr(self, counter, max(getattr(self, counter), data["id"]))
+                elif table == "orders":
+                    # Older journals may hold a null status; no order field is nullable
+                    changes = {k: v for k, v in record["data"].items() if v is not None}
+                    self.orders.update(record["id"], changes)
+                else:
+                    getattr(self, table + "_by_id")[record["id"]].update(record["data"])
+
+        active = max([self.generation] + [generation for generation, _ in journals])
+        self.journal = Journal(self._journal_path(active), flush_interval=JOURNAL_FLUSH_INTERVAL)
+
+        if SNAPSHOT_INTERVAL > 0:
+            self._snapshot_thread = threading.Thread(target=self._snapshot_loop, name="db-snapshot", daemon=True)
+            self._snapshot_thread.start()
+
+    def save_snapshot(self):
+        """Write a snapshot of every table and drop the journals it covers."""
+        with self._snapshot_lock:
+            if self.journal is None:
+                return
+            with self._lock:
+                tables = {}
+                for table in TABLES:
+                    if table in self.__dict__:
+                        tables[table] = marshal.dumps(self._encode_table(table, self.__dict__[table]))
+                    else:
+                        # Never loaded - reuse the encoded table as is
+                        tables[table] = self._snapshot.raw(table)
+                self.generation += 1
+                self.journal.rotate(self._journal_path(self.generation))
+                self._writes_since_snapshot = 0
+                meta = {
+                    "generation": self.generation,
+                    "counters": {table: getattr(self, counter) for table, counter in COUNTERS.items()},
+                }
+
+            # Writes go on meanwhile, into the new journal
+            write_snapshot(os.path.join(self.data_dir, SNAPSHOT_FILE), tables, meta)
+            for generation, path in self._journal_files():
+                if generation < meta["generation"]:
+                    os.remove(path)
+
+    def close(self):
+        self._stop.set()
+        # Let a periodic snapshot in progress finish before the last one
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+            self._snapshot_thread = None
+        if self.journal is not None:
+            if self._writes_since_snapshot:
+                self.save_snapshot()
+            self.journal.close()
+            self.journal = None
+        if self._dir_lock is not None:
+            self._dir_lock.close()
+            self._dir_lock = None
+
+    def open_sessions(self, access_ttl: float) -> SessionStore:
+        # Sessions are not journaled: a restart signs everyone out
+        return SessionStore(access_ttl)
+
+    def _snapshot_loop(self):
+        while not self._stop.wait(SNAPSHOT_INTERVAL):
+            if not self._writes_since_snapshot:
+                continue
+            try:
+                self.save_snapshot()
+            except Exception:
+                logger.exception("Snapshot failed")
+
+    def _journal_path(self, generation: int) -> str:
+        return os.path.join(self.data_dir, f"journal.{generation}.log")
+
+    def _journal_files(self) -> List[Tuple[int, str]]:
+        files = []
+        for path in glob.glob(os.path.join(self.data_dir, "journal.*.log")):
+            match = JOURNAL_FILE_RE.search(os.path.basename(path))
+            if match:
+                files.append((int(match.group(1)), path))
+        return sorted(files)
+
+    def _log(self, op: str, table: str, data: Dict[str, Any], record_id: Optional[int] = None):
+        if self.journal is None:
+            return
+        record = {"op": op, "table": table, "data": data}
+        if record_id is not None:
+            record["id"] = record_id
+        self.journal.append(record)
+        self._writes_since_snapshot += 1
+
+    # Products
+    def get_product(self, product_id: int) -> Optional[Dict[str, Any]]:
+        return self.products_by_id.get(product_id)
+
+    def get_products(self, product_ids: List[int]) -> List[Optional[Dict[str, Any]]]:
+        """Products for `product_ids` in the same order, None where an id is unknown."""
+        products_by_id = self.products_by_id
+        return [products_by_id.get(product_id) for product_id in product_ids]
+
+    def export_products(self, after_id: int = 0, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Up to `limit` products with ids past `after_id`, active or not, in id order."""
+        walk = self.product_index.sorted["id"].walk(after=(after_id, after_id))
+        products_by_id = self.products_by_id
+        return [products_by_id[product_id] for product_id in islice(walk, limit)]
+
+    def add_product(self, product: Dict[str, Any]) -> Dict[str, Any]:
+        product = ProductRecord.coerce(product)
+        with self._lock:
+            # Fetch the indexes first: a lazy build must not see the new product
+            product_index, search_index = self.product_index, self.search_index
+            product_facets, product_columns = self.product_facets, self.product_columns
+            self.products.append(product)
+            self.products_by_id[product["id"]] = product
+            product_index.add(product)
+            search_index.add(product)
+            product_facets.add(product)
+            if product_columns is not None:
+                product_columns.add(product)
+            self._suggest_add([product])
+            self.catalog_version += 1
+            self._log("insert", "products", product.to_dict())
+            return product
+
+    def import_products(self, products: List[Dict[str, Any]]) -> List[Tuple[int, bool]]:
+        """Upsert a batch of products. Returns (id, created) per product, in order.
+
+        A product whose id exists replaces that product's fields; one
+        without an id, or with an unknown one, is inserted. Inserts reach
+        the indexes as one bulk update per batch.
+        """
+        results = []
+        with self._lock:
+            pending: Dict[int, ProductRecord] = {}
+            for fields in products:
+                product_id = fields.get("id")
+                if product_id in pending:
+                    # Repeated within the batch: index what came before first
+                    self._add_products(list(pending.values()))
+                    pending = {}
+                if product_id is not None and product_id in self.products_by_id:
+                    changes = {k: v for k, v in fields.items() if k not in ("id", "createdAt")}
+                    self.update_product(product_id, changes)
+                    results.append((product_id, False))
+                    continue
+                if product_id is None:
+                    product_id = self.get_next_product_id()
+                else:
+                    self.product_counter = max(self.product_counter, product_id)
+                pending[product_id] = ProductRecord(**{**fields, "id": product_id})
+                results.append((product_id, True))
+            self._add_products(list(pending.values()))
+        return results
+
+    def _add_products(self, products: List[ProductRecord]):
+        if not products:
+            return
+        # Fetch the indexes first: a lazy build must not see the new products
+        product_index, search_index = self.product_index, self.search_index
+        product_facets, product_columns = self.product_facets, self.product_columns
+        self.products.extend(products)
+        products_by_id = self.products_by_id
+        for product in products:
+            products_by_id[product["id"]] = product
+            product_facets.add(product)
+            if product_columns is not None:
+                product_columns.add(product)
+            self._log("insert", "products", product.to_dict())
+        product_index.add_many(products)
+        search_index.add_many(products)
+        self._suggest_add(products)
+        self.catalog_version += 1
+
+    def update_product(self, product_id: int, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            product = self.products_by_id.get(product_id)
+            if product is None:
+                return None
+            # A null name, price, rating... would not sort or index
+            changes = ProductRecord.drop_nulls(changes)
+            if not changes:
+                return product
+            # (remove, add) for every index built from a changed field
+            indexes = []
+            if any(field in changes for field in ProductIndex.FIELDS):
+                indexes.append((self.product_index.remove, self.product_index.add))
+            if any(field in changes for field in SearchIndex.FIELDS):
+                search_index = self.search_index
+                indexes.append((lambda p: search_index.remove(p["id"]), search_index.add))
+            if any(field in changes for field in FacetCounts.FIELDS):
+                indexes.append((self.product_facets.remove, self.product_facets.add))
+            # The trie is kept up to date only once something has asked for it
+            suggest_index = self.__dict__.get("suggest_index")
+            if suggest_index is not None and any(field in changes for field in SuggestIndex.FIELDS):
+                indexes.append((lambda p: suggest_index.remove(p["id"]), suggest_index.add))
+            for remove, _ in indexes:
+                remove(product)
+            previous = {field: product[field] for field in changes}
+            product.update(changes)
+            added = 0
+            try:
+                for _, add in indexes:
+                    add(product)
+                    added += 1
+            except Exception:
+                # Put the product back as it was, in every index
+                for remove, _ in indexes[:added]:
+                    remove(product)
+                with contextlib.suppress(Exception):
+                    indexes[added][0](product)  # whatever the failed add did
+                product.update(previous)
+                for _, add in indexes:
+                    add(product)
+                raise
+            if self.product_columns is not None and any(field in changes for field in ProductColumns.FIELDS):
+                self.product_columns.update(product)
+            self.catalog_version += 1
+            self._log("update", "products", changes, product_id)
+            return product
+
+    def query_products(
+        self,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        tag: Optional[str] = None,
+        search: Optional[str] = None,
+        is_active: Optional[bool] = True,
+        sort_by: str = "id",
+        sort_order: str = "asc",
+        offset: int = 0,
+        limit: int = 10,
+        after: Optional[Tuple[Any, int]] = None
+    ) -> Tuple[int, List[Dict[str, Any]], Optional[Tuple[Any, int]]]:
+        """Filter, sort and paginate products. Returns (total, page, next).
+
+        sort_by="relevance" ranks `search` matches by BM25 score, best first.
+        `after` is a keyset cursor, the (sort key, id) of the last product
+        already seen: the page starts just past it instead of at `offset`
+        matches. `next` is the cursor for the following page, or None on
+        the last one.
+        """
+        index = self.product_index
+        product_columns = self.product_columns
+        relevance = search and sort_by == "relevance"
+        reverse = sort_order.lower() == "desc"
+
+        # Numeric sorts filtered by category or price run on the NumPy
+        # mirror: those (and active status) become vectorized masks, tag
+        # and text matches a row set. The mirror scans every row, so
+        # unfiltered listings and cursor pages walk the sorted index instead.
+        narrowed = category or min_price is not None or max_price is not None
+        if (
+            product_columns is not None and narrowed and after is None
+            and not relevance and sort_by in ProductColumns.SORT_KEYS
+        ):
+            within = index.lookup(tag=tag)
+            if search:
+                within = self.search_index.match(search, within=within)
+            total, page = product_columns.query(
+                category=category,
+                min_price=min_price,
+                max_price=max_price,
+                is_active=is_active,
+                within=within,
+                sort_by=sort_by,
+                reverse=reverse,
+                offset=offset,
+                limit=limit + 1,
+                after=after
+            )
+            return self._product_page(total, page, limit, index.sort_index(sort_by).key_of)
+
+        ids = self._matching_ids(category, min_price, max_price, tag, search, is_active)
+        total = len(index.ids) if ids is None else len(ids)
+        # One extra id tells whether another page follows
+        if relevance:
+            scores = self.search_index.scores(search, ids)
+            ranks = {product_id: -score for product_id, score in scores.items()}
+            ranked = ranks if after is None else [i for i in ranks if (ranks[i], i) > after]
+            page = top_k(ranked, ranks.__getitem__, offset + limit + 1)[offset:]
+            return self._product_page(total, page, limit, ranks)
+        page = index.page(ids, sort_by, reverse, offset, limit + 1, after)
+        return self._product_page(total, page, limit, index.sort_index(sort_by).key_of)
+
+    def _matching_ids(
+        self,
+        category: Optional[str],
+        min_price: Optional[float],
+        max_price: Optional[float],
+        tag: Optional[str],
+        search: Optional[str],
+        is_active: Optional[bool]
+    ) -> Optional[Set[int]]:
+        """Ids of the products passing the filters, or None for every product."""
+        plan = plan_for(query_shape(category, min_price, max_price, tag, search, is_active))
+        return plan.run(self.product_index, self.search_index, category, min_price, max_price, tag, search)
+
+    def query_facets(
+        self,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        tag: Optional[str] = None,
+        search: Optional[str] = None,
+        is_active: Optional[bool] = True
+    ) -> Dict[str, Any]:
+        """Category, tag and price-bucket counts of the products query_products would match."""
+        facets = self.product_facets
+        if is_active is True and not (category or tag or search) and min_price is None and max_price is None:
+            return facets.as_response()
+        ids = self._matching_ids(category, min_price, max_price, tag, search, is_active)
+        if ids is None:
+            return facets.count(self.products)
+        products_by_id = self.products_by_id
+        return facets.count(products_by_id[product_id] for product_id in ids)
+
+    def _product_page(self, total: int, page: List[int], limit: int, key_of: Dict[int, Any]):
+        """(total, products, next cursor) from up to limit + 1 page ids."""
+        next_after = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_after = (key_of[page[-1]], page[-1])
+        return total, [self.products_by_id[product_id] for product_id in page], next_after
+
+    def list_categories(self) -> List[str]:
+        return list(self.product_facets.categories)
+
+    def suggest_products(self, query: str, limit: int = 10, fuzzy: bool = True) -> List[Dict[str, Any]]:
+        return self.suggest_index.suggest(query, limit, fuzzy)
+
+    def _suggest_add(self, products: List[ProductRecord]):
+        # Only a trie that exists is kept up to date; a later build sees
+        # the products anyway
+        suggest_index = self.__dict__.get("suggest_index")
+        if suggest_index is not None:
+            for product in products:
+                suggest_index.add(product)
+
+    # Users
+    def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return self.users_by_id.get(user_id)
+
+    def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
+        return self.users_by_username.get(username)
+
+    def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        """The user registered with `email`, compared ignoring case."""
+        return self.users_by_email.get(_email_key(email))
+
+    def query_users(
+        self,
+        role: Optional[str] = None,
+        is_active: Optional[bool] = None,
+        skip: int = 0,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        users = self.users
+        if role:
+            users = [u for u in users if u["role"] == role]
+        if is_active is not None:
+            users = [u for u in users if u["is_active"] == is_active]
+        return users[skip:skip + limit]
+
+    def add_user(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        """Insert a user; raises DuplicateUserError if its username or email is taken."""
+        with self._lock:
+            self._check_user_keys(user)
+            self.users.append(user)
+            self.users_by_id[user["id"]] = user
+            self._user_keys_add(user)
+            self._log("insert", "users", user)
+            return user
+
+    def update_user(self, user_id: int, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Update a user; raises DuplicateUserError if a new username or email is taken."""
+        with self._lock:
+            user = self.users_by_id.get(user_id)
+            if user is None:
+                return None
+            rekey = "username" in changes or "email" in changes
+            if rekey:
+                self._check_user_keys({**user, **changes}, user)
+                self._user_keys_remove(user)
+            user.update(changes)
+            if rekey:
+                self._user_keys_add(user)
+            self._log("update", "users", changes, user_id)
+            return user
+
+    def _user_keys(self, user: Dict[str, Any]):
+        return (
+            ("username", self.users_by_username, user["username"]),
+            ("email", self.users_by_email, _email_key(user["email"])),
+        )
+
+    def _check_user_keys(self, user: Dict[str, Any], current: Optional[Dict[str, Any]] = None):
+        for field, keys, key in self._user_keys(user):
+            holder = keys.get(key)
+            if holder is not None and holder is not current:
+                raise DuplicateUserError(field)
+
+    def _user_keys_add(self, user: Dict[str, Any]):
+        for _, keys, key in self._user_keys(user):
+            keys[key] = user
+
+    def _user_keys_remove(self, user: Dict[str, Any]):
+        for _, keys, key in self._user_keys(user):
+            if keys.get(key) is user:
+                del keys[key]
+
+    # Carts
+    def get_cart(self, cart_id: int) -> Optional[Dict[str, Any]]:
+        return self.carts_by_id.get(cart_id)
+
+    def get_user_carts(self, user_id: int) -> List[Dict[str, Any]]:
+        return [c for c in self.carts if c["user_id"] == user_id]
+
+    def add_cart(self, cart: Dict[str, Any]) -> Dict[str, Any]:
+        cart = CartRecord.coerce(cart)
+        with self._lock:
+            self.carts.append(cart)
+            self.carts_by_id[cart["id"]] = cart
+            self._log("insert", "carts", cart.to_dict())
+            return cart
+
+    def update_cart(self, cart_id: int, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cart = self.carts_by_id.get(cart_id)
+            if cart is None:
+                return None
+            cart.update(changes)
+            self._log("update", "carts", changes, cart_id)
+            return cart
+
+    # Orders
+    def get_order(self, order_id: int) -> Optional[Dict[str, Any]]:
+        return self.orders.get(order_id)
+
+    def query_orders(
+        self,
+        user_id: Optional[int] = None,
+        status: Optional[str] = None,
+        sort_by: str = "created_at",
+        sort_order: str = "desc",
+        offset: int = 0,
+        limit: int = 10,
+        after: Optional[Tuple[Any, int]] = None
+    ) -> Tuple[int, List[Dict[str, Any]], Optional[Tuple[Any, int]]]:
+        """Orders (all, or one user's) filtered by status. Returns (total, page, next).
+
+        Equal sort keys are ordered by id. `after` and `next` are keyset
+        cursors as in query_products. Listing every order walks a sorted
+        row array, so deep pages and cursors cost a bisection rather than a
+        sort; a single user's orders are filtered and sorted directly.
+        Only the orders on the page are built as dicts.
+        """
+        orders = self.orders
+        columns = orders.columns
+        reverse = sort_order.lower() == "desc"
+        if sort_by not in columns:
+            # Unknown sort keys compare equal, leaving insertion (id) order
+            sort_by, reverse = "id", False
+        statuses = columns["status"]
+
+        # One extra row tells whether another page follows
+        if user_id is None:
+            total = statuses.count(status) if status else len(orders)
+            rows = orders.walk(sort_by, reverse, after)
+            if status:
+                rows = (p for p in rows if statuses[p] == status)
+            page = list(islice(rows, offset, offset + limit + 1))
+        else:
+            rows = [p for p, owner in enumerate(columns["user_id"]) if owner == user_id]
+            if status:
+                rows = [p for p in rows if statuses[p] == status]
+            total = len(rows)
+            keys, ids = columns[sort_by], columns["id"]
+            if after is not None:
+                rows = [p for p in rows if is_past(keys[p], ids[p], after, reverse)]
+            page = top_k(rows, keys.__getitem__, offset + limit + 1, reverse, tie=ids.__getitem__)[offset:]
+
+        next_after = None
+        if len(page) > limit:
+            page = page[:limit]
+            last = page[-1]
+            next_after = (columns[sort_by][last], columns["id"][last])
+        return total, [orders.row(p) for p in page], next_after
+
+    def export_orders(self, after_id: int = 0, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Up to `limit` orders with ids past `after_id`, in id order."""
+        orders = self.orders
+        return [orders.row(p) for p in islice(orders.walk("id", False, (after_id, after_id)), limit)]
+
+    def order_stats(self) -> Dict[str, Any]:
+        columns = self.orders.columns
+        return {
+            "total_orders": len(self.orders),
+            "total_revenue": sum(columns["total"]),
+            "status_counts": dict(Counter(columns["status"]))
+        }
+
+    def add_order(self, order: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self.orders.append(order)
+            self._log("insert", "orders", order)
+            return order
+
+    def place_order(self, order: Dict[str, Any]) -> Dict[str, Any]:
+        """Check out an order's cart in one step under the store lock.
+
+        Takes each item's quantity off its product's stock and prices it at
+        the product's current price (items of unknown products keep the
+        cart's), marks the cart completed and adds the order. Raises
+        OrderConflictError, changing nothing, if the cart is not active or
+        a product is short of stock.
+        """
+        with self._lock:
+            cart = self.carts_by_id.get(order["cart_id"])
+            if cart is None or cart["status"] != "active":
+                raise OrderConflictError("Cart is not active")
+            products_by_id = self.products_by_id
+            needed = Counter()
+            for item in order["items"]:
+                needed[item["product_id"]] += item["quantity"]
+            for product_id, quantity in needed.items():
+                product = products_by_id.get(product_id)
+                if product is not None and product["stock"] < quantity:
+                    raise OrderConflictError(f"Insufficient stock for product {product['name']}")
+            for item in order["items"]:
+                product = products_by_id.get(item["product_id"])
+                if product is not None:
+                    item["price_at_purchase"] = product["price"]
+            for product_id, quantity in needed.items():
+                product = products_by_id.get(product_id)
+                if product is not None:
+                    self.update_product(product_id, {"stock": product["stock"] - quantity})
+            self.update_cart(cart["id"], {"status": "completed"})
+            return self.add_order(order)
+
+    def update_order(self, order_id: int, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            order = self.orders.update(order_id, changes)
+            if order is None:
+                return None
+            self._log("update", "orders", changes, order_id)
+            return order
+
     def get_next_product_id(self):
         self.product_counter += 1
         return self.product_counter
@@ -161,5 +946,45 @@ class Database:
         self.order_counter += 1
         return self.order_counter
 
+    def get_catalog_version(self) -> int:
+        return self.catalog_version
+
+
+def _lock_data_dir(data_dir: str):
+    """Lock `data_dir` for this process; the lock lasts while the file is open.
+
+    Two processes on one directory would interleave their journals and
+    overwrite each other's snapshots.
+    """
+    lock_file = open(os.path.join(data_dir, LOCK_FILE), "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise RuntimeError(
+                f"DATA_DIR {data_dir!r} is in use by another process. Give each process "
+                "its own directory; several workers need DATABASE_BACKEND=sqlite"
+            ) from None
+    return lock_file
+
+
+def create_database():
+    """Build the store selected by DATABASE_BACKEND ("memory" or "sqlite")."""
+    backend = os.getenv("DATABASE_BACKEND", "memory")
+    if backend == "sqlite":
+        from app.db_production import SQLiteDatabase
+        return SQLiteDatabase(os.getenv("SQLITE_PATH", os.path.join(DATA_DIR or ".", "ecommerce.db")))
+    if backend != "memory":
+        raise ValueError(f"Unknown DATABASE_BACKEND {backend!r}")
+    return Database(DATA_DIR)
+
+
+async def run_db(func, *args, **kwargs):
+    """Call a store method, off the event loop when the backend blocks on I/O."""
+    if db.blocking:
+        return await run_in_threadpool(func, *args, **kwargs)
+    return func(*args, **kwargs)
+
 
-db = Database()
\ No newline at end of file
+db = create_database()
\ No newline at end of file
@@ -1,42 +1,1064 @@
 """
 Database configuration for production
-Uses PostgreSQL if available, falls back to in-memory
+SQLite storage backend, selected with DATABASE_BACKEND=sqlite
+
+Implements the same operations as the in-memory app.db.Database, so the
+routers work unchanged. Data lives on disk, so the dataset can outgrow
+RAM and several worker processes can share one file (WAL mode).
 """
+import hmac
+import json
+import logging
 import os
-from typing import Dict, List, Any
-import datetime
-
-class Database:
-    def __init__(self):
-        self.reset_database()
-    
-    def reset_database(self):
-        # Same as before but we'll add PostgreSQL later
-        self.products = [
-            {
-                "id": 1,
-                "name": "iPhone 15",
-                "price": 999,
-                "category": "electronics",
-                "stock": 50,
-                "description": "Latest iPhone with A16 chip",
-                "imageUrl": "https://example.com/iphone.jpg",
-                "isActive": True,
-                "tags": ["smartphone", "apple", "premium"],
-                "rating": 4.8,
-                "createdAt": "2024-01-15"
-            },
-            # ... other products
-        ]
-        
-        # Initialize counters
-        self.product_counter = len(self.products)
-        self.user_counter = len(self.users)
-        self.cart_counter = len(self.carts)
-        self.order_counter = len(self.orders)
-    
+import queue
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from app.errors import DuplicateUserError, OrderConflictError
+from app.facets import FACET_PRICE_BUCKETS, facet_response
+from app.records import ProductRecord
+from app.search import tokenize
+from app.sessions import REFRESH_TOKEN_TTL, SESSION_SWEEP_INTERVAL, _digest
+from app.suggest import SuggestIndex
+
+logger = logging.getLogger(__name__)
+
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+SQLITE_POOL_TIMEOUT = float(os.getenv("SQLITE_POOL_TIMEOUT", "30"))
+
+# Seconds a worker's suggest trie is used before checking the catalog
+# version; writes (from any worker) show up in suggestions after this
+SUGGEST_REFRESH_INTERVAL = float(os.getenv("SUGGEST_REFRESH_INTERVAL", "5"))
+
+# Seconds between a worker's checks for sessions revoked by other workers;
+# their access tokens keep working here for up to this long
+SESSION_POLL_INTERVAL = float(os.getenv("SESSION_POLL_INTERVAL", "1"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    price NUMERIC NOT NULL,
+    category TEXT NOT NULL,
+    stock INTEGER NOT NULL,
+    description TEXT,
+    imageUrl TEXT,
+    isActive INTEGER NOT NULL,
+    tags TEXT NOT NULL,
+    rating NUMERIC NOT NULL,
+    createdAt TEXT NOT NULL,
+    name_lower TEXT NOT NULL,
+    category_lower TEXT NOT NULL,
+    search_text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS products_category ON products (category_lower, isActive);
+CREATE INDEX IF NOT EXISTS products_price ON products (isActive, price);
+CREATE INDEX IF NOT EXISTS products_rating ON products (isActive, rating);
+CREATE INDEX IF NOT EXISTS products_name ON products (isActive, name_lower);
+
+CREATE TABLE IF NOT EXISTS product_tags (
+    tag TEXT NOT NULL,
+    product_id INTEGER NOT NULL,
+    PRIMARY KEY (tag, product_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS product_tags_product ON product_tags (product_id);
+
+-- Trigram index so search terms match inside words, like the in-memory index
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(search_text, tokenize='trigram');
+
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    email TEXT NOT NULL,
+    hashed_password TEXT NOT NULL,
+    role TEXT NOT NULL,
+    is_active INTEGER NOT NULL,
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS carts (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    items TEXT NOT NULL,
+    total_amount NUMERIC NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS carts_user ON carts (user_id);
+
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    cart_id INTEGER NOT NULL,
+    items TEXT NOT NULL,
+    total NUMERIC NOT NULL,
+    status TEXT NOT NULL,
+    shipping_address TEXT NOT NULL,
+    payment_method TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_user ON orders (user_id);
+CREATE INDEX IF NOT EXISTS orders_status ON orders (status);
+
+-- Running counts of active products per category and tag ('total' counts
+-- them all), kept by the triggers below as products and tags change
+CREATE TABLE IF NOT EXISTS facet_counts (
+    facet TEXT NOT NULL,
+    value TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (facet, value)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS products_facets_insert AFTER INSERT ON products WHEN new.isActive
+BEGIN
+    INSERT INTO facet_counts (facet, value, count) VALUES ('total', '', 1), ('category', new.category, 1)
+        ON CONFLICT (facet, value) DO UPDATE SET count = count + excluded.count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS products_facets_update AFTER UPDATE OF category, isActive ON products
+BEGIN
+    INSERT INTO facet_counts (facet, value, count)
+        SELECT 'total', '', new.isActive - old.isActive WHERE new.isActive != old.isActive
+        ON CONFLICT (facet, value) DO UPDATE SET count = count + excluded.count;
+    INSERT INTO facet_counts (facet, value, count)
+        SELECT 'category', old.category, -1 WHERE old.isActive
+        ON CONFLICT (facet, value) DO UPDATE SET count = count + excluded.count;
+    INSERT INTO facet_counts (facet, value, count)
+        SELECT 'category', new.category, 1 WHERE new.isActive
+        ON CONFLICT (facet, value) DO UPDATE SET count = count + excluded.count;
+    INSERT INTO facet_counts (facet, value, count)
+        SELECT 'tag', tag, new.isActive - old.isActive FROM product_tags
+        WHERE product_id = new.id AND new.isActive != old.isActive
+        ON CONFLICT (facet, value) DO UPDATE SET count = count + excluded.count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS product_tags_facets_insert AFTER INSERT ON product_tags
+BEGIN
+    INSERT INTO facet_counts (facet, value, count)
+        SELECT 'tag', new.tag, 1 FROM products WHERE id = new.product_id AND isActive
+        ON CONFLICT (facet, value) DO UPDATE SET count = count + excluded.count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS product_tags_facets_delete AFTER DELETE ON product_tags
+BEGIN
+    INSERT INTO facet_counts (facet, value, count)
+        SELECT 'tag', old.tag, -1 FROM products WHERE id = old.product_id AND isActive
+        ON CONFLICT (facet, value) DO UPDATE SET count = count + excluded.count;
+END;
+
+-- Id allocation, shared by every process using the file
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+
+-- Refresh-token sessions (see app/sessions.py), shared by every worker
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    digest BLOB NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_user ON sessions (user_id);
+CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires);
+
+-- Revoked session ids, until the last access token issued for each expires.
+-- Workers poll for rows past the last seq they have seen.
+CREATE TABLE IF NOT EXISTS revoked_sessions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    user_id INTEGER NOT NULL,
+    until REAL NOT NULL
+);
+
+-- Users whose every session was revoked: access tokens issued before
+-- `before` are refused until `until`, when the last of them expires
+CREATE TABLE IF NOT EXISTS revoked_users (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL UNIQUE,
+    before REAL NOT NULL,
+    until REAL NOT NULL
+);
+"""
+
+PRODUCT_COLUMNS = (
+    "id", "name", "price", "category", "stock", "description",
+    "imageUrl", "isActive", "tags", "rating", "createdAt"
+)
+USER_COLUMNS = ("id", "username", "email", "hashed_password", "role", "is_active", "created_at")
+CART_COLUMNS = ("id", "user_id", "items", "total_amount", "status", "created_at")
+ORDER_COLUMNS = (
+    "id", "user_id", "cart_id", "items", "total", "status",
+    "shipping_address", "payment_method", "created_at"
+)
+
+# Statements are constant strings so every pooled connection reuses its
+# prepared copy from the sqlite3 statement cache
+SELECT_PRODUCT_COLUMNS = f"SELECT {', '.join('p.' + c for c in PRODUCT_COLUMNS)}"
+SELECT_PRODUCT = SELECT_PRODUCT_COLUMNS + " FROM products p"
+INSERT_PRODUCT = f"""INSERT INTO products ({', '.join(PRODUCT_COLUMNS)}, name_lower, category_lower, search_text)
+    VALUES ({', '.join('?' * (len(PRODUCT_COLUMNS) + 3))})"""
+UPDATE_PRODUCT = f"""UPDATE products SET {', '.join(c + ' = ?' for c in PRODUCT_COLUMNS[1:])},
+    name_lower = ?, category_lower = ?, search_text = ? WHERE id = ?"""
+
+# Unique user keys: usernames exactly, emails ignoring case. Files from
+# before these replaced plain indexes go through _migrate_user_keys first.
+USER_KEY_INDEXES = (
+    ("username", "users_username_key", ""),
+    ("email", "users_email_key", " COLLATE NOCASE"),
+)
+
+SELECT_USER = f"SELECT {', '.join(USER_COLUMNS)} FROM users"
+INSERT_USER = f"INSERT INTO users ({', '.join(USER_COLUMNS)}) VALUES ({', '.join('?' * len(USER_COLUMNS))})"
+UPDATE_USER = f"UPDATE users SET {', '.join(c + ' = ?' for c in USER_COLUMNS[1:])} WHERE id = ?"
+
+SELECT_CART = f"SELECT {', '.join(CART_COLUMNS)} FROM carts"
+INSERT_CART = f"INSERT INTO carts ({', '.join(CART_COLUMNS)}) VALUES ({', '.join('?' * len(CART_COLUMNS))})"
+UPDATE_CART = f"UPDATE carts SET {', '.join(c + ' = ?' for c in CART_COLUMNS[1:])} WHERE id = ?"
+
+SELECT_ORDER_COLUMNS = f"SELECT {', '.join(ORDER_COLUMNS)}"
+SELECT_ORDER = SELECT_ORDER_COLUMNS + " FROM orders"
+INSERT_ORDER = f"INSERT INTO orders ({', '.join(ORDER_COLUMNS)}) VALUES ({', '.join('?' * len(ORDER_COLUMNS))})"
+UPDATE_ORDER = f"UPDATE orders SET {', '.join(c + ' = ?' for c in ORDER_COLUMNS[1:])} WHERE id = ?"
+
+NEXT_ID = "UPDATE counters SET value = value + 1 WHERE name = ? RETURNING value"
+# Keep the counter past ids that were given explicitly
+RAISE_ID = "UPDATE counters SET value = MAX(value, ?) WHERE name = ?"
+# Catalog version: bumped by every product write, in the same transaction
+BUMP_CATALOG_VERSION = "UPDATE counters SET value = value + 1 WHERE name = 'catalog'"
+
+# Counts for files written before facet_counts existed
+REBUILD_FACET_COUNTS = """INSERT INTO facet_counts (facet, value, count)
+    SELECT 'total', '', COUNT(*) FROM products WHERE isActive
+    UNION ALL SELECT 'category', category, COUNT(*) FROM products WHERE isActive GROUP BY category
+    UNION ALL SELECT 'tag', t.tag, COUNT(*) FROM product_tags t JOIN products p ON p.id = t.product_id
+        WHERE p.isActive GROUP BY t.tag"""
+
+# Bucket number of p.price, matching app.facets.price_bucket
+PRICE_BUCKET = "CASE " + " ".join(
+    f"WHEN p.price >= {FACET_PRICE_BUCKETS[i]!r} THEN {i}" for i in range(len(FACET_PRICE_BUCKETS) - 1, 0, -1)
+) + " ELSE 0 END"
+
+PRODUCT_SORT_COLUMNS = {"price": "p.price", "rating": "p.rating", "name": "p.name_lower"}
+ORDER_SORT_COLUMNS = set(ORDER_COLUMNS) - {"items"}
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections shared by the threadpool workers."""
+
+    def __init__(self, path: str, size: int = SQLITE_POOL_SIZE, timeout: float = SQLITE_POOL_TIMEOUT):
+        self.timeout = timeout
+        self._connections = queue.LifoQueue(maxsize=size)
+        for _ in range(size):
+            self._connections.put(self._connect(path))
+
+    def _connect(self, path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            isolation_level=None,  # transactions are explicit, see transaction()
+            cached_statements=256
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        try:
+            conn = self._connections.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RuntimeError("Timed out waiting for a database connection")
+        try:
+            yield conn
+        finally:
+            self._connections.put(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        # IMMEDIATE takes the write lock up front, so concurrent writers
+        # queue on busy_timeout instead of failing a read-to-write upgrade
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self):
+        while not self._connections.empty():
+            self._connections.get_nowait().close()
+
+
+def _search_text(product: Dict[str, Any]) -> str:
+    parts = [product["name"], product.get("description") or ""] + list(product.get("tags", []))
+    return "\n".join(parts).lower()
+
+
+def _product_params(product: Dict[str, Any]) -> Tuple:
+    return (
+        product["name"], product["price"], product["category"], product["stock"],
+        product.get("description"), product.get("imageUrl"), int(product["isActive"]),
+        json.dumps(product.get("tags", [])), product.get("rating", 0), product["createdAt"],
+        product["name"].lower(), product["category"].lower(), _search_text(product)
+    )
+
+
+def _product(row: sqlite3.Row) -> Dict[str, Any]:
+    product = dict(row)
+    product.pop("sort_key", None)
+    product["isActive"] = bool(product["isActive"])
+    product["tags"] = json.loads(product["tags"])
+    return product
+
+
+@contextmanager
+def _user_keys_guard() -> Iterator[None]:
+    # A write hitting a unique user index, as DuplicateUserError
+    try:
+        yield
+    except sqlite3.IntegrityError as e:
+        for column, _, _ in USER_KEY_INDEXES:
+            if f"users.{column}" in str(e):
+                raise DuplicateUserError(column) from e
+        raise
+
+
+def _user(row: sqlite3.Row) -> Dict[str, Any]:
+    user = dict(row)
+    user["is_active"] = bool(user["is_active"])
+    return user
+
+
+def _with_items(row: sqlite3.Row) -> Dict[str, Any]:
+    record = dict(row)
+    record.pop("sort_key", None)
+    record["items"] = json.loads(record["items"])
+    return record
+
+
+def _keyset(clause: str, key: str, descending: bool, after: Optional[Tuple[Any, int]], id_column: str):
+    """`clause` narrowed to the rows past the (key, id) cursor `after`."""
+    if after is None:
+        return clause, []
+    condition = f"({key} {'<' if descending else '>'} ? OR ({key} = ? AND {id_column} > ?))"
+    joiner = " AND " if " WHERE " in clause else " WHERE "
+    return clause + joiner + condition, [after[0], after[0], after[1]]
+
+
+def _next_page(rows: List[sqlite3.Row], limit: int):
+    """Trim a limit + 1 fetch to the page and the cursor for the next one."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1]["sort_key"], rows[-1]["id"])
+
+
+def _product_filter(
+    category: Optional[str],
+    min_price: Optional[float],
+    max_price: Optional[float],
+    tag: Optional[str],
+    search: Optional[str],
+    is_active: Optional[bool]
+) -> Tuple[str, List[str], List[Any], List[str]]:
+    """FROM source, WHERE conditions and parameters for the product filters.
+
+    Also returns the search terms that went to the FTS index (relevance
+    ranking needs at least one).
+    """
+    source = "products p"
+    where, params = [], []
+    if category:
+        where.append("p.category_lower = ?")
+        params.append(category.lower())
+    if tag:
+        where.append("p.id IN (SELECT product_id FROM product_tags WHERE tag = ?)")
+        params.append(tag.lower())
+    if is_active is not None:
+        where.append("p.isActive = ?")
+        params.append(int(is_active))
+    if min_price is not None:
+        where.append("p.price >= ?")
+        params.append(min_price)
+    if max_price is not None:
+        where.append("p.price <= ?")
+        params.append(max_price)
+
+    # Trigrams need three characters; shorter terms fall back to LIKE
+    terms = sorted(set(tokenize(search))) if search else []
+    fts_terms = [t for t in terms if len(t) >= 3]
+    for term in terms:
+        if len(term) < 3:
+            where.append("p.search_text LIKE ? ESCAPE '\\'")
+            params.append(_like_term(term))
+    if fts_terms:
+        # CROSS JOIN pins the match as the outer loop; otherwise the
+        # planner may drive from a products index and re-run the FTS
+        # query once per row.
+        source = "products_fts CROSS JOIN products p ON p.id = products_fts.rowid"
+        where.append("products_fts MATCH ?")
+        params.append(" AND ".join(f'"{t}"' for t in fts_terms))
+    return source, where, params, fts_terms
+
+
+def _like_term(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class SQLiteDatabase:
+    # Every call does disk I/O, so routers run it in the threadpool (see run_db)
+    blocking = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self.seeded = False
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.pool = ConnectionPool(path)
+        self._suggest: Optional[SuggestIndex] = None
+        self._suggest_version = -1
+        self._suggest_checked = 0.0
+        self._suggest_lock = threading.Lock()
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+        with self.pool.transaction() as conn:
+            self._migrate_user_keys(conn)
+        with self.pool.transaction() as conn:
+            if conn.execute("SELECT 1 FROM facet_counts LIMIT 1").fetchone() is None:
+                conn.execute(REBUILD_FACET_COUNTS)
+        self._seed()
+        with self.pool.transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('catalog', 0)")
+
+    @staticmethod
+    def _migrate_user_keys(conn: sqlite3.Connection):
+        """Create the unique username and email indexes, renaming duplicates.
+
+        Earlier files indexed both without UNIQUE and compared emails
+        exactly, so they may repeat a key. The lowest id keeps it; later
+        users get "<value>~<id>", as the in-memory store does.
+        """
+        for column, index, collate in USER_KEY_INDEXES:
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index,)).fetchone():
+                continue
+            duplicates = conn.execute(
+                f"SELECT id, {column} FROM users WHERE id NOT IN "
+                f"(SELECT MIN(id) FROM users GROUP BY {column}{collate})"
+            ).fetchall()
+            for user_id, value in duplicates:
+                renamed = f"{value}~{user_id}"
+                logger.warning("User %s shares %s %r; renamed to %r", user_id, column, value, renamed)
+                conn.execute(f"UPDATE users SET {column} = ? WHERE id = ?", (renamed, user_id))
+            conn.execute(f"CREATE UNIQUE INDEX {index} ON users ({column}{collate})")
+        conn.execute("DROP INDEX IF EXISTS users_username")
+        conn.execute("DROP INDEX IF EXISTS users_email")
+        conn.execute("DROP INDEX IF EXISTS users_email_nocase")
+
+    def _seed(self):
+        # Same starting data as the in-memory store, written once per file
+        from app.db import Database
+
+        with self.pool.transaction() as conn:
+            if conn.execute("SELECT COUNT(*) FROM counters").fetchone()[0]:
+                return
+            seed = Database()
+            for product in seed.products:
+                self._insert_product(conn, product)
+            conn.executemany(INSERT_USER, [self._user_params(u) for u in seed.users])
+            conn.executemany(INSERT_CART, [self._cart_params(c) for c in seed.carts])
+            conn.executemany(INSERT_ORDER, [self._order_params(o) for o in seed.orders])
+            conn.executemany("INSERT INTO counters (name, value) VALUES (?, ?)", [
+                ("products", seed.product_counter),
+                ("users", seed.user_counter),
+                ("carts", seed.cart_counter),
+                ("orders", seed.order_counter),
+            ])
+        self.seeded = True
+
+    def close(self):
+        self.pool.close()
+
+    def open_sessions(self, access_ttl: float) -> "SQLiteSessionStore":
+        return SQLiteSessionStore(self.pool, access_ttl)
+
+    def _next_id(self, name: str) -> int:
+        with self.pool.transaction() as conn:
+            return conn.execute(NEXT_ID, (name,)).fetchone()[0]
+
     def get_next_product_id(self):
-        self.product_counter += 1
-        return self.product_counter
+        return self._next_id("products")
+
+    def get_next_user_id(self):
+        return self._next_id("users")
+
+    def get_next_cart_id(self):
+        return self._next_id("carts")
+
+    def get_next_order_id(self):
+        return self._next_id("orders")
+
+    def get_catalog_version(self) -> int:
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT value FROM counters WHERE name = 'catalog'").fetchone()[0]
+
+    # Products
+    def get_product(self, product_id: int) -> Optional[Dict[str, Any]]:
+        with self.pool.connection() as conn:
+            row = conn.execute(SELECT_PRODUCT + " WHERE p.id = ?", (product_id,)).fetchone()
+        return _product(row) if row else None
+
+    def get_products(self, product_ids: List[int]) -> List[Optional[Dict[str, Any]]]:
+        """Products for `product_ids` in the same order, None where an id is unknown."""
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                SELECT_PRODUCT + " WHERE p.id IN (SELECT value FROM json_each(?))",
+                (json.dumps(product_ids),)
+            ).fetchall()
+        products = {row["id"]: _product(row) for row in rows}
+        return [products.get(product_id) for product_id in product_ids]
+
+    def export_products(self, after_id: int = 0, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Up to `limit` products with ids past `after_id`, active or not, in id order."""
+        with self.pool.connection() as conn:
+            rows = conn.execute(SELECT_PRODUCT + " WHERE p.id > ? ORDER BY p.id LIMIT ?", (after_id, limit)).fetchall()
+        return [_product(row) for row in rows]
+
+    def _insert_product(self, conn: sqlite3.Connection, product: Dict[str, Any]):
+        conn.execute(INSERT_PRODUCT, (product["id"],) + _product_params(product))
+        conn.executemany(
+            "INSERT OR IGNORE INTO product_tags (tag, product_id) VALUES (?, ?)",
+            [(tag.lower(), product["id"]) for tag in product.get("tags", [])]
+        )
+        conn.execute(
+            "INSERT INTO products_fts (rowid, search_text) VALUES (?, ?)",
+            (product["id"], _search_text(product))
+        )
+
+    def add_product(self, product: Dict[str, Any]) -> Dict[str, Any]:
+        with self.pool.transaction() as conn:
+            self._insert_product(conn, product)
+            conn.execute(BUMP_CATALOG_VERSION)
+        return product
+
+    def update_product(self, product_id: int, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # A null name, price, rating... would not fit the NOT NULL columns
+        changes = ProductRecord.drop_nulls(changes)
+        with self.pool.transaction() as conn:
+            product = self._update_product(conn, product_id, changes)
+            if product is not None:
+                conn.execute(BUMP_CATALOG_VERSION)
+        return product
+
+    def _update_product(
+        self, conn: sqlite3.Connection, product_id: int, changes: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        row = conn.execute(SELECT_PRODUCT + " WHERE p.id = ?", (product_id,)).fetchone()
+        if row is None:
+            return None
+        product = _product(row)
+        product.update(changes)
+        conn.execute(UPDATE_PRODUCT, _product_params(product) + (product_id,))
+        if "tags" in changes:
+            conn.execute("DELETE FROM product_tags WHERE product_id = ?", (product_id,))
+            conn.executemany(
+                "INSERT OR IGNORE INTO product_tags (tag, product_id) VALUES (?, ?)",
+                [(tag.lower(), product_id) for tag in product.get("tags", [])]
+            )
+        if any(field in changes for field in ("name", "description", "tags")):
+            conn.execute("DELETE FROM products_fts WHERE rowid = ?", (product_id,))
+            conn.execute(
+                "INSERT INTO products_fts (rowid, search_text) VALUES (?, ?)",
+                (product_id, _search_text(product))
+            )
+        return product
+
+    def import_products(self, products: List[Dict[str, Any]]) -> List[Tuple[int, bool]]:
+        """Upsert a batch of products in one transaction. Returns (id, created) per product."""
+        results = []
+        with self.pool.transaction() as conn:
+            for fields in products:
+                product_id = fields.get("id")
+                if product_id is None:
+                    product_id = conn.execute(NEXT_ID, ("products",)).fetchone()[0]
+                else:
+                    changes = {k: v for k, v in fields.items() if k not in ("id", "createdAt")}
+                    if self._update_product(conn, product_id, changes) is not None:
+                        results.append((product_id, False))
+                        continue
+                    conn.execute(RAISE_ID, (product_id, "products"))
+                self._insert_product(conn, {**fields, "id": product_id})
+                results.append((product_id, True))
+            conn.execute(BUMP_CATALOG_VERSION)
+        return results
+
+    def query_products(
+        self,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        tag: Optional[str] = None,
+        search: Optional[str] = None,
+        is_active: Optional[bool] = True,
+        sort_by: str = "id",
+        sort_order: str = "asc",
+        offset: int = 0,
+        limit: int = 10,
+        after: Optional[Tuple[Any, int]] = None
+    ) -> Tuple[int, List[Dict[str, Any]], Optional[Tuple[Any, int]]]:
+        """Filter, sort and paginate products. Returns (total, page, next).
+
+        `after` and `next` are (sort key, id) keyset cursors, as in the
+        in-memory store.
+        """
+        source, where, params, fts_terms = _product_filter(category, min_price, max_price, tag, search, is_active)
+        if sort_by == "relevance" and fts_terms:
+            key, descending = "bm25(products_fts)", False
+        else:
+            key = PRODUCT_SORT_COLUMNS.get(sort_by, "p.id")
+            descending = sort_order.lower() == "desc"
+        clause = f" FROM {source}" + (" WHERE " + " AND ".join(where) if where else "")
+        page_clause, page_params = _keyset(clause, key, descending, after, "p.id")
+
+        with self.pool.connection() as conn:
+            total = conn.execute("SELECT COUNT(*)" + clause, params).fetchone()[0]
+            rows = conn.execute(
+                f"{SELECT_PRODUCT_COLUMNS}, {key} AS sort_key{page_clause} "
+                f"ORDER BY {key} {'DESC' if descending else 'ASC'}, p.id LIMIT ? OFFSET ?",
+                params + page_params + [limit + 1, offset]
+            ).fetchall()
+        page, next_after = _next_page(rows, limit)
+        return total, [_product(row) for row in page], next_after
+
+    def query_facets(
+        self,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        tag: Optional[str] = None,
+        search: Optional[str] = None,
+        is_active: Optional[bool] = True
+    ) -> Dict[str, Any]:
+        """Category, tag and price-bucket counts of the products query_products would match."""
+        source, where, params, _ = _product_filter(category, min_price, max_price, tag, search, is_active)
+        clause = f" FROM {source}" + (" WHERE " + " AND ".join(where) if where else "")
+        with self.pool.connection() as conn:
+            # Price buckets are counted over the (isActive, price) index either way
+            buckets = [0] * len(FACET_PRICE_BUCKETS)
+            for bucket, count in conn.execute(f"SELECT {PRICE_BUCKET}, COUNT(*){clause} GROUP BY 1", params):
+                buckets[bucket] = count
+            if is_active is True and not (category or tag or search) and min_price is None and max_price is None:
+                counts = {"total": {}, "category": {}, "tag": {}}
+                for facet, value, count in conn.execute("SELECT facet, value, count FROM facet_counts"):
+                    counts[facet][value] = count
+                return facet_response(counts["total"].get("", 0), counts["category"], counts["tag"], buckets)
+            total = conn.execute("SELECT COUNT(*)" + clause, params).fetchone()[0]
+            categories = dict(conn.execute(f"SELECT p.category, COUNT(*){clause} GROUP BY p.category", params).fetchall())
+            tags = dict(conn.execute(
+                f"SELECT tag, COUNT(*) FROM product_tags WHERE product_id IN (SELECT p.id{clause}) GROUP BY tag",
+                params
+            ).fetchall())
+        return facet_response(total, categories, tags, buckets)
+
+    def list_categories(self) -> List[str]:
+        with self.pool.connection() as conn:
+            rows = conn.execute("SELECT value FROM facet_counts WHERE facet = 'category' AND count > 0").fetchall()
+        return [row[0] for row in rows]
+
+    def suggest_products(self, query: str, limit: int = 10, fuzzy: bool = True) -> List[Dict[str, Any]]:
+        return self._suggest_index().suggest(query, limit, fuzzy)
+
+    def _suggest_index(self) -> SuggestIndex:
+        """This worker's suggest trie, rebuilt when the catalog has changed.
+
+        Other workers write to the same file, so the trie is not updated in
+        place; it is rebuilt from the table once the catalog version has
+        moved, checked at most every SUGGEST_REFRESH_INTERVAL seconds.
+        Queries meanwhile keep using the previous trie.
+        """
+        index = self._suggest
+        if index is not None and time.monotonic() - self._suggest_checked < SUGGEST_REFRESH_INTERVAL:
+            return index
+        if not self._suggest_lock.acquire(blocking=index is None):
+            return index
+        try:
+            if self._suggest is None or time.monotonic() - self._suggest_checked >= SUGGEST_REFRESH_INTERVAL:
+                version = self.get_catalog_version()
+                if version != self._suggest_version:
+                    with self.pool.connection() as conn:
+                        rows = conn.execute(SELECT_PRODUCT + " WHERE p.isActive = 1")
+                        self._suggest = SuggestIndex(_product(row) for row in rows)
+                    self._suggest_version = version
+                self._suggest_checked = time.monotonic()
+            return self._suggest
+        finally:
+            self._suggest_lock.release()
+
+    # Users
+    @staticmethod
+    def _user_params(user: Dict[str, Any]) -> Tuple:
+        return tuple(int(user[c]) if c == "is_active" else user[c] for c in USER_COLUMNS)
+
+    def _find_user(self, where: str, value: Any) -> Optional[Dict[str, Any]]:
+        with self.pool.connection() as conn:
+            row = conn.execute(f"{SELECT_USER} WHERE {where} = ? ORDER BY id LIMIT 1", (value,)).fetchone()
+        return _user(row) if row else None
+
+    def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return self._find_user("id", user_id)
+
+    def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
+        return self._find_user("username", username)
+
+    def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        """The user registered with `email`, compared ignoring case."""
+        return self._find_user("email COLLATE NOCASE", email)
+
+    def query_users(
+        self,
+        role: Optional[str] = None,
+        is_active: Optional[bool] = None,
+        skip: int = 0,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        where, params = [], []
+        if role:
+            where.append("role = ?")
+            params.append(role)
+        if is_active is not None:
+            where.append("is_active = ?")
+            params.append(int(is_active))
+        sql = SELECT_USER + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY id LIMIT ? OFFSET ?"
+        with self.pool.connection() as conn:
+            rows = conn.execute(sql, params + [limit, skip]).fetchall()
+        return [_user(row) for row in rows]
+
+    def add_user(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        """Insert a user; raises DuplicateUserError if its username or email is taken."""
+        with _user_keys_guard(), self.pool.transaction() as conn:
+            conn.execute(INSERT_USER, self._user_params(user))
+        return user
+
+    def update_user(self, user_id: int, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Update a user; raises DuplicateUserError if a new username or email is taken."""
+        with _user_keys_guard(), self.pool.transaction() as conn:
+            row = conn.execute(SELECT_USER + " WHERE id = ?", (user_id,)).fetchone()
+            if row is None:
+                return None
+            user = _user(row)
+            user.update(changes)
+            conn.execute(UPDATE_USER, self._user_params(user)[1:] + (user_id,))
+        return user
+
+    # Carts
+    @staticmethod
+    def _cart_params(cart: Dict[str, Any]) -> Tuple:
+        return tuple(json.dumps(cart[c]) if c == "items" else cart[c] for c in CART_COLUMNS)
+
+    def get_cart(self, cart_id: int) -> Optional[Dict[str, Any]]:
+        with self.pool.connection() as conn:
+            row = conn.execute(SELECT_CART + " WHERE id = ?", (cart_id,)).fetchone()
+        return _with_items(row) if row else None
+
+    def get_user_carts(self, user_id: int) -> List[Dict[str, Any]]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(SELECT_CART + " WHERE user_id = ? ORDER BY id", (user_id,)).fetchall()
+        return [_with_items(row) for row in rows]
+
+    def add_cart(self, cart: Dict[str, Any]) -> Dict[str, Any]:
+        with self.pool.transaction() as conn:
+            conn.execute(INSERT_CART, self._cart_params(cart))
+        return cart
+
+    def update_cart(self, cart_id: int, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self.pool.transaction() as conn:
+            row = conn.execute(SELECT_CART + " WHERE id = ?", (cart_id,)).fetchone()
+            if row is None:
+                return None
+            cart = _with_items(row)
+            cart.update(changes)
+            conn.execute(UPDATE_CART, self._cart_params(cart)[1:] + (cart_id,))
+        return cart
+
+    # Orders
+    @staticmethod
+    def _order_params(order: Dict[str, Any]) -> Tuple:
+        return tuple(json.dumps(order[c]) if c == "items" else order[c] for c in ORDER_COLUMNS)
+
+    def get_order(self, order_id: int) -> Optional[Dict[str, Any]]:
+        with self.pool.connection() as conn:
+            row = conn.execute(SELECT_ORDER + " WHERE id = ?", (order_id,)).fetchone()
+        return _with_items(row) if row else None
+
+    def query_orders(
+        self,
+        user_id: Optional[int] = None,
+        status: Optional[str] = None,
+        sort_by: str = "created_at",
+        sort_order: str = "desc",
+        offset: int = 0,
+        limit: int = 10,
+        after: Optional[Tuple[Any, int]] = None
+    ) -> Tuple[int, List[Dict[str, Any]], Optional[Tuple[Any, int]]]:
+        """Orders (all, or one user's) filtered by status. Returns (total, page, next)."""
+        where, params = [], []
+        if user_id is not None:
+            where.append("user_id = ?")
+            params.append(user_id)
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        clause = " WHERE " + " AND ".join(where) if where else ""
+        # Unknown sort keys keep insertion order, like the in-memory store
+        if sort_by in ORDER_SORT_COLUMNS:
+            key, descending = sort_by, sort_order.lower() == "desc"
+        else:
+            key, descending = "id", False
+        page_clause, page_params = _keyset(clause, key, descending, after, "id")
+        with self.pool.connection() as conn:
+            total = conn.execute("SELECT COUNT(*) FROM orders" + clause, params).fetchone()[0]
+            rows = conn.execute(
+                f"{SELECT_ORDER_COLUMNS}, {key} AS sort_key FROM orders{page_clause} "
+                f"ORDER BY {key} {'DESC' if descending else 'ASC'}, id LIMIT ? OFFSET ?",
+                params + page_params + [limit + 1, offset]
+            ).fetchall()
+        page, next_after = _next_page(rows, limit)
+        return total, [_with_items(row) for row in page], next_after
+
+    def export_orders(self, after_id: int = 0, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Up to `limit` orders with ids past `after_id`, in id order."""
+        with self.pool.connection() as conn:
+            rows = conn.execute(SELECT_ORDER + " WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)).fetchall()
+        return [_with_items(row) for row in rows]
+
+    def order_stats(self) -> Dict[str, Any]:
+        with self.pool.connection() as conn:
+            total_orders, total_revenue = conn.execute("SELECT COUNT(*), COALESCE(SUM(total), 0) FROM orders").fetchone()
+            rows = conn.execute("SELECT status, COUNT(*) FROM orders GROUP BY status").fetchall()
+        return {
+            "total_orders": total_orders,
+            "total_revenue": total_revenue,
+            "status_counts": {status: count for status, count in rows}
+        }
+
+    def add_order(self, order: Dict[str, Any]) -> Dict[str, Any]:
+        with self.pool.transaction() as conn:
+            conn.execute(INSERT_ORDER, self._order_params(order))
+        return order
+
+    def place_order(self, order: Dict[str, Any]) -> Dict[str, Any]:
+        """Check out an order's cart in one transaction (see Database.place_order).
+
+        The guarded UPDATEs make concurrent checkouts, from any worker,
+        queue on the write lock and see each other's stock and cart status.
+        """
+        with self.pool.transaction() as conn:
+            completed = conn.execute(
+                "UPDATE carts SET status = 'completed' WHERE id = ? AND status = 'active'", (order["cart_id"],)
+            )
+            if not completed.rowcount:
+                raise OrderConflictError("Cart is not active")
+            for item in order["items"]:
+                product = conn.execute("SELECT name, price FROM products WHERE id = ?", (item["product_id"],)).fetchone()
+                if product is None:
+                    continue
+                taken = conn.execute(
+                    "UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?",
+                    (item["quantity"], item["product_id"], item["quantity"])
+                )
+                if not taken.rowcount:
+                    raise OrderConflictError(f"Insufficient stock for product {product['name']}")
+                item["price_at_purchase"] = product["price"]
+            conn.execute(BUMP_CATALOG_VERSION)
+            conn.execute(INSERT_ORDER, self._order_params(order))
+        return order
+
+    def update_order(self, order_id: int, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self.pool.transaction() as conn:
+            row = conn.execute(SELECT_ORDER + " WHERE id = ?", (order_id,)).fetchone()
+            if row is None:
+                return None
+            order = _with_items(row)
+            order.update(changes)
+            conn.execute(UPDATE_ORDER, self._order_params(order)[1:] + (order_id,))
+        return order
+
+
+class SQLiteSessionStore:
+    """Sessions, revoked session ids and revoked users in the database file.
+
+    Same methods as app.sessions.SessionStore, so a refresh token works on
+    any worker and a revocation reaches all of them. is_revoked and
+    is_user_revoked answer from this worker's copy of the revocations,
+    which poll_revoked brings up to date every SESSION_POLL_INTERVAL
+    seconds.
+    """
+
+    blocking = True
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        access_ttl: float,
+        ttl: float = REFRESH_TOKEN_TTL,
+        sweep_interval: float = SESSION_SWEEP_INTERVAL,
+        poll_interval: float = SESSION_POLL_INTERVAL
+    ):
+        self.pool = pool
+        self.access_ttl = access_ttl
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.poll_interval = poll_interval
+        # Session id -> when the last access token issued for it expires
+        self.revoked: Dict[str, float] = {}
+        # User id -> when all of the user's sessions were last revoked
+        self.revoked_before: Dict[int, float] = {}
+        self.last_seq = 0
+        self.last_user_seq = 0
+        self.next_poll = 0.0
+        self.next_sweep = time.time() + sweep_interval
+        self.created = 0
+        self.refreshed = 0
+        self.rejected = 0
+        self.swept = 0
+        self.poll_revoked()
+
+    def create(self, user_id: int) -> Tuple[str, str]:
+        """Open a session for `user_id`. Returns (session id, refresh token)."""
+        self._maybe_sweep()
+        session_id = secrets.token_urlsafe(12)
+        secret = secrets.token_urlsafe(32)
+        with self.pool.transaction() as conn:
+            conn.execute(
+                "INSERT INTO sessions (id, user_id, digest, expires) VALUES (?, ?, ?, ?)",
+                (session_id, user_id, _digest(secret), time.time() + self.ttl)
+            )
+        self.created += 1
+        return session_id, f"{session_id}.{secret}"
+
+    def refresh(self, refresh_token: str) -> Optional[Tuple[str, int, str]]:
+        """Rotate a refresh token. Returns (session id, user id, new refresh token),
+        or None for an unknown, used or expired one."""
+        self._maybe_sweep()
+        session_id, _, secret = refresh_token.partition(".")
+        new_secret = secrets.token_urlsafe(32)
+        now = time.time()
+        # One transaction, so of two refreshes with the same token only one wins
+        with self.pool.transaction() as conn:
+            row = conn.execute(
+                "SELECT user_id, digest, expires FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is None or not hmac.compare_digest(row["digest"], _digest(secret)):
+                self.rejected += 1
+                return None
+            if row["expires"] <= now:
+                conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                self.rejected += 1
+                return None
+            conn.execute(
+                "UPDATE sessions SET digest = ?, expires = ? WHERE id = ?",
+                (_digest(new_secret), now + self.ttl, session_id)
+            )
+        self.refreshed += 1
+        return session_id, row["user_id"], f"{session_id}.{new_secret}"
+
+    def is_revoked(self, session_id: str) -> bool:
+        return session_id in self.revoked
+
+    def is_user_revoked(self, user_id: int, issued_at: float) -> bool:
+        """Whether every session of the user was revoked after `issued_at`."""
+        return issued_at < self.revoked_before.get(user_id, 0.0)
+
+    def revoke(self, user_id: int, session_id: Optional[str] = None):
+        """Revoke one session of a user, or every one (as on a password change
+        or deactivation)."""
+        now = time.time()
+        until = now + self.access_ttl
+        with self.pool.transaction() as conn:
+            if session_id is None:
+                session_ids = [row[0] for row in conn.execute(
+                    "DELETE FROM sessions WHERE user_id = ? RETURNING id", (user_id,)
+                ).fetchall()]
+                conn.execute(
+                    "INSERT OR REPLACE INTO revoked_users (user_id, before, until) VALUES (?, ?, ?)",
+                    (user_id, now, until)
+                )
+                self.revoked_before[user_id] = now
+            else:
+                conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                session_ids = [session_id]
+            conn.executemany(
+                "INSERT OR REPLACE INTO revoked_sessions (id, user_id, until) VALUES (?, ?, ?)",
+                [(s, user_id, until) for s in session_ids]
+            )
+        for session_id in session_ids:
+            self.revoked[session_id] = until
+
+    def poll_due(self) -> bool:
+        """Whether poll_revoked should run now. Claims the poll, so of the
+        requests arriving at once only one makes it; call on the event loop."""
+        now = time.time()
+        if now < self.next_poll:
+            return False
+        self.next_poll = now + self.poll_interval
+        return True
+
+    def poll_revoked(self) -> Set[int]:
+        """Pick up revocations made since the last poll, by any worker.
+        Returns the ids of the users they belong to."""
+        now = time.time()
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT seq, id, user_id, until FROM revoked_sessions WHERE seq > ? AND until > ? ORDER BY seq",
+                (self.last_seq, now)
+            ).fetchall()
+            user_rows = conn.execute(
+                "SELECT seq, user_id, before FROM revoked_users WHERE seq > ? AND until > ? ORDER BY seq",
+                (self.last_user_seq, now)
+            ).fetchall()
+        user_ids = set()
+        for seq, session_id, user_id, until in rows:
+            self.revoked[session_id] = until
+            self.last_seq = seq
+            user_ids.add(user_id)
+        for seq, user_id, before in user_rows:
+            self.revoked_before[user_id] = max(before, self.revoked_before.get(user_id, 0.0))
+            self.last_user_seq = seq
+            user_ids.add(user_id)
+        for session_id in [s for s, until in self.revoked.items() if until <= now]:
+            self.revoked.pop(session_id, None)
+        horizon = now - self.access_ttl
+        for user_id in [u for u, before in self.revoked_before.items() if before <= horizon]:
+            self.revoked_before.pop(user_id, None)
+        return user_ids
+
+    def _maybe_sweep(self):
+        now = time.time()
+        if now < self.next_sweep:
+            return
+        self.next_sweep = now + self.sweep_interval
+        with self.pool.transaction() as conn:
+            self.swept += conn.execute("DELETE FROM sessions WHERE expires <= ?", (now,)).rowcount
+            conn.execute("DELETE FROM revoked_sessions WHERE until <= ?", (now,))
+            conn.execute("DELETE FROM revoked_users WHERE until <= ?", (now,))
 
-db = Database()
+    def stats(self) -> Dict[str, int]:
+        # Counters of this worker; the session count would cost a query
+        return {
+            "revoked": len(self.revoked),
+            "revoked_users": len(self.revoked_before),
+            "created": self.created,
+            "refreshed": self.refreshed,
+            "rejected": self.rejected,
+            "swept": self.swept,
+        }
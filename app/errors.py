@@ -0,0 +1,14 @@
+# app/errors.py
+"""Errors raised by the stores (app.db, app.db_production) for routers to map."""
+
+
+class DuplicateUserError(ValueError):
+    """A username or email (compared ignoring case) already belongs to another user."""
+
+    def __init__(self, field: str):
+        super().__init__(f"{field} already taken")
+        self.field = field
+
+
+class OrderConflictError(ValueError):
+    """An order's cart is no longer active, or a product is short of stock."""
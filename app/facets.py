@@ -0,0 +1,93 @@
+# app/facets.py
+import os
+from bisect import bisect_right
+from collections import Counter
+from typing import Any, Dict, Iterable, List
+
+# Lower edges of the price buckets; the last bucket is open-ended
+FACET_PRICE_BUCKETS = sorted(
+    float(edge) for edge in os.getenv("FACET_PRICE_BUCKETS", "0,25,50,100,250,500,1000").split(",")
+)
+
+
+def price_bucket(price: float, edges: List[float] = FACET_PRICE_BUCKETS) -> int:
+    """Index of the bucket holding `price`; prices under the first edge go in the first bucket."""
+    return max(bisect_right(edges, price) - 1, 0)
+
+
+def facet_response(
+    total: int,
+    categories: Dict[str, int],
+    tags: Dict[str, int],
+    buckets: List[int],
+    edges: List[float] = FACET_PRICE_BUCKETS
+) -> Dict[str, Any]:
+    """Facet counts as returned by GET /products/facets, with empty values left out."""
+    return {
+        "total": total,
+        "categories": {name: count for name, count in sorted(categories.items()) if count},
+        "tags": {name: count for name, count in sorted(tags.items()) if count},
+        "price_buckets": [
+            {"min": low, "max": edges[i + 1] if i + 1 < len(edges) else None, "count": buckets[i]}
+            for i, low in enumerate(edges)
+        ],
+    }
+
+
+class FacetCounts:
+    """Running counts of active products per category, tag and price bucket.
+
+    Kept up to date by the product write paths, so the unfiltered facets
+    and the category list never walk the catalog. Categories are counted
+    under their stored name, tags lowercased as the tag filter matches them.
+    """
+
+    # Product fields the counts depend on
+    FIELDS = ("category", "tags", "price", "isActive")
+
+    def __init__(self, edges: List[float] = FACET_PRICE_BUCKETS):
+        self.edges = edges
+        self.total = 0
+        self.categories: Counter = Counter()
+        self.tags: Counter = Counter()
+        self.buckets = [0] * len(edges)
+
+    def build(self, products: Iterable[Dict[str, Any]]):
+        for product in products:
+            self.add(product)
+
+    def add(self, product: Dict[str, Any]):
+        self._count(product, 1)
+
+    def remove(self, product: Dict[str, Any]):
+        self._count(product, -1)
+
+    def _count(self, product: Dict[str, Any], delta: int):
+        if not product["isActive"]:
+            return
+        self.total += delta
+        category = product["category"]
+        self.categories[category] += delta
+        if not self.categories[category]:
+            del self.categories[category]
+        for tag in {tag.lower() for tag in product.get("tags", [])}:
+            self.tags[tag] += delta
+            if not self.tags[tag]:
+                del self.tags[tag]
+        self.buckets[price_bucket(product["price"], self.edges)] += delta
+
+    def as_response(self) -> Dict[str, Any]:
+        return facet_response(self.total, self.categories, self.tags, self.buckets, self.edges)
+
+    def count(self, products: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """Facets over an arbitrary set of products, active or not."""
+        total = 0
+        categories: Counter = Counter()
+        tags: Counter = Counter()
+        buckets = [0] * len(self.edges)
+        for product in products:
+            total += 1
+            categories[product["category"]] += 1
+            tags.update({tag.lower() for tag in product.get("tags", [])})
+            buckets[price_bucket(product["price"], self.edges)] += 1
+        return facet_response(total, categories, tags, buckets, self.edges)
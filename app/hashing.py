@@ -0,0 +1,103 @@
+# app/hashing.py
+"""
+Password hashing off the event loop
+
+bcrypt costs tens to hundreds of milliseconds per hash by design. Hashes
+and checks run on a small dedicated thread pool (bcrypt releases the GIL
+while it works), so a burst of logins queues there instead of stalling
+every other request on the worker. The queue is bounded: past
+HASH_QUEUE_LIMIT waiting calls, new ones are turned away with a 503 rather
+than piling up.
+"""
+import asyncio
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+import bcrypt
+from fastapi import HTTPException
+
+# bcrypt cost factor (log2 of the key expansion rounds) for new hashes.
+# Stored hashes of another cost are rehashed at the next login.
+BCRYPT_ROUNDS = min(max(int(os.getenv("BCRYPT_ROUNDS", "12")), 4), 31)
+
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Calls allowed to wait for a free hashing thread
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "64"))
+
+# bcrypt only reads this many bytes of a password
+BCRYPT_MAX_BYTES = 72
+
+
+def hash_password(password: str) -> str:
+    secret = password.encode()[:BCRYPT_MAX_BYTES]
+    return bcrypt.hashpw(secret, bcrypt.gensalt(BCRYPT_ROUNDS)).decode()
+
+
+def check_password(password: str, hashed: str) -> bool:
+    """Check `password` against a bcrypt hash or a legacy unsalted SHA-256 one."""
+    if hashed.startswith("$2"):
+        return bcrypt.checkpw(password.encode()[:BCRYPT_MAX_BYTES], hashed.encode())
+    legacy = hashlib.sha256(password.encode()).hexdigest()
+    return hmac.compare_digest(legacy, hashed)
+
+
+def needs_rehash(hashed: str) -> bool:
+    """Whether a stored hash is legacy SHA-256 or of another bcrypt cost."""
+    if not hashed.startswith("$2"):
+        return True
+    return int(hashed.split("$")[2]) != BCRYPT_ROUNDS
+
+
+class HashPool:
+    """Bounded thread pool for password hashing, with queue-depth counters."""
+
+    def __init__(self, workers: int = HASH_WORKERS, queue_limit: int = HASH_QUEUE_LIMIT):
+        self.workers = max(workers, 1)
+        self.queue_limit = queue_limit
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hash")
+        self.pending = 0  # running or waiting; only touched on the event loop
+        self.max_queued = 0
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def queued(self) -> int:
+        return max(self.pending - self.workers, 0)
+
+    def full(self) -> bool:
+        return self.queued >= self.queue_limit
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        if self.full():
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Too many password checks in progress, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "rounds": BCRYPT_ROUNDS,
+            "running": min(self.pending, self.workers),
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "queue_limit": self.queue_limit,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+hash_pool = HashPool()
@@ -0,0 +1,395 @@
+# app/indexes.py
+import heapq
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from itertools import accumulate, islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# A window of at most 1/TOP_K_RATIO of the rows is picked by top_k rather
+# than found by sorting them all
+TOP_K_RATIO = 32
+
+
+class SortedList:
+    """A sorted list stored as a list of short sorted blocks.
+
+    Inserts and removals shift one block instead of the whole list, so
+    keeping a million entries in order stays cheap one item at a time.
+    Positions (for bisection and slicing) are global, as in a flat list.
+    """
+
+    # Target block length; a block is split once it doubles
+    LOAD = 1000
+
+    def __init__(self, items: Iterable[Any] = ()):
+        self._build(sorted(items))
+
+    def _build(self, items: List[Any]):
+        load = self.LOAD
+        self.blocks: List[List[Any]] = [items[i:i + load] for i in range(0, len(items), load)]
+        self.maxes: List[Any] = [block[-1] for block in self.blocks]
+        self.size = len(items)
+        self._offsets: Optional[List[int]] = None
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self) -> Iterator[Any]:
+        for block in self.blocks:
+            yield from block
+
+    def add(self, item: Any):
+        blocks, maxes = self.blocks, self.maxes
+        if not blocks:
+            blocks.append([item])
+            maxes.append(item)
+        else:
+            i = min(bisect_left(maxes, item), len(maxes) - 1)
+            block = blocks[i]
+            insort(block, item)
+            maxes[i] = block[-1]
+            if len(block) > 2 * self.LOAD:
+                blocks[i:i + 1] = [block[:self.LOAD], block[self.LOAD:]]
+                maxes[i:i + 1] = [blocks[i][-1], blocks[i + 1][-1]]
+        self.size += 1
+        self._offsets = None
+
+    def update(self, items: Iterable[Any]):
+        items = sorted(items)
+        if not items:
+            return
+        if len(items) > self.size:
+            # Cheaper to lay the blocks out again
+            self._build(sorted(list(self) + items))
+            return
+        # Each block takes its share of the batch at once (a few inserts, or
+        # one extend + sort for many), then blocks that outgrew the limit
+        # are split
+        blocks, maxes = self.blocks, self.maxes
+        last = len(blocks) - 1
+        i = k = 0
+        while k < len(items):
+            i = min(bisect_left(maxes, items[k], i), last)
+            end = len(items) if i == last else bisect_right(items, maxes[i], k)
+            block = blocks[i]
+            if end - k <= 16:
+                for item in items[k:end]:
+                    insort(block, item)
+            else:
+                block.extend(items[k:end])
+                block.sort()
+            maxes[i] = block[-1]
+            k = end
+        if any(len(block) > 2 * self.LOAD for block in blocks):
+            load = self.LOAD
+            self.blocks = [
+                part for block in blocks
+                for part in ([block[j:j + load] for j in range(0, len(block), load)] if len(block) > 2 * load else [block])
+            ]
+            self.maxes = [block[-1] for block in self.blocks]
+        self.size += len(items)
+        self._offsets = None
+
+    def remove(self, item: Any) -> bool:
+        i = bisect_left(self.maxes, item)
+        if i == len(self.maxes):
+            return False
+        block = self.blocks[i]
+        j = bisect_left(block, item)
+        if block[j] != item:
+            return False
+        del block[j]
+        if block:
+            self.maxes[i] = block[-1]
+        else:
+            del self.blocks[i]
+            del self.maxes[i]
+        self.size -= 1
+        self._offsets = None
+        return True
+
+    def _offset(self, block: int) -> int:
+        """Position of the first item of a block."""
+        if self._offsets is None:
+            self._offsets = list(accumulate((len(b) for b in self.blocks), initial=0))
+        return self._offsets[block]
+
+    def bisect_left(self, item: Any) -> int:
+        i = bisect_left(self.maxes, item)
+        if i == len(self.maxes):
+            return self.size
+        return self._offset(i) + bisect_left(self.blocks[i], item)
+
+    def bisect_right(self, item: Any) -> int:
+        i = bisect_right(self.maxes, item)
+        if i == len(self.maxes):
+            return self.size
+        return self._offset(i) + bisect_right(self.blocks[i], item)
+
+    def _locate(self, position: int) -> Tuple[int, int]:
+        """(block, index within it) of a position."""
+        self._offset(0)
+        i = bisect_right(self._offsets, position) - 1
+        return i, position - self._offsets[i]
+
+    def __getitem__(self, position: int) -> Any:
+        if not 0 <= position < self.size:
+            raise IndexError(position)
+        i, j = self._locate(position)
+        return self.blocks[i][j]
+
+    def islice(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Any]:
+        """Items at positions start..stop-1, in order."""
+        stop = self.size if stop is None else min(stop, self.size)
+        if start >= stop:
+            return
+        i, j = self._locate(start)
+        remaining = stop - start
+        blocks = self.blocks
+        while remaining > 0:
+            chunk = blocks[i][j:j + remaining]
+            yield from chunk
+            remaining -= len(chunk)
+            i, j = i + 1, 0
+
+
+class SortedIndex:
+    """(key, id) pairs kept in sort order for range lookups and ordered walks.
+
+    Ties are ordered by id, which matches a stable sort of the product list
+    (products are appended in id order).
+    """
+
+    def __init__(self, key: Callable[[Dict[str, Any]], Any]):
+        self.key = key
+        self.entries = SortedList()
+        self.key_of: Dict[int, Any] = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def build(self, products: Iterable[Dict[str, Any]]):
+        self.key_of = {p["id"]: self.key(p) for p in products}
+        self.entries = SortedList((key, product_id) for product_id, key in self.key_of.items())
+
+    def add(self, product: Dict[str, Any]):
+        key = self.key(product)
+        # Entries first: if the key does not compare, remove() finds nothing to undo
+        self.entries.add((key, product["id"]))
+        self.key_of[product["id"]] = key
+
+    def add_many(self, products: Iterable[Dict[str, Any]]):
+        new = []
+        for product in products:
+            key = self.key(product)
+            self.key_of[product["id"]] = key
+            new.append((key, product["id"]))
+        self.entries.update(new)
+
+    def remove(self, product_id: int):
+        key = self.key_of.pop(product_id, None)
+        if key is not None:
+            self.entries.remove((key, product_id))
+
+    def span(self, low: Any = None, high: Any = None) -> Tuple[int, int]:
+        """Positions of the entries with low <= key <= high."""
+        start = 0 if low is None else self.entries.bisect_left((low,))
+        stop = len(self.entries) if high is None else self.entries.bisect_right((high, float("inf")))
+        return start, max(start, stop)
+
+    def walk(self, reverse: bool = False, after: Optional[Tuple[Any, int]] = None) -> Iterator[int]:
+        """Yield ids in key order.
+
+        Descending walks keep equal keys in ascending id order, like
+        list.sort(reverse=True) does. `after` is a (key, id) position to
+        resume just past, found by bisection.
+        """
+        entries = self.entries
+        if not reverse:
+            start = 0 if after is None else entries.bisect_right(after)
+            for _, product_id in entries.islice(start):
+                yield product_id
+            return
+        stop = len(entries)
+        if after is not None:
+            # Rest of the tie group `after` sits in, then the lower keys
+            key = after[0]
+            stop = entries.bisect_left((key,))
+            for _, product_id in entries.islice(entries.bisect_right(after), entries.bisect_right((key, float("inf")))):
+                yield product_id
+        while stop > 0:
+            start = entries.bisect_left((entries[stop - 1][0],))
+            for _, product_id in entries.islice(start, stop):
+                yield product_id
+            stop = start
+
+
+class ProductIndex:
+    """Secondary indexes over the product catalog, keyed by product id."""
+
+    # Product fields the indexes are built from
+    FIELDS = ("category", "tags", "isActive", "price", "rating", "name")
+
+    def __init__(self):
+        self.ids: Set[int] = set()
+        self.by_category: Dict[str, Set[int]] = defaultdict(set)
+        self.by_tag: Dict[str, Set[int]] = defaultdict(set)
+        self.active: Set[int] = set()
+        self.inactive: Set[int] = set()
+
+        # Sort orders supported by GET /products/ (id is the fallback)
+        self.sorted: Dict[str, SortedIndex] = {
+            "id": SortedIndex(lambda p: p["id"]),
+            "price": SortedIndex(lambda p: p["price"]),
+            "rating": SortedIndex(lambda p: p.get("rating", 0)),
+            "name": SortedIndex(lambda p: p["name"].lower()),
+        }
+
+    def build(self, products: List[Dict[str, Any]]):
+        for product in products:
+            self._add_to_sets(product)
+        for index in self.sorted.values():
+            index.build(products)
+
+    def add(self, product: Dict[str, Any]):
+        self._add_to_sets(product)
+        for index in self.sorted.values():
+            index.add(product)
+
+    def add_many(self, products: List[Dict[str, Any]]):
+        for product in products:
+            self._add_to_sets(product)
+        for index in self.sorted.values():
+            index.add_many(products)
+
+    def remove(self, product: Dict[str, Any]):
+        product_id = product["id"]
+        self.ids.discard(product_id)
+        _discard(self.by_category, product["category"].lower(), product_id)
+        for tag in product.get("tags", []):
+            _discard(self.by_tag, tag.lower(), product_id)
+        self.active.discard(product_id)
+        self.inactive.discard(product_id)
+        for index in self.sorted.values():
+            index.remove(product_id)
+
+    def _add_to_sets(self, product: Dict[str, Any]):
+        product_id = product["id"]
+        self.ids.add(product_id)
+        self.by_category[product["category"].lower()].add(product_id)
+        for tag in product.get("tags", []):
+            self.by_tag[tag.lower()].add(product_id)
+        if product["isActive"]:
+            self.active.add(product_id)
+        else:
+            self.inactive.add(product_id)
+
+    def lookup(
+        self,
+        category: Optional[str] = None,
+        tag: Optional[str] = None,
+        is_active: Optional[bool] = None
+    ) -> Optional[Set[int]]:
+        """Ids matching every given filter, or None when no filter applies.
+
+        The result may be one of the index's own sets; treat it as read-only.
+        """
+        sets = []
+        if category:
+            sets.append(self.by_category.get(category.lower(), set()))
+        if tag:
+            sets.append(self.by_tag.get(tag.lower(), set()))
+        if is_active is True:
+            sets.append(self.active)
+        elif is_active is False:
+            sets.append(self.inactive)
+
+        if not sets:
+            return None
+        # Intersect starting from the most selective set
+        if len(sets) == 1:
+            return sets[0]
+        sets.sort(key=len)
+        result = sets[0] & sets[1]
+        for other in sets[2:]:
+            result &= other
+            if not result:
+                break
+        return result
+
+    def sort_index(self, sort_by: str) -> SortedIndex:
+        # Unknown sort fields fall back to id order
+        return self.sorted.get(sort_by, self.sorted["id"])
+
+    def page(
+        self,
+        ids: Optional[Set[int]],
+        sort_by: str,
+        reverse: bool,
+        offset: int,
+        limit: int,
+        after: Optional[Tuple[Any, int]] = None
+    ) -> List[int]:
+        """Ids of one page of `ids` (None means every product) in sort order.
+
+        With `after` (a (key, id) cursor) the page starts just past it.
+        """
+        index = self.sort_index(sort_by)
+        # A small result set is cheaper to sort than to find along the index
+        if ids is not None and len(ids) * 8 < len(index):
+            key_of = index.key_of
+            if after is not None:
+                ids = [i for i in ids if is_past(key_of[i], i, after, reverse)]
+            return top_k(ids, key_of.__getitem__, offset + limit, reverse)[offset:]
+        walk = index.walk(reverse, after)
+        if ids is not None:
+            walk = (product_id for product_id in walk if product_id in ids)
+        return list(islice(walk, offset, offset + limit))
+
+
+def is_past(key: Any, item_id: int, after: Tuple[Any, int], reverse: bool) -> bool:
+    """Whether (key, item_id) comes after the cursor position `after`.
+
+    Keys run ascending or descending; equal keys always by ascending id.
+    """
+    after_key, after_id = after
+    if key == after_key:
+        return item_id > after_id
+    return key < after_key if reverse else key > after_key
+
+
+def top_k(
+    items: Iterable[Any],
+    key: Callable[[Any], Any],
+    k: int,
+    reverse: bool = False,
+    tie: Optional[Callable[[Any], Any]] = None
+) -> List[Any]:
+    """The first k items ordered by key, equal keys by ascending tie(item)
+    (the item itself by default), even when the keys run descending.
+
+    A small window finds the k-th key with a heap over the bare keys and
+    only sorts the items up to it; anything larger is sorted outright.
+    """
+    items = list(items)
+    if k <= 0:
+        return []
+    if k * TOP_K_RATIO <= len(items):
+        keys = list(map(key, items))
+        if reverse:
+            cut = heapq.nlargest(k, keys)[-1]
+            items = [item for item, item_key in zip(items, keys) if item_key >= cut]
+        else:
+            cut = heapq.nsmallest(k, keys)[-1]
+            items = [item for item, item_key in zip(items, keys) if item_key <= cut]
+    items.sort(key=tie)
+    items.sort(key=key, reverse=reverse)
+    return items[:k]
+
+
+def _discard(index: Dict[str, Set[int]], key: str, product_id: int):
+    ids = index.get(key)
+    if ids is not None:
+        ids.discard(product_id)
+        if not ids:
+            del index[key]
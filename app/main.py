@@ -1,5 +1,11 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from app.auth import session_store, token_cache
+from app.cache import ResponseCache, ResponseCacheMiddleware
+from app.db import db
+from app.hashing import hash_pool
+from app.ratelimit import RateLimiter, RateLimitMiddleware
+from app.singleflight import SingleFlight
 from app.routers import products, users, auth, carts, orders
 
 app = FastAPI(
@@ -9,6 +15,18 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
+# Cached catalog responses with ETags, identical concurrent misses
+# coalesced. Added before CORS so it sits inside it: cached bytes never
+# include per-origin CORS headers.
+response_cache = ResponseCache()
+read_flights = SingleFlight()
+app.add_middleware(ResponseCacheMiddleware, cache=response_cache, flights=read_flights)
+
+# Per-client request budgets, checked before the cache so cached reads
+# count too; inside CORS, so a 429 still carries the CORS headers
+rate_limiter = RateLimiter()
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+
 # CORS middleware - allow all origins for testing
 app.add_middleware(
     CORSMiddleware,
@@ -25,6 +43,11 @@ app.include_router(products.router, prefix="/products", tags=["Products"])
 app.include_router(carts.router, prefix="/carts", tags=["Carts"])
 app.include_router(orders.router, prefix="/orders", tags=["Orders"])
 
+@app.on_event("shutdown")
+async def shutdown():
+    # Flush the journal so no acknowledged write is lost on a clean stop
+    db.close()
+
 @app.get("/")
 async def root():
     return {
@@ -37,3 +60,15 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "ecommerce-api"}
+
+@app.get("/metrics")
+async def metrics():
+    # Counters of this worker process only
+    return {
+        "response_cache": response_cache.stats(),
+        "token_cache": token_cache.stats(),
+        "sessions": session_store.stats(),
+        "password_hashing": hash_pool.stats(),
+        "single_flight": read_flights.stats(),
+        "rate_limit": rate_limiter.stats(),
+    }
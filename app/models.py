@@ -31,6 +31,12 @@ class Product(ProductBase):
     id: int
     createdAt: str
 
+# Most ids one batch request (GET or POST /products/batch) may ask for
+MAX_BATCH_IDS = 100
+
+class ProductBatchRequest(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=MAX_BATCH_IDS)
+
 # User Models - Using str instead of EmailStr to avoid email-validator issues
 class UserBase(BaseModel):
     username: str
@@ -57,6 +63,10 @@ class UserInDB(User):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     username: Optional[str] = None
@@ -0,0 +1,43 @@
+# app/pagination.py
+import base64
+import hashlib
+import hmac
+import json
+from typing import Any, Tuple
+
+from app.auth import SECRET_KEY
+
+SIGNATURE_LENGTH = 8
+
+
+def _sign(payload: bytes) -> bytes:
+    return hmac.new(SECRET_KEY.encode(), payload, hashlib.sha256).digest()[:SIGNATURE_LENGTH]
+
+
+def encode_cursor(sort_by: str, sort_order: str, after: Tuple[Any, int]) -> str:
+    """Opaque token for the page that follows `after`, a (sort key, id) position.
+
+    The sort it was issued for is carried along and the token is signed, so
+    a cursor can only resume the listing it came from.
+    """
+    payload = json.dumps([sort_by, sort_order.lower(), after[0], after[1]], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(_sign(payload) + payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_by: str, sort_order: str) -> Tuple[Any, int]:
+    """The (sort key, id) position of a cursor.
+
+    Raises ValueError if the cursor is malformed, tampered with, or was
+    issued for a different sort.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    except (ValueError, TypeError):
+        raise ValueError("Malformed cursor")
+    signature, payload = raw[:SIGNATURE_LENGTH], raw[SIGNATURE_LENGTH:]
+    if not hmac.compare_digest(signature, _sign(payload)):
+        raise ValueError("Malformed cursor")
+    cursor_sort_by, cursor_sort_order, key, item_id = json.loads(payload)
+    if (cursor_sort_by, cursor_sort_order) != (sort_by, sort_order.lower()):
+        raise ValueError("Cursor was issued for a different sort order")
+    return key, item_id
@@ -0,0 +1,108 @@
+# app/planner.py
+"""
+Query plans for the product filters of the in-memory store
+
+Which filters a query sets - its shape - fixes the plan, so plans are
+built once per shape and cached. Run against the indexes, a plan sizes
+every access path the query offers (the category, tag and active-status
+id sets and the span of the sorted price index) and starts from the
+smallest. It narrows that by intersection with the remaining sets,
+smallest first, and tests a price range not used as the start in one
+pass over the survivors. Text search runs last, restricted to
+them.
+"""
+from functools import lru_cache
+from typing import Callable, List, NamedTuple, Optional, Set
+
+from app.indexes import ProductIndex
+from app.search import SearchIndex
+
+EMPTY: Set[int] = frozenset()
+
+
+class Shape(NamedTuple):
+    category: bool
+    tag: bool
+    is_active: Optional[bool]
+    min_price: bool
+    max_price: bool
+    search: bool
+
+
+def query_shape(
+    category: Optional[str],
+    min_price: Optional[float],
+    max_price: Optional[float],
+    tag: Optional[str],
+    search: Optional[str],
+    is_active: Optional[bool]
+) -> Shape:
+    return Shape(bool(category), bool(tag), is_active, min_price is not None, max_price is not None, bool(search))
+
+
+@lru_cache(maxsize=None)
+def plan_for(shape: Shape) -> "QueryPlan":
+    return QueryPlan(shape)
+
+
+def _price_filter(min_price: bool, max_price: bool) -> Callable:
+    """A set comprehension testing just the price bounds a shape sets."""
+    if min_price and max_price:
+        return lambda ids, key_of, low, high: {i for i in ids if low <= key_of[i] <= high}
+    if min_price:
+        return lambda ids, key_of, low, high: {i for i in ids if key_of[i] >= low}
+    return lambda ids, key_of, low, high: {i for i in ids if key_of[i] <= high}
+
+
+class QueryPlan:
+    """How to find the ids matching one shape of product filters."""
+
+    def __init__(self, shape: Shape):
+        self.shape = shape
+        self.price = shape.min_price or shape.max_price
+        self.price_filter = _price_filter(shape.min_price, shape.max_price) if self.price else None
+
+    def run(
+        self,
+        index: ProductIndex,
+        search_index: SearchIndex,
+        category: Optional[str],
+        min_price: Optional[float],
+        max_price: Optional[float],
+        tag: Optional[str],
+        search: Optional[str]
+    ) -> Optional[Set[int]]:
+        """Ids passing the filters, or None for every product.
+
+        The result may be one of the index's own sets; treat it as read-only.
+        """
+        shape = self.shape
+        sets: List[Set[int]] = []
+        if shape.category:
+            sets.append(index.by_category.get(category.lower(), EMPTY))
+        if shape.tag:
+            sets.append(index.by_tag.get(tag.lower(), EMPTY))
+        if shape.is_active is not None:
+            sets.append(index.active if shape.is_active else index.inactive)
+        sets.sort(key=len)
+
+        ids: Optional[Set[int]] = None
+        price_left = self.price
+        if self.price:
+            price_index = index.sorted["price"]
+            start, stop = price_index.span(min_price, max_price)
+            if not sets or stop - start < len(sets[0]):
+                ids = {product_id for _, product_id in price_index.entries.islice(start, stop)}
+                price_left = False
+        for other in sets:
+            if ids is None:
+                ids = other
+            elif not ids:
+                break
+            else:
+                ids = ids & other
+        if ids and price_left:
+            ids = self.price_filter(ids, price_index.key_of, min_price, max_price)
+        if shape.search:
+            ids = search_index.match(search, within=ids)
+        return ids
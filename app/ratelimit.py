@@ -0,0 +1,164 @@
+# app/ratelimit.py
+"""
+Per-client token-bucket rate limiting
+
+Every request is charged to a bucket of the first policy matching its
+method and path. Buckets are per client: the bearer token for a token
+get_current_user has already verified (it is in the token cache), the
+client IP otherwise. A token nobody has verified yet cannot buy a fresh
+bucket. An empty bucket answers 429 with Retry-After.
+
+A bucket is two floats. Buckets sit in least recently used order; one
+untouched long enough to have refilled is the same as no bucket, so the
+idle ones at the front are dropped as requests come in, and
+RATE_LIMIT_MAX_KEYS caps the total.
+
+Behind a proxy, the client IP is the one uvicorn takes from
+X-Forwarded-For, for peers listed in FORWARDED_ALLOW_IPS (run.py and the
+deploy configs turn proxy headers on); otherwise every client would share
+the proxy's bucket.
+"""
+import json
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Pattern, Tuple
+
+from app.auth import token_cache
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+
+# Buckets kept; past this the least recently used is dropped
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+
+class RatePolicy(NamedTuple):
+    name: str
+    methods: Tuple[str, ...]
+    path: Pattern
+    rate: float  # tokens added per second
+    burst: float  # bucket size
+
+
+def _limits(name: str, rate: float, burst: float) -> Tuple[float, float]:
+    # RATE_LIMIT_<NAME>="<rate per second>,<burst>" overrides the defaults
+    value = os.getenv(f"RATE_LIMIT_{name.upper()}")
+    if not value:
+        return rate, burst
+    rate, burst = value.split(",")
+    return float(rate), float(burst)
+
+
+# First match wins; the last policy matches everything
+POLICIES = (
+    # Every call runs a bcrypt hash
+    RatePolicy("login", ("POST",), re.compile(r"^/auth/(login|signup)$"), *_limits("login", 0.5, 30)),
+    # Searches, listings and suggestions scan indexes per call
+    RatePolicy("catalog", ("GET",), re.compile(r"^/products/(suggest)?$"), *_limits("catalog", 50, 200)),
+    RatePolicy("default", (), re.compile(""), *_limits("default", 100, 400)),
+)
+
+
+class RateLimiter:
+    """Token buckets per (policy, client), in least recently used order."""
+
+    def __init__(self, policies=POLICIES, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.policies = policies
+        self.by_name = {policy.name: policy for policy in policies}
+        self.max_keys = max_keys
+        # (policy name, client) -> [tokens, updated at]
+        self.buckets: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+        self.allowed: Dict[str, int] = {policy.name: 0 for policy in policies}
+        self.limited: Dict[str, int] = {policy.name: 0 for policy in policies}
+        self.evicted = 0
+
+    def policy_for(self, method: str, path: str) -> RatePolicy:
+        for policy in self.policies:
+            if (not policy.methods or method in policy.methods) and policy.path.match(path):
+                return policy
+        return self.policies[-1]
+
+    def take(self, policy: RatePolicy, client: str) -> Optional[float]:
+        """Spend one token of `client`'s bucket. Returns None, or the seconds
+        until a token is available when the bucket is empty."""
+        now = time.monotonic()
+        key = (policy.name, client)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [policy.burst, now]
+        else:
+            bucket[0] = min(policy.burst, bucket[0] + (now - bucket[1]) * policy.rate)
+            bucket[1] = now
+            self.buckets.move_to_end(key)
+        if bucket[0] < 1:
+            self.limited[policy.name] += 1
+            retry_after = (1 - bucket[0]) / policy.rate
+        else:
+            bucket[0] -= 1
+            self.allowed[policy.name] += 1
+            retry_after = None
+        # The bucket just used is last and not full, so it stays
+        self._evict(now)
+        return retry_after
+
+    def _evict(self, now: float):
+        buckets = self.buckets
+        while buckets:
+            (name, _), (tokens, updated) = next(iter(buckets.items()))
+            policy = self.by_name[name]
+            if len(buckets) <= self.max_keys and tokens + (now - updated) * policy.rate < policy.burst:
+                break
+            buckets.popitem(last=False)
+            self.evicted += 1
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": RATE_LIMIT_ENABLED,
+            "buckets": len(self.buckets),
+            "evicted": self.evicted,
+            "allowed": dict(self.allowed),
+            "limited": dict(self.limited),
+        }
+
+
+class RateLimitMiddleware:
+    """Answer 429 to requests over their client's budget; pass the rest through."""
+
+    def __init__(self, app, limiter: Optional[RateLimiter] = None):
+        self.app = app
+        self.limiter = limiter or RateLimiter()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        policy = self.limiter.policy_for(scope["method"], scope["path"])
+        retry_after = self.limiter.take(policy, client_key(scope))
+        if retry_after is None:
+            await self.app(scope, receive, send)
+            return
+        body = json.dumps({"detail": "Too many requests"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(math.ceil(retry_after)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def client_key(scope) -> str:
+    """The verified bearer token of a request, or else its client IP."""
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            token = value.decode("latin-1").partition(" ")[2]
+            if token in token_cache.entries:
+                return "token:" + token
+            break
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "")
@@ -0,0 +1,338 @@
+# app/records.py
+import sys
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import dataclass, fields
+from operator import attrgetter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class Record:
+    """Dict-style access to a slotted dataclass.
+
+    Records replace the per-row dicts of the in-memory store: the field
+    names live once on the class instead of in every row. They keep the
+    subset of the dict interface the routers use (record["price"], get,
+    update, keys, `**record`), so callers do not change.
+    """
+    __slots__ = ()
+
+    FIELDS = ()
+    _field_set = frozenset()
+    # Low-cardinality strings (categories, dates, statuses) shared by all rows
+    INTERNED = ()
+    # Fields that may hold None; an update setting any other to None is dropped
+    NULLABLE = ()
+
+    def __post_init__(self):
+        for name in self.INTERNED:
+            value = getattr(self, name)
+            if type(value) is str:
+                setattr(self, name, sys.intern(value))
+
+    @classmethod
+    def coerce(cls, data):
+        return data if isinstance(data, cls) else cls(**data)
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._field_set:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value: Any):
+        if key not in self._field_set:
+            raise KeyError(key)
+        if key in self.INTERNED and type(value) is str:
+            value = sys.intern(value)
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._field_set
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.FIELDS)
+
+    def __len__(self) -> int:
+        return len(self.FIELDS)
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            other = other.to_dict()
+        if not isinstance(other, dict):
+            return NotImplemented
+        return self.to_dict() == other
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in self._field_set else default
+
+    def keys(self):
+        return self.FIELDS
+
+    def update(self, changes: Dict[str, Any]):
+        for key, value in changes.items():
+            self[key] = value
+
+    @classmethod
+    def drop_nulls(cls, changes: Dict[str, Any]) -> Dict[str, Any]:
+        """`changes` without the None values of fields that cannot be None."""
+        return {key: value for key, value in changes.items() if value is not None or key in cls.NULLABLE}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(zip(self.FIELDS, self.values()))
+
+    def values(self) -> tuple:
+        return self._values(self)
+
+
+def record(cls):
+    """Turn `cls` into a slotted dataclass with the Record lookups wired up."""
+    cls = dataclass(slots=True, eq=False)(cls)
+    cls.FIELDS = tuple(f.name for f in fields(cls))
+    cls._field_set = frozenset(cls.FIELDS)
+    cls._values = attrgetter(*cls.FIELDS)
+    return cls
+
+
+@record
+class ProductRecord(Record):
+    INTERNED = ("category", "createdAt")
+    NULLABLE = ("description", "imageUrl")
+
+    id: int
+    name: str
+    price: float
+    category: str
+    stock: int
+    description: Optional[str]
+    imageUrl: Optional[str]
+    isActive: bool
+    tags: List[str]
+    rating: float
+    createdAt: str
+
+
+@record
+class CartRecord(Record):
+    INTERNED = ("status", "created_at")
+
+    id: int
+    user_id: int
+    items: List[Dict[str, Any]]
+    total_amount: float
+    status: str
+    created_at: str
+
+
+def encode_records(records: List[Record]) -> Dict[str, Any]:
+    """Marshal-friendly form of a record list: field names once, then tuples."""
+    fields = records[0].FIELDS if records else ()
+    return {"fields": fields, "rows": [r.values() for r in records]}
+
+
+def decode_records(cls, data) -> List[Record]:
+    if isinstance(data, list):
+        # Written before records existed: a list of dicts
+        return [cls(**row) for row in data]
+    if tuple(data["fields"]) == cls.FIELDS:
+        return [cls(*row) for row in data["rows"]]
+    names = data["fields"]
+    return [cls(**dict(zip(names, row))) for row in data["rows"]]
+
+
+class OrderTable:
+    """Orders stored column-wise.
+
+    Numeric fields live in typed arrays and strings in lists of shared
+    (interned) objects, so an order costs a few dozen bytes rather than a
+    dict per order plus one per line item. Line items are flattened into
+    their own columns; each order points at its run by offset and count.
+
+    Reads build a fresh dict for the order asked for, so callers see the
+    same shape as before, but changes must go through update().
+
+    Ordered walks use one array of row numbers per sort field, sorted by
+    (field, id), built the first time that order is asked for and kept up
+    to date after.
+    """
+
+    FIELDS = ("id", "user_id", "cart_id", "items", "total", "status",
+              "shipping_address", "payment_method", "created_at")
+    COLUMNS = {
+        "id": "q",
+        "user_id": "q",
+        "cart_id": "q",
+        "total": "d",
+        "status": None,
+        "shipping_address": None,
+        "payment_method": None,
+        "created_at": None,
+    }
+    ITEM_COLUMNS = {"product_id": "q", "quantity": "q", "price_at_purchase": "d"}
+
+    def __init__(self, orders: Iterable[Dict[str, Any]] = ()):
+        self.columns = {name: array(code) if code else [] for name, code in self.COLUMNS.items()}
+        self.item_columns = {name: array(code) for name, code in self.ITEM_COLUMNS.items()}
+        self.item_start = array("q")
+        self.item_count = array("I")
+        # Row of each order id (ids are dense counters); -1 marks a gap
+        self.positions = array("q")
+        self.sort_orders: Dict[str, array] = {}
+        for order in orders:
+            self.append(order)
+
+    def __len__(self) -> int:
+        return len(self.item_start)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return (self.row(position) for position in range(len(self)))
+
+    def append(self, order: Dict[str, Any]):
+        position = len(self)
+        for name, column in self.columns.items():
+            value = order[name]
+            column.append(sys.intern(value) if type(value) is str else value)
+        items = order["items"]
+        self.item_start.append(self._store_items(items))
+        self.item_count.append(len(items))
+        self._place(order["id"], position)
+        for name, order_rows in self.sort_orders.items():
+            insort(order_rows, position, key=self._sort_key(name))
+
+    def _store_items(self, items: List[Dict[str, Any]]) -> int:
+        """Append line items to the item columns; returns where they start."""
+        start = len(self.item_columns["product_id"])
+        for item in items:
+            for name, column in self.item_columns.items():
+                column.append(item[name])
+        return start
+
+    def _place(self, order_id: int, position: int):
+        missing = order_id + 1 - len(self.positions)
+        if missing > 0:
+            self.positions.extend([-1] * missing)
+        self.positions[order_id] = position
+
+    def position(self, order_id: int) -> Optional[int]:
+        if 0 <= order_id < len(self.positions):
+            position = self.positions[order_id]
+            if position >= 0:
+                return position
+        return None
+
+    def get(self, order_id: int) -> Optional[Dict[str, Any]]:
+        position = self.position(order_id)
+        return None if position is None else self.row(position)
+
+    def row(self, position: int) -> Dict[str, Any]:
+        columns = self.columns
+        return {name: self.items(position) if name == "items" else columns[name][position]
+                for name in self.FIELDS}
+
+    def items(self, position: int) -> List[Dict[str, Any]]:
+        start = self.item_start[position]
+        columns = self.item_columns
+        return [{name: column[i] for name, column in columns.items()}
+                for i in range(start, start + self.item_count[position])]
+
+    def update(self, order_id: int, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        position = self.position(order_id)
+        if position is None:
+            return None
+        # Check every value first: a row leaves its sort orders only once
+        # its new key is known to fit the column and compare with the rest
+        for name, value in changes.items():
+            if name == "items":
+                continue
+            column = self.columns.get(name)
+            if column is None:
+                raise KeyError(name)
+            try:
+                if isinstance(column, array):
+                    array(column.typecode, [value])
+                value < column[position]
+            except TypeError:
+                raise ValueError(f"Order {name} cannot be {value!r}") from None
+        for name, value in changes.items():
+            if name == "items":
+                # Line items are append-only; the order points at the new run
+                self.item_start[position] = self._store_items(value)
+                self.item_count[position] = len(value)
+            else:
+                order_rows = self.sort_orders.get(name)
+                if order_rows is not None:
+                    key = self._sort_key(name)
+                    del order_rows[bisect_left(order_rows, key(position), key=key)]
+                self.columns[name][position] = sys.intern(value) if type(value) is str else value
+                if order_rows is not None:
+                    insort(order_rows, position, key=key)
+        return self.row(position)
+
+    def _sort_key(self, sort_by: str) -> Callable[[int], Tuple[Any, int]]:
+        column, ids = self.columns[sort_by], self.columns["id"]
+        return lambda row: (column[row], ids[row])
+
+    def sorted_rows(self, sort_by: str) -> array:
+        """Rows ordered by (sort_by, id)."""
+        order_rows = self.sort_orders.get(sort_by)
+        if order_rows is None:
+            order_rows = array("q", sorted(range(len(self)), key=self._sort_key(sort_by)))
+            self.sort_orders[sort_by] = order_rows
+        return order_rows
+
+    def walk(self, sort_by: str, reverse: bool = False, after: Optional[Tuple[Any, int]] = None) -> Iterator[int]:
+        """Yield rows in `sort_by` order.
+
+        Descending walks keep equal keys in ascending id order. `after` is
+        a (key, id) position to resume just past, found by bisection.
+        """
+        order_rows = self.sorted_rows(sort_by)
+        key = self._sort_key(sort_by)
+        if not reverse:
+            start = 0 if after is None else bisect_right(order_rows, after, key=key)
+            for i in range(start, len(order_rows)):
+                yield order_rows[i]
+            return
+        column = self.columns[sort_by]
+        stop = len(order_rows)
+        if after is not None:
+            # Rest of the tie group `after` sits in, then the lower keys
+            stop = bisect_left(order_rows, (after[0],), key=key)
+            end = bisect_right(order_rows, (after[0], float("inf")), key=key)
+            for i in range(bisect_right(order_rows, after, key=key), end):
+                yield order_rows[i]
+        while stop > 0:
+            start = bisect_left(order_rows, (column[order_rows[stop - 1]],), 0, stop, key=key)
+            for i in range(start, stop):
+                yield order_rows[i]
+            stop = start
+
+    def dump(self) -> Dict[str, Any]:
+        """Marshal-friendly form: arrays as raw bytes, strings as lists."""
+        def pack(column):
+            return column.tobytes() if isinstance(column, array) else column
+        return {
+            "columns": {name: pack(column) for name, column in self.columns.items()},
+            "items": {name: pack(column) for name, column in self.item_columns.items()},
+            "item_start": self.item_start.tobytes(),
+            "item_count": self.item_count.tobytes(),
+        }
+
+    @classmethod
+    def load(cls, data) -> "OrderTable":
+        if isinstance(data, list):
+            # Written before the columnar layout: a list of dicts
+            return cls(data)
+        table = cls()
+        for name, column in table.columns.items():
+            value = data["columns"][name]
+            if isinstance(column, array):
+                column.frombytes(value)
+            else:
+                column.extend(value)
+        for name, column in table.item_columns.items():
+            column.frombytes(data["items"][name])
+        table.item_start.frombytes(data["item_start"])
+        table.item_count.frombytes(data["item_count"])
+        for position, order_id in enumerate(table.columns["id"]):
+            table._place(order_id, position)
+        return table
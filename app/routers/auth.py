@@ -1,47 +1,48 @@
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import jwt
 from app.auth import (
     authenticate_user, create_access_token, 
     ACCESS_TOKEN_EXPIRE_MINUTES, get_password_hash,
-    get_current_active_user, require_admin
+    get_current_active_user, require_admin,
+    revoke_sessions, security, session_store
 )
-from app.db import db
-from app.models import UserCreate, User, Token, LoginRequest
+from app.hashing import hash_pool
+from app.db import db, run_db
+from app.errors import DuplicateUserError
+from app.models import UserCreate, User, Token, LoginRequest, RefreshRequest
 
 router = APIRouter()
 
 @router.post("/signup", response_model=User)
 async def signup(user_data: UserCreate):
-    # Check if user already exists
-    for user in db.users:
-        if user["username"] == user_data.username:
-            raise HTTPException(
-                status_code=400,
-                detail="Username already registered"
-            )
-        if user["email"] == user_data.email:
-            raise HTTPException(
-                status_code=400,
-                detail="Email already registered"
-            )
-    
-    # Create new user
+    # Taken names are turned away before they cost a bcrypt hash and a user
+    # id. A concurrent signup can still take one after this: the store
+    # checks again as it inserts, in one step.
+    if await run_db(db.get_user_by_username, user_data.username):
+        raise HTTPException(status_code=400, detail="Username already registered")
+    if await run_db(db.get_user_by_email, user_data.email):
+        raise HTTPException(status_code=400, detail="Email already registered")
+    hashed_password = await hash_pool.run(get_password_hash, user_data.password)
     new_user = {
-        "id": db.get_next_user_id(),
+        "id": await run_db(db.get_next_user_id),
         "username": user_data.username,
         "email": user_data.email,
-        "hashed_password": get_password_hash(user_data.password),
+        "hashed_password": hashed_password,
         "role": user_data.role,
         "is_active": True,
         "created_at": "2024-01-15"
     }
-    
-    db.users.append(new_user)
+    try:
+        await run_db(db.add_user, new_user)
+    except DuplicateUserError as e:
+        raise HTTPException(status_code=400, detail=f"{e.field.capitalize()} already registered")
     return User(**{k: v for k, v in new_user.items() if k != "hashed_password"})
 
 @router.post("/login", response_model=Token)
 async def login(form_data: LoginRequest):
-    user = authenticate_user(form_data.username, form_data.password)
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -49,13 +50,46 @@ async def login(form_data: LoginRequest):
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    session_id, refresh_token = await run_db(session_store.create, user.id)
+    return _tokens(user, session_id, refresh_token)
+
+@router.post("/refresh", response_model=Token)
+async def refresh(request: RefreshRequest):
+    # A new access token for a live session; no password check involved
+    invalid_token = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid or expired refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    rotated = await run_db(session_store.refresh, request.refresh_token)
+    if rotated is None:
+        raise invalid_token
+    session_id, user_id, refresh_token = rotated
+    user = await run_db(db.get_user, user_id)
+    if not user or not user["is_active"]:
+        await revoke_sessions(user_id, session_id)
+        raise invalid_token
+    return _tokens(User(**user), session_id, refresh_token)
+
+@router.post("/logout")
+async def logout(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: User = Depends(get_current_active_user)
+):
+    # Ends the session the access token belongs to, refresh token included
+    session_id = jwt.get_unverified_claims(credentials.credentials).get("sid")
+    if session_id is not None:
+        await revoke_sessions(current_user.id, session_id)
+    return {"message": "Logged out successfully"}
+
+def _tokens(user: User, session_id: str, refresh_token: str) -> dict:
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username, "role": user.role},
+        data={"sub": user.username, "role": user.role, "sid": session_id},
         expires_delta=access_token_expires
     )
     
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
 
 @router.get("/me", response_model=User)
 async def read_users_me(current_user: User = Depends(get_current_active_user)):
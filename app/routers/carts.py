@@ -2,7 +2,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from typing import List
 from app.auth import get_current_active_user
-from app.db import db
+from app.db import db, run_db
 from app.models import Cart, CartCreate, CartItemCreate, User
 
 router = APIRouter()
@@ -10,22 +10,17 @@ router = APIRouter()
 
 @router.get("/", response_model=List[Cart])
 async def get_user_carts(current_user: User = Depends(get_current_active_user)):
-    user_carts = []
-    for cart in db.carts:
-        if cart["user_id"] == current_user.id:
-            user_carts.append(cart)
-    return user_carts
+    return await run_db(db.get_user_carts, current_user.id)
 
 
 @router.get("/{cart_id}", response_model=Cart)
 async def get_cart(cart_id: int, current_user: User = Depends(get_current_active_user)):
-    for cart in db.carts:
-        if cart["id"] == cart_id:
-            if cart["user_id"] != current_user.id and current_user.role != "admin":
-                raise HTTPException(status_code=403, detail="Not enough permissions")
-            return Cart(**cart)
-
-    raise HTTPException(status_code=404, detail="Cart not found")
+    cart = await run_db(db.get_cart, cart_id)
+    if not cart:
+        raise HTTPException(status_code=404, detail="Cart not found")
+    if cart["user_id"] != current_user.id and current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return Cart(**cart)
 
 
 @router.post("/", response_model=Cart)
@@ -35,13 +30,9 @@ async def create_cart(cart_data: CartCreate, current_user: User = Depends(get_cu
     total_amount = 0
 
     for item in cart_data.items:
-        product = None
-        for p in db.products:
-            if p["id"] == item.product_id and p["isActive"]:
-                product = p
-                break
+        product = await run_db(db.get_product, item.product_id)
 
-        if not product:
+        if not product or not product["isActive"]:
             raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found or inactive")
 
         if product["stock"] < item.quantity:
@@ -56,7 +47,7 @@ async def create_cart(cart_data: CartCreate, current_user: User = Depends(get_cu
         total_amount += item_total
 
     new_cart = {
-        "id": db.get_next_cart_id(),
+        "id": await run_db(db.get_next_cart_id),
         "user_id": current_user.id,
         "items": items,
         "total_amount": total_amount,
@@ -64,7 +55,7 @@ async def create_cart(cart_data: CartCreate, current_user: User = Depends(get_cu
         "created_at": "2024-01-15"
     }
 
-    db.carts.append(new_cart)
+    await run_db(db.add_cart, new_cart)
     return Cart(**new_cart)
 
 
@@ -75,27 +66,17 @@ async def add_to_cart(
         current_user: User = Depends(get_current_active_user)
 ):
     # Find cart
-    cart = None
-    cart_index = -1
-    for i, c in enumerate(db.carts):
-        if c["id"] == cart_id:
-            if c["user_id"] != current_user.id:
-                raise HTTPException(status_code=403, detail="Not enough permissions")
-            cart = c
-            cart_index = i
-            break
+    cart = await run_db(db.get_cart, cart_id)
+    if cart and cart["user_id"] != current_user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
 
     if not cart or cart["status"] != "active":
         raise HTTPException(status_code=404, detail="Cart not found or inactive")
 
     # Find product
-    product = None
-    for p in db.products:
-        if p["id"] == item_data.product_id and p["isActive"]:
-            product = p
-            break
+    product = await run_db(db.get_product, item_data.product_id)
 
-    if not product:
+    if not product or not product["isActive"]:
         raise HTTPException(status_code=404, detail="Product not found or inactive")
 
     if product["stock"] < item_data.quantity:
@@ -121,23 +102,20 @@ async def add_to_cart(
     for item in cart["items"]:
         total_amount += item["price"] * item["quantity"]
 
-    cart["total_amount"] = total_amount
-
     # Update cart in database
-    db.carts[cart_index] = cart
+    cart = await run_db(db.update_cart, cart_id, {"items": cart["items"], "total_amount": total_amount})
 
     return Cart(**cart)
 
 
 @router.delete("/{cart_id}", response_model=dict)
 async def delete_cart(cart_id: int, current_user: User = Depends(get_current_active_user)):
-    for i, cart in enumerate(db.carts):
-        if cart["id"] == cart_id:
-            if cart["user_id"] != current_user.id and current_user.role != "admin":
-                raise HTTPException(status_code=403, detail="Not enough permissions")
-
-            # Mark cart as cancelled
-            db.carts[i]["status"] = "cancelled"
-            return {"message": "Cart cancelled successfully"}
-
-    raise HTTPException(status_code=404, detail="Cart not found")
\ No newline at end of file
+    cart = await run_db(db.get_cart, cart_id)
+    if not cart:
+        raise HTTPException(status_code=404, detail="Cart not found")
+    if cart["user_id"] != current_user.id and current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    # Mark cart as cancelled
+    await run_db(db.update_cart, cart_id, {"status": "cancelled"})
+    return {"message": "Cart cancelled successfully"}
\ No newline at end of file
@@ -2,8 +2,12 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import List, Optional
 from app.auth import get_current_active_user, require_admin
-from app.db import db
+from app.bulk import export_response
+from app.db import db, run_db
+from app.errors import OrderConflictError
 from app.models import Order, OrderCreate, OrderUpdate, User
+from app.pagination import decode_cursor, encode_cursor
+from app.records import OrderTable
 from app.schemas import OrderQueryParams, PaginatedResponse
 
 router = APIRouter()
@@ -14,29 +18,29 @@ async def get_orders(
         status: Optional[str] = None,
         sort_by: str = "created_at",
         sort_order: str = "desc",
-        page: int = 1,
-        limit: int = 10,
+        page: int = Query(1, ge=1),
+        limit: int = Query(10, ge=1, le=100),
+        cursor: Optional[str] = None,
         current_user: User = Depends(get_current_active_user)
 ):
-    # Filter orders based on user role
-    if current_user.role == "admin":
-        orders = db.orders.copy()
-    else:
-        orders = [o for o in db.orders if o["user_id"] == current_user.id]
-
-    # Apply status filter
-    if status:
-        orders = [o for o in orders if o["status"] == status]
-
-    # Apply sorting
-    reverse = sort_order.lower() == "desc"
-    orders.sort(key=lambda x: x.get(sort_by, ""), reverse=reverse)
-
-    # Apply pagination
-    total = len(orders)
-    start_idx = (page - 1) * limit
-    end_idx = start_idx + limit
-    paginated_orders = orders[start_idx:end_idx]
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor, sort_by, sort_order)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
+    # Filter orders based on user role, then by status, sort and paginate
+    total, paginated_orders, next_after = await run_db(
+        db.query_orders,
+        user_id=None if current_user.role == "admin" else current_user.id,
+        status=status,
+        sort_by=sort_by,
+        sort_order=sort_order,
+        offset=0 if after else (page - 1) * limit,
+        limit=limit,
+        after=after
+    )
 
     total_pages = (total + limit - 1) // limit
 
@@ -45,22 +49,28 @@ async def get_orders(
         total=total,
         page=page,
         limit=limit,
-        total_pages=total_pages
+        total_pages=total_pages,
+        next_cursor=encode_cursor(sort_by, sort_order, next_after) if next_after else None
     )
 
 
+@router.get("/export", dependencies=[Depends(require_admin)])
+async def export_orders(format: str = "ndjson", gzip: bool = False):
+    # Every order in id order; items are a JSON cell in CSV
+    return export_response("orders", db.export_orders, OrderTable.FIELDS, format, gzip)
+
+
 @router.get("/{order_id}", response_model=Order)
 async def get_order(
         order_id: int,
         current_user: User = Depends(get_current_active_user)
 ):
-    for order in db.orders:
-        if order["id"] == order_id:
-            if order["user_id"] != current_user.id and current_user.role != "admin":
-                raise HTTPException(status_code=403, detail="Not enough permissions")
-            return Order(**order)
-
-    raise HTTPException(status_code=404, detail="Order not found")
+    order = await run_db(db.get_order, order_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if order["user_id"] != current_user.id and current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return Order(**order)
 
 
 @router.post("/", response_model=Order)
@@ -69,51 +79,30 @@ async def create_order(
         current_user: User = Depends(get_current_active_user)
 ):
     # Find cart
-    cart = None
-    for c in db.carts:
-        if c["id"] == order_data.cart_id and c["user_id"] == current_user.id:
-            cart = c
-            break
-
-    if not cart or cart["status"] != "active":
-        raise HTTPException(status_code=404, detail="Cart not found or inactive")
-
-    # Validate stock
-    for item in cart["items"]:
-        for product in db.products:
-            if product["id"] == item["product_id"]:
-                if product["stock"] < item["quantity"]:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Insufficient stock for product {product['name']}"
-                    )
-                break
-
-    # Reduce stock
-    for item in cart["items"]:
-        for i, product in enumerate(db.products):
-            if product["id"] == item["product_id"]:
-                db.products[i]["stock"] -= item["quantity"]
-                break
-
-    # Create order items with price at purchase
-    order_items = []
-    for item in cart["items"]:
-        # Find current price
-        current_price = item["price"]
-        for product in db.products:
-            if product["id"] == item["product_id"]:
-                current_price = product["price"]
-                break
-
-        order_items.append({
+    cart = await run_db(db.get_cart, order_data.cart_id)
+    if cart and cart["user_id"] != current_user.id:
+        cart = None
+
+    if not cart:
+        raise HTTPException(status_code=404, detail="Cart not found")
+    # 409 like the store's own check below, which a concurrent order of
+    # this cart may trip after this one passes
+    if cart["status"] != "active":
+        raise HTTPException(status_code=409, detail="Cart is not active")
+
+    # Items at the cart's prices; the store reprices them at the current
+    # product prices as it takes the stock
+    order_items = [
+        {
             "product_id": item["product_id"],
             "quantity": item["quantity"],
-            "price_at_purchase": current_price
-        })
+            "price_at_purchase": item["price"]
+        }
+        for item in cart["items"]
+    ]
 
     new_order = {
-        "id": db.get_next_order_id(),
+        "id": await run_db(db.get_next_order_id),
         "user_id": current_user.id,
         "cart_id": order_data.cart_id,
         "items": order_items,
@@ -124,13 +113,12 @@ async def create_order(
         "created_at": "2024-01-15"
     }
 
-    # Update cart status
-    for i, c in enumerate(db.carts):
-        if c["id"] == order_data.cart_id:
-            db.carts[i]["status"] = "completed"
-            break
-
-    db.orders.append(new_order)
+    # Stock check and decrement, cart completion and the insert happen in
+    # one store call, so concurrent orders cannot oversell or reuse the cart
+    try:
+        await run_db(db.place_order, new_order)
+    except OrderConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     return Order(**new_order)
 
 
@@ -140,33 +128,18 @@ async def update_order_status(
         status_update: OrderUpdate,
         current_user: User = Depends(require_admin)
 ):
-    update_data = status_update.dict(exclude_unset=True)
-
-    for i, order in enumerate(db.orders):
-        if order["id"] == order_id:
-
-            # Update all fields dynamically
-            for key, value in update_data.items():
-                db.orders[i][key] = value
+    # Neither field can be cleared; a null leaves it as it is
+    update_data = {k: v for k, v in status_update.dict(exclude_unset=True).items() if v is not None}
 
-            return Order(**db.orders[i])
+    # Update all fields dynamically
+    order = await run_db(db.update_order, order_id, update_data)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
 
-    raise HTTPException(status_code=404, detail="Order not found")
+    return Order(**order)
 
 
 
 @router.get("/stats/summary")
 async def get_order_stats(current_user: User = Depends(require_admin)):
-    total_orders = len(db.orders)
-    total_revenue = sum(order["total"] for order in db.orders)
-
-    status_counts = {}
-    for order in db.orders:
-        status = order["status"]
-        status_counts[status] = status_counts.get(status, 0) + 1
-
-    return {
-        "total_orders": total_orders,
-        "total_revenue": total_revenue,
-        "status_counts": status_counts
-    }
\ No newline at end of file
+    return await run_db(db.order_stats)
\ No newline at end of file
@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import JSONResponse
 from typing import List, Optional
 from app.auth import require_admin
-from app.db import db
-from app.models import Product, ProductCreate, ProductUpdate
+from app.bulk import IMPORT_FORMATS, NDJSON_MEDIA_TYPE, ImportResponse, export_response, import_products
+from app.db import db, run_db
+from app.models import MAX_BATCH_IDS, Product, ProductBatchRequest, ProductCreate, ProductUpdate
+from app.pagination import decode_cursor, encode_cursor
+from app.records import ProductRecord
 from app.schemas import PaginatedResponse
+from app.suggest import MAX_SUGGEST_LIMIT, SUGGEST_LIMIT
 
 router = APIRouter()
 
@@ -19,41 +24,33 @@ async def get_products(
     sort_by: str = "id",
     sort_order: str = "asc",
     page: int = Query(1, ge=1),
-    limit: int = Query(10, ge=1, le=100)
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None
 ):
-    products = db.products.copy()
-
-    # Filtering
-    if category:
-        products = [p for p in products if p["category"].lower() == category.lower()]
-    if min_price is not None:
-        products = [p for p in products if p["price"] >= min_price]
-    if max_price is not None:
-        products = [p for p in products if p["price"] <= max_price]
-    if tag:
-        products = [p for p in products if tag.lower() in [t.lower() for t in p.get("tags", [])]]
-    if search:
-        search_lower = search.lower()
-        products = [p for p in products if search_lower in p["name"].lower() or search_lower in p.get("description", "").lower()]
-    if is_active is not None:
-        products = [p for p in products if p["isActive"] == is_active]
-
-    # Sorting
-    reverse = sort_order.lower() == "desc"
-    if sort_by == "price":
-        products.sort(key=lambda x: x["price"], reverse=reverse)
-    elif sort_by == "rating":
-        products.sort(key=lambda x: x.get("rating", 0), reverse=reverse)
-    elif sort_by == "name":
-        products.sort(key=lambda x: x["name"].lower(), reverse=reverse)
-    else:
-        products.sort(key=lambda x: x["id"], reverse=reverse)
-
-    # Pagination
-    total = len(products)
-    start_idx = (page - 1) * limit
-    end_idx = start_idx + limit
-    paginated_products = products[start_idx:end_idx] if start_idx < total else []
+    # A cursor (from next_cursor) resumes right after the previous page;
+    # `page` is then only echoed back
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor, sort_by, sort_order)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
+    total, paginated_products, next_after = await run_db(
+        db.query_products,
+        category=category,
+        min_price=min_price,
+        max_price=max_price,
+        tag=tag,
+        search=search,
+        is_active=is_active,
+        sort_by=sort_by,
+        sort_order=sort_order,
+        offset=0 if after else (page - 1) * limit,
+        limit=limit,
+        after=after
+    )
+
     total_pages = (total + limit - 1) // limit if total > 0 else 1
 
     return PaginatedResponse(
@@ -61,56 +58,131 @@ async def get_products(
         total=total,
         page=page,
         limit=limit,
-        total_pages=total_pages
+        total_pages=total_pages,
+        next_cursor=encode_cursor(sort_by, sort_order, next_after) if next_after else None
     )
 
 
 @router.get("/categories")
 async def get_categories():
-    categories = {p["category"] for p in db.products if p["isActive"]}
-    return {"categories": list(categories)}
+    categories = await run_db(db.list_categories)
+    return {"categories": categories}
+
+
+@router.get("/facets")
+async def get_product_facets(
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    tag: Optional[str] = None,
+    search: Optional[str] = None,
+    is_active: Optional[bool] = True
+):
+    # Counts per category, tag and price bucket over the products that
+    # GET /products/ would list with the same filters
+    return await run_db(
+        db.query_facets,
+        category=category,
+        min_price=min_price,
+        max_price=max_price,
+        tag=tag,
+        search=search,
+        is_active=is_active
+    )
+
+
+@router.get("/suggest")
+async def suggest_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(SUGGEST_LIMIT, ge=1, le=MAX_SUGGEST_LIMIT),
+    fuzzy: bool = True
+):
+    # Autocomplete for the search box: active products whose name or tag
+    # words start with what was typed (or nearly do, with fuzzy), as
+    # {"id", "name", "score"} only
+    suggestions = await run_db(db.suggest_products, q, limit, fuzzy)
+    return JSONResponse({"query": q, "suggestions": suggestions})
+
+
+@router.get("/batch")
+async def get_products_batch(ids: str = Query(..., description="Comma-separated product ids")):
+    try:
+        product_ids = [int(product_id) for product_id in ids.split(",") if product_id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    if not product_ids or len(product_ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"Between 1 and {MAX_BATCH_IDS} ids are allowed")
+    return await _product_batch(product_ids)
+
+
+@router.post("/batch")
+async def post_products_batch(request: ProductBatchRequest):
+    return await _product_batch(request.ids)
+
+
+async def _product_batch(product_ids: List[int]) -> JSONResponse:
+    # One lookup for all ids; results keep the request order, with a
+    # marker where GET /products/{id} would have answered 404. The body is
+    # encoded in one go instead of validating a Product per item.
+    products = await run_db(db.get_products, product_ids)
+    items, missing = [], []
+    for product_id, product in zip(product_ids, products):
+        if product is None or not product["isActive"]:
+            items.append({"id": product_id, "error": "Product not found"})
+            missing.append(product_id)
+        else:
+            items.append(dict(product))
+    return JSONResponse({"items": items, "missing": missing})
+
+
+@router.get("/export", dependencies=[Depends(require_admin)])
+async def export_products(format: str = "ndjson", gzip: bool = False):
+    # Every product, active or not, in id order; CSV comes back in the
+    # layout POST /products/import reads
+    return export_response("products", db.export_products, ProductRecord.FIELDS, format, gzip)
 
 
 @router.get("/{product_id}", response_model=Product)
 async def get_product(product_id: int):
-    for product in db.products:
-        if product["id"] == product_id:
-            if not product["isActive"]:
-                raise HTTPException(status_code=404, detail="Product not found")
-            return Product(**product)
-    raise HTTPException(status_code=404, detail="Product not found")
+    product = await run_db(db.get_product, product_id)
+    if not product or not product["isActive"]:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return Product(**product)
 
 
-# Fixed POST route
-# AFTER
 @router.post("/", response_model=Product, dependencies=[Depends(require_admin)], status_code=201)
 async def create_product(product_data: ProductCreate):
     new_product = {
-        "id": db.get_next_product_id(),
+        "id": await run_db(db.get_next_product_id),
         **product_data.dict(),
         "createdAt": "2024-01-15"
     }
-    db.products.append(new_product)
+    await run_db(db.add_product, new_product)
     return Product(**new_product)
 
 
+@router.post("/import", dependencies=[Depends(require_admin)])
+async def bulk_import_products(request: Request, format: Optional[str] = None):
+    # NDJSON or CSV by ?format=, else by Content-Type; results stream back
+    # as NDJSON while the body is still being read
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(IMPORT_FORMATS)}")
+    return ImportResponse(import_products(request.stream(), format), media_type=NDJSON_MEDIA_TYPE)
 
 
 @router.put("/{product_id}", response_model=Product, dependencies=[Depends(require_admin)])
 async def update_product(product_id: int, product_update: ProductUpdate):
-    for i, product in enumerate(db.products):
-        if product["id"] == product_id:
-            update_data = product_update.dict(exclude_unset=True)
-            db.products[i].update(update_data)
-            return Product(**db.products[i])
-    raise HTTPException(status_code=404, detail="Product not found")
+    update_data = product_update.dict(exclude_unset=True)
+    product = await run_db(db.update_product, product_id, update_data)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return Product(**product)
 
 
 @router.delete("/{product_id}", dependencies=[Depends(require_admin)])
 async def delete_product(product_id: int):
-    for i, product in enumerate(db.products):
-        if product["id"] == product_id:
-
-            db.products[i]["isActive"] = False
-            return {"message": "Product deactivated successfully"}
-    raise HTTPException(status_code=404, detail="Product not found")
+    if not await run_db(db.update_product, product_id, {"isActive": False}):
+        raise HTTPException(status_code=404, detail="Product not found")
+    return {"message": "Product deactivated successfully"}
@@ -1,8 +1,10 @@
 # app/routers/users.py
 from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import List, Optional
-from app.auth import get_current_active_user, require_admin
-from app.db import db
+from app.auth import get_current_active_user, require_admin, revoke_sessions, token_cache
+from app.db import db, run_db
+from app.errors import DuplicateUserError
+from app.hashing import hash_pool
 from app.models import User, UserUpdate, UserCreate
 
 router = APIRouter()
@@ -15,18 +17,8 @@ async def get_all_users(
         role: Optional[str] = None,
         is_active: Optional[bool] = None
 ):
-    users = db.users
-
-    # Filter by role
-    if role:
-        users = [u for u in users if u["role"] == role]
-
-    # Filter by active status
-    if is_active is not None:
-        users = [u for u in users if u["is_active"] == is_active]
-
-    # Apply pagination
-    users = users[skip:skip + limit]
+    # Filter by role and active status, then paginate
+    users = await run_db(db.query_users, role=role, is_active=is_active, skip=skip, limit=limit)
 
     # Remove hashed_password from response
     return [{k: v for k, v in u.items() if k != "hashed_password"} for u in users]
@@ -41,11 +33,10 @@ async def get_user(
     if current_user.role != "admin" and current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    for user in db.users:
-        if user["id"] == user_id:
-            return User(**{k: v for k, v in user.items() if k != "hashed_password"})
-
-    raise HTTPException(status_code=404, detail="User not found")
+    user = await run_db(db.get_user, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return User(**{k: v for k, v in user.items() if k != "hashed_password"})
 
 
 @router.put("/{user_id}", response_model=User)
@@ -58,40 +49,46 @@ async def update_user(
     if current_user.role != "admin" and current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    for i, user in enumerate(db.users):
-        if user["id"] == user_id:
-            update_data = user_update.dict(exclude_unset=True)
+    if not await run_db(db.get_user, user_id):
+        raise HTTPException(status_code=404, detail="User not found")
 
-            # Check for duplicate username/email
-            if "username" in update_data:
-                for u in db.users:
-                    if u["id"] != user_id and u["username"] == update_data["username"]:
-                        raise HTTPException(status_code=400, detail="Username already exists")
+    update_data = user_update.dict(exclude_unset=True)
 
-            if "email" in update_data:
-                for u in db.users:
-                    if u["id"] != user_id and u["email"] == update_data["email"]:
-                        raise HTTPException(status_code=400, detail="Email already exists")
+    # Check for duplicate username/email
+    if "username" in update_data:
+        existing = await run_db(db.get_user_by_username, update_data["username"])
+        if existing and existing["id"] != user_id:
+            raise HTTPException(status_code=400, detail="Username already exists")
 
-            # Hash password if provided
-            if "password" in update_data:
-                from app.auth import get_password_hash
-                update_data["hashed_password"] = get_password_hash(update_data.pop("password"))
+    if "email" in update_data:
+        existing = await run_db(db.get_user_by_email, update_data["email"])
+        if existing and existing["id"] != user_id:
+            raise HTTPException(status_code=400, detail="Email already exists")
 
-            # Update user
-            db.users[i].update(update_data)
+    # Hash password if provided
+    if "password" in update_data:
+        from app.auth import get_password_hash
+        update_data["hashed_password"] = await hash_pool.run(get_password_hash, update_data.pop("password"))
 
-            return User(**{k: v for k, v in db.users[i].items() if k != "hashed_password"})
+    # Update user; tokens cached with the old details resolve again, and a
+    # new password signs every session out. The store rejects a username or
+    # email taken since the checks above.
+    try:
+        user = await run_db(db.update_user, user_id, update_data)
+    except DuplicateUserError as e:
+        raise HTTPException(status_code=400, detail=f"{e.field.capitalize()} already exists")
+    if "hashed_password" in update_data:
+        await revoke_sessions(user_id)
+    else:
+        token_cache.invalidate_user(user_id)
 
-    raise HTTPException(status_code=404, detail="User not found")
+    return User(**{k: v for k, v in user.items() if k != "hashed_password"})
 
 
 @router.delete("/{user_id}", dependencies=[Depends(require_admin)])
 async def delete_user(user_id: int):
-    for i, user in enumerate(db.users):
-        if user["id"] == user_id:
-            # Soft delete - set is_active to False
-            db.users[i]["is_active"] = False
-            return {"message": "User deactivated successfully"}
-
-    raise HTTPException(status_code=404, detail="User not found")
\ No newline at end of file
+    # Soft delete - set is_active to False
+    if not await run_db(db.update_user, user_id, {"is_active": False}):
+        raise HTTPException(status_code=404, detail="User not found")
+    await revoke_sessions(user_id)
+    return {"message": "User deactivated successfully"}
\ No newline at end of file
@@ -28,3 +28,5 @@ class PaginatedResponse(BaseModel):
     page: int
     limit: int
     total_pages: int
+    # Pass back as `cursor` to get the next page; None on the last page
+    next_cursor: Optional[str] = None
@@ -0,0 +1,152 @@
+# app/search.py
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from app.indexes import SortedList
+
+TOKEN_RE = re.compile(r"\w+")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Query terms that only match inside a longer token count for less
+PARTIAL_MATCH_WEIGHT = 0.5
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return TOKEN_RE.findall(text.lower())
+
+
+def product_tokens(product: Dict[str, Any]) -> List[str]:
+    tokens = tokenize(product["name"]) + tokenize(product.get("description"))
+    for tag in product.get("tags", []):
+        tokens.extend(tokenize(tag))
+    return tokens
+
+
+class SearchIndex:
+    """Inverted index over product name, description and tags.
+
+    Every query term must occur in a document, either as a whole token or
+    inside one ("phone" matches "iphone"), so results stay close to the old
+    substring search. Terms are resolved through a sorted list of token
+    suffixes, which turns "contains" into a prefix lookup.
+    """
+
+    # Product fields the index is built from
+    FIELDS = ("name", "description", "tags")
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}  # token -> {id: term frequency}
+        self.doc_tokens: Dict[int, Counter] = {}
+        self.doc_length: Dict[int, int] = {}
+        self.total_length = 0
+        self.suffixes = SortedList()  # (suffix, token)
+
+    def __len__(self):
+        return len(self.doc_tokens)
+
+    def build(self, products: List[Dict[str, Any]]):
+        for product in products:
+            self._add_postings(product)
+        self.suffixes = SortedList(
+            (token[i:], token) for token in self.postings for i in range(len(token))
+        )
+
+    def add(self, product: Dict[str, Any]):
+        for token in self._add_postings(product):
+            for i in range(len(token)):
+                self.suffixes.add((token[i:], token))
+
+    def add_many(self, products: Iterable[Dict[str, Any]]):
+        new_tokens = []
+        for product in products:
+            new_tokens.extend(self._add_postings(product))
+        self.suffixes.update((token[i:], token) for token in new_tokens for i in range(len(token)))
+
+    def remove(self, product_id: int):
+        counts = self.doc_tokens.pop(product_id, None)
+        if counts is None:
+            return
+        self.total_length -= self.doc_length.pop(product_id)
+        for token in counts:
+            posting = self.postings[token]
+            del posting[product_id]
+            if not posting:
+                del self.postings[token]
+                for i in range(len(token)):
+                    self.suffixes.remove((token[i:], token))
+
+    def _add_postings(self, product: Dict[str, Any]) -> List[str]:
+        """Index one product and return the tokens that are new to the vocabulary."""
+        product_id = product["id"]
+        counts = Counter(product_tokens(product))
+        self.doc_tokens[product_id] = counts
+        self.doc_length[product_id] = sum(counts.values())
+        self.total_length += self.doc_length[product_id]
+        new_tokens = []
+        for token, tf in counts.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                new_tokens.append(token)
+            posting[product_id] = tf
+        return new_tokens
+
+    def expand(self, term: str) -> Set[str]:
+        """Vocabulary tokens containing `term`."""
+        tokens = set()
+        for suffix, token in self.suffixes.islice(self.suffixes.bisect_left((term,))):
+            if not suffix.startswith(term):
+                break
+            tokens.add(token)
+        return tokens
+
+    def match(self, query: str, within: Optional[Set[int]] = None) -> Set[int]:
+        """Ids whose text contains every query term (optionally limited to `within`)."""
+        terms = tokenize(query)
+        if not terms:
+            return set(self.doc_tokens) if within is None else set(within)
+
+        term_sets = []
+        for term in set(terms):
+            ids = set()
+            for token in self.expand(term):
+                ids.update(self.postings[token])
+            if not ids:
+                return set()
+            term_sets.append(ids)
+
+        term_sets.sort(key=len)
+        result = term_sets[0]
+        if within is not None:
+            result = result & within
+        for ids in term_sets[1:]:
+            if not result:
+                break
+            result &= ids
+        return result
+
+    def scores(self, query: str, ids: Set[int]) -> Dict[int, float]:
+        """BM25 relevance of `query` for each id in `ids`."""
+        n = len(self.doc_tokens)
+        avg_length = self.total_length / n if n else 0.0
+        scores = dict.fromkeys(ids, 0.0)
+        for term in set(tokenize(query)):
+            for token in self.expand(term):
+                posting = self.postings[token]
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                weight = 1.0 if token == term else PARTIAL_MATCH_WEIGHT
+                if len(posting) < len(scores):
+                    hits = [(i, tf) for i, tf in posting.items() if i in scores]
+                else:
+                    hits = [(i, posting[i]) for i in scores if i in posting]
+                for product_id, tf in hits:
+                    norm = K1 * (1 - B + B * self.doc_length[product_id] / avg_length)
+                    scores[product_id] += weight * idf * tf * (K1 + 1) / (tf + norm)
+        return scores
@@ -0,0 +1,175 @@
+# app/sessions.py
+"""
+Refresh-token sessions
+
+A login opens a session and hands out a refresh token,
+"<session id>.<secret>". POST /auth/refresh trades it for a new access
+token and a new refresh token (the old one stops working), so clients
+stay signed in without sending the password again. Only a SHA-256
+digest of the secret is kept.
+
+Access tokens carry their session id and when they were issued. Revoking
+a session keeps its id in a revoked map for as long as an access token
+issued for it can live; get_current_user checks it with one dict lookup.
+Revoking every session of a user also marks the user as revoked before
+now, so tokens of sessions already swept or dropped from the store stop
+working too. Expired sessions and revocations are swept every
+SESSION_SWEEP_INTERVAL seconds.
+
+SessionStore keeps sessions in this worker's memory, for the in-memory
+backend (always one worker). The SQLite backend keeps them in its file
+instead, shared by every worker (see SQLiteSessionStore in
+app/db_production.py); both have the same methods, called through run_db.
+"""
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, Optional, Set, Tuple
+
+# Idle lifetime of a session: every refresh extends it by this much
+REFRESH_TOKEN_TTL = float(os.getenv("REFRESH_TOKEN_TTL", str(7 * 24 * 3600)))
+
+# Sessions kept; past this the least recently used is dropped
+SESSION_STORE_SIZE = int(os.getenv("SESSION_STORE_SIZE", "100000"))
+
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+
+
+class Session:
+    __slots__ = ("user_id", "digest", "expires")
+
+    def __init__(self, user_id: int, digest: bytes, expires: float):
+        self.user_id = user_id
+        self.digest = digest
+        self.expires = expires
+
+
+def _digest(secret: str) -> bytes:
+    return hashlib.sha256(secret.encode()).digest()
+
+
+class SessionStore:
+    """Sessions by id, in least recently used order, and revoked session ids."""
+
+    blocking = False
+
+    def __init__(
+        self,
+        access_ttl: float,
+        ttl: float = REFRESH_TOKEN_TTL,
+        max_sessions: int = SESSION_STORE_SIZE,
+        sweep_interval: float = SESSION_SWEEP_INTERVAL
+    ):
+        self.access_ttl = access_ttl
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sweep_interval = sweep_interval
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.sessions_of: Dict[int, Set[str]] = defaultdict(set)
+        # Session id -> when the last access token issued for it expires
+        self.revoked: Dict[str, float] = {}
+        # User id -> when all of the user's sessions were last revoked
+        self.revoked_before: Dict[int, float] = {}
+        self.next_sweep = time.time() + sweep_interval
+        self.created = 0
+        self.refreshed = 0
+        self.rejected = 0
+        self.swept = 0
+
+    def create(self, user_id: int) -> Tuple[str, str]:
+        """Open a session for `user_id`. Returns (session id, refresh token)."""
+        self._maybe_sweep()
+        session_id = secrets.token_urlsafe(12)
+        secret = secrets.token_urlsafe(32)
+        self.sessions[session_id] = Session(user_id, _digest(secret), time.time() + self.ttl)
+        self.sessions_of[user_id].add(session_id)
+        self.created += 1
+        while len(self.sessions) > self.max_sessions:
+            self._drop(next(iter(self.sessions)))
+        return session_id, f"{session_id}.{secret}"
+
+    def refresh(self, refresh_token: str) -> Optional[Tuple[str, int, str]]:
+        """Rotate a refresh token. Returns (session id, user id, new refresh token),
+        or None for an unknown, used or expired one."""
+        self._maybe_sweep()
+        session_id, _, secret = refresh_token.partition(".")
+        session = self.sessions.get(session_id)
+        if session is None or not hmac.compare_digest(session.digest, _digest(secret)):
+            self.rejected += 1
+            return None
+        now = time.time()
+        if session.expires <= now:
+            self._drop(session_id)
+            self.rejected += 1
+            return None
+        secret = secrets.token_urlsafe(32)
+        session.digest = _digest(secret)
+        session.expires = now + self.ttl
+        self.sessions.move_to_end(session_id)
+        self.refreshed += 1
+        return session_id, session.user_id, f"{session_id}.{secret}"
+
+    def is_revoked(self, session_id: str) -> bool:
+        return session_id in self.revoked
+
+    def is_user_revoked(self, user_id: int, issued_at: float) -> bool:
+        """Whether every session of the user was revoked after `issued_at`."""
+        return issued_at < self.revoked_before.get(user_id, 0.0)
+
+    def revoke(self, user_id: int, session_id: Optional[str] = None):
+        """Revoke one session of a user, or every one (as on a password change
+        or deactivation)."""
+        now = time.time()
+        if session_id is None:
+            session_ids = list(self.sessions_of.get(user_id, ()))
+            self.revoked_before[user_id] = now
+        else:
+            session_ids = [session_id]
+        until = now + self.access_ttl
+        for session_id in session_ids:
+            if session_id in self.sessions:
+                self._drop(session_id)
+            self.revoked[session_id] = until
+
+    def poll_due(self) -> bool:
+        # Every revocation is this worker's own, so there is nothing to poll
+        return False
+
+    def poll_revoked(self) -> Set[int]:
+        return set()
+
+    def _drop(self, session_id: str):
+        session = self.sessions.pop(session_id)
+        session_ids = self.sessions_of[session.user_id]
+        session_ids.discard(session_id)
+        if not session_ids:
+            del self.sessions_of[session.user_id]
+
+    def _maybe_sweep(self):
+        now = time.time()
+        if now < self.next_sweep:
+            return
+        self.next_sweep = now + self.sweep_interval
+        for session_id in [s for s, session in self.sessions.items() if session.expires <= now]:
+            self._drop(session_id)
+            self.swept += 1
+        for session_id in [s for s, until in self.revoked.items() if until <= now]:
+            del self.revoked[session_id]
+        # Tokens issued before these revocations have all expired
+        horizon = now - self.access_ttl
+        for user_id in [u for u, before in self.revoked_before.items() if before <= horizon]:
+            del self.revoked_before[user_id]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self.sessions),
+            "revoked": len(self.revoked),
+            "revoked_users": len(self.revoked_before),
+            "created": self.created,
+            "refreshed": self.refreshed,
+            "rejected": self.rejected,
+            "swept": self.swept,
+        }
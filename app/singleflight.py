@@ -0,0 +1,42 @@
+# app/singleflight.py
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """Share one in-flight computation among concurrent callers with the same key.
+
+    The first caller for a key starts the computation; callers arriving
+    while it runs await the same result instead of repeating the work.
+    Nothing is kept once it finishes, so this flattens bursts of identical
+    requests without serving anything stale.
+    """
+
+    def __init__(self):
+        self.calls: Dict[Any, asyncio.Task] = {}
+        self.flights = 0
+        self.coalesced = 0
+
+    async def run(self, key: Any, compute: Callable[[], Awaitable[Any]]) -> Any:
+        task = self.calls.get(key)
+        if task is None:
+            # A task of its own, so the waiters still get the result if the
+            # caller that started it goes away
+            task = asyncio.ensure_future(compute())
+            self.calls[key] = task
+            task.add_done_callback(lambda _: self._finished(key, task))
+            self.flights += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Any, task: asyncio.Task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self.calls),
+            "flights": self.flights,
+            "coalesced": self.coalesced,
+        }
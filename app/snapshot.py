@@ -0,0 +1,76 @@
+# app/snapshot.py
+import marshal
+import mmap
+import os
+import struct
+from typing import Any, Dict
+
+MAGIC = b"ECSNAP01"
+HEADER_LENGTH = struct.Struct("<Q")
+
+
+def write_snapshot(path: str, tables: Dict[str, bytes], meta: Dict[str, Any]):
+    """Atomically write a snapshot.
+
+    `tables` maps collection name to its marshal-encoded records. Layout:
+    magic, header length, marshal header (meta plus table offsets), then
+    the table blobs back to back.
+    """
+    offsets = {}
+    position = 0
+    for name, blob in tables.items():
+        offsets[name] = (position, len(blob))
+        position += len(blob)
+    header = marshal.dumps({**meta, "tables": offsets})
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(HEADER_LENGTH.pack(len(header)))
+        f.write(header)
+        for blob in tables.values():
+            f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    # Make the rename itself durable
+    dir_fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class Snapshot:
+    """Memory-mapped snapshot whose tables are decoded on demand.
+
+    Opening only reads the header, so it costs the same whatever the
+    snapshot size.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a snapshot file")
+        start = len(MAGIC) + HEADER_LENGTH.size
+        (header_length,) = HEADER_LENGTH.unpack_from(self._map, len(MAGIC))
+        self.meta = marshal.loads(self._map[start:start + header_length])
+        self._base = start + header_length
+
+    def raw(self, table: str) -> bytes:
+        offset, length = self.meta["tables"][table]
+        start = self._base + offset
+        return self._map[start:start + length]
+
+    def load(self, table: str) -> Any:
+        offset, length = self.meta["tables"][table]
+        start = self._base + offset
+        with memoryview(self._map) as view:
+            return marshal.loads(view[start:start + length])
+
+    def close(self):
+        self._map.close()
+        self._file.close()
@@ -0,0 +1,249 @@
+# app/suggest.py
+"""
+Prefix trie behind GET /products/suggest
+
+Terms are the lowercased word tokens of active products' names and tags.
+Every trie node keeps a pool of the best products (by rating, then id)
+among the terms below it, so a prefix is answered from one node instead of
+a walk of its subtree. A pool holds the top entries of its subtree, up to
+twice SUGGEST_POOL; removals shrink it, and only once it is down below
+SUGGEST_POOL with more below is it marked stale and refilled from the
+children.
+"""
+import heapq
+import os
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.search import tokenize
+
+SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 20
+
+# Products kept per node. A query's top-k is ranked from the pools of the
+# nodes it matches, which is exact as long as k fits in a pool.
+SUGGEST_POOL = max(int(os.getenv("SUGGEST_POOL", "32")), MAX_SUGGEST_LIMIT)
+
+# Shortest last word that is also matched at edit distance 1 (words of
+# letters only; a near miss on a number is a different number)
+FUZZY_MIN_LENGTH = 3
+
+# Score factor of a prefix matched at edit distance 1 (an exact one is 1)
+FUZZY_WEIGHT = 0.5
+
+# (-rating, id): ascending order is best first
+Entry = Tuple[float, int]
+
+
+class _Node:
+    __slots__ = ("children", "ids", "ranked", "size", "best")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.ids: Optional[Set[int]] = None  # products with a term ending here
+        self.ranked: Optional[List[Entry]] = None  # the same, best first, once asked for
+        self.size = 0  # (term, product) pairs at or below this node
+        self.best: Optional[List[Entry]] = []  # top of the subtree; None when stale
+
+
+class SuggestIndex:
+    """Prefix trie over active products' name and tag tokens."""
+
+    # Product fields the index is built from
+    FIELDS = ("name", "tags", "rating", "isActive")
+
+    def __init__(self, products: Iterable[Dict[str, Any]] = ()):
+        self.root = _Node()
+        self.terms: Dict[int, Tuple[str, ...]] = {}
+        self.names: Dict[int, str] = {}
+        self.ratings: Dict[int, float] = {}
+        # Pools are filled in one pass afterwards rather than entry by entry
+        for product in products:
+            self._insert(product, track=False)
+        for child in self.root.children.values():
+            self._best(child)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def add(self, product: Dict[str, Any]):
+        self._insert(product, track=True)
+
+    def _insert(self, product: Dict[str, Any], track: bool):
+        if not product["isActive"]:
+            return
+        product_id = product["id"]
+        terms = tuple(dict.fromkeys(tokenize(product["name"]) + tokenize(" ".join(product.get("tags", [])))))
+        self.terms[product_id] = terms
+        self.names[product_id] = product["name"]
+        self.ratings[product_id] = product.get("rating") or 0
+        entry = (-self.ratings[product_id], product_id)
+        for term in terms:
+            node = self.root
+            for char in term:
+                node = node.children.get(char) or node.children.setdefault(char, _Node())
+                node.size += 1
+                best = node.best
+                if not track:
+                    node.best = None
+                elif best is not None and entry not in best and (
+                    # Beats the pool, or the pool held the whole subtree
+                    (best and entry < best[-1]) or len(best) >= node.size - 1
+                ):
+                    insort(best, entry)
+                    del best[2 * SUGGEST_POOL:]
+            if node.ids is None:
+                node.ids = set()
+            node.ids.add(product_id)
+            if node.ranked is not None:
+                insort(node.ranked, entry)
+
+    def remove(self, product_id: int):
+        terms = self.terms.pop(product_id, None)
+        if terms is None:
+            return
+        del self.names[product_id]
+        entry = (-self.ratings.pop(product_id), product_id)
+        for term in terms:
+            node = self.root
+            for char in term:
+                parent, node = node, node.children[char]
+                node.size -= 1
+                if not node.size:
+                    # Nothing left below; drop the branch
+                    del parent.children[char]
+                    break
+                best = node.best
+                if best is not None and entry in best:
+                    best.remove(entry)
+                    if len(best) < SUGGEST_POOL and len(best) < node.size:
+                        node.best = None
+            else:
+                node.ids.discard(product_id)
+                if node.ranked is not None:
+                    del node.ranked[bisect_left(node.ranked, entry)]
+
+    def _best(self, node: _Node) -> List[Entry]:
+        """A node's best entries, refilling stale nodes below it first."""
+        stack = [(node, False)]
+        while stack:
+            current, children_done = stack.pop()
+            if current.best is not None:
+                continue
+            if not children_done:
+                stack.append((current, True))
+                stack.extend((child, False) for child in current.children.values() if child.best is None)
+                continue
+            ratings = self.ratings
+            entries = {(-ratings[i], i) for i in current.ids or ()}
+            for child in current.children.values():
+                entries.update(child.best)
+            current.best = heapq.nsmallest(2 * SUGGEST_POOL, entries)
+        return node.best
+
+    def _find(self, term: str) -> Optional[_Node]:
+        node = self.root
+        for char in term:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def _prefix_nodes(self, prefix: str, fuzzy: bool) -> List[Tuple[str, _Node, float]]:
+        """(node prefix, node, score factor) for every node matching `prefix`.
+
+        Fuzzy lookups walk the trie with a Levenshtein row per node and take
+        every node within edit distance 1, pruning once the whole row is
+        past it. Nodes under a match at distance 1 are only searched for the
+        exact prefix.
+        """
+        if not fuzzy:
+            node = self._find(prefix)
+            return [(prefix, node, 1.0)] if node is not None else []
+        matches = []
+        stack = [("", self.root, list(range(len(prefix) + 1)), False)]
+        while stack:
+            path, node, row, covered = stack.pop()
+            for char, child in node.children.items():
+                next_row = [row[0] + 1]
+                for j, query_char in enumerate(prefix, 1):
+                    next_row.append(min(row[j] + 1, next_row[j - 1] + 1, row[j - 1] + (query_char != char)))
+                distance = next_row[-1]
+                if distance == 0:
+                    # Everything below is within the subtree already matched
+                    matches.append((path + char, child, 1.0))
+                    continue
+                if distance == 1 and not covered:
+                    matches.append((path + char, child, FUZZY_WEIGHT))
+                if min(next_row) <= 1:
+                    stack.append((path + char, child, next_row, covered or distance == 1))
+        return matches
+
+    def suggest(self, query: str, limit: int = SUGGEST_LIMIT, fuzzy: bool = True) -> List[Dict[str, Any]]:
+        """Top `limit` products for a query being typed, as {"id", "name", "score"}.
+
+        The last word is a prefix, matched at edit distance 1 too once it
+        is FUZZY_MIN_LENGTH long; earlier words must be whole terms. The
+        score is the match factor times (1 + rating); ties go to the lower id.
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+        *complete, prefix = words
+        fuzzy = fuzzy and len(prefix) >= FUZZY_MIN_LENGTH and prefix.isalpha()
+        matches = self._prefix_nodes(prefix, fuzzy)
+        if not matches:
+            return []
+        ratings = self.ratings
+
+        # (score, -id) of the best `limit` so far, worst first
+        top: List[Tuple[float, int]] = []
+
+        def offer(product_id: int, factor: float):
+            item = (round(factor * (1 + ratings[product_id]), 4), -product_id)
+            if len(top) < limit:
+                heapq.heappush(top, item)
+            elif item > top[0]:
+                heapq.heapreplace(top, item)
+
+        if complete:
+            # Products with the rarest whole word, best first, checked for
+            # the other words and the prefix until no later one can make
+            # the top
+            nodes = []
+            for word in complete:
+                node = self._find(word)
+                if node is None or not node.ids:
+                    return []
+                nodes.append(node)
+            rarest = min(nodes, key=lambda node: len(node.ids))
+            if rarest.ranked is None:
+                rarest.ranked = sorted((-ratings[i], i) for i in rarest.ids)
+            for negative_rating, product_id in rarest.ranked:
+                if len(top) == limit and top[0][0] >= 1 - negative_rating:
+                    break
+                terms = self.terms[product_id]
+                if not all(word in terms for word in complete):
+                    continue
+                factor = max(
+                    (f for path, _, f in matches if any(term.startswith(path) for term in terms)),
+                    default=0.0
+                )
+                if factor:
+                    offer(product_id, factor)
+        else:
+            # A node's pool is its subtree's best, so the top `limit` of
+            # each matched node covers the answer
+            factors: Dict[int, float] = {}
+            for _, node, factor in matches:
+                for _, product_id in self._best(node)[:limit]:
+                    if factor > factors.get(product_id, 0.0):
+                        factors[product_id] = factor
+            for product_id, factor in factors.items():
+                offer(product_id, factor)
+
+        names = self.names
+        return [
+            {"id": -negative_id, "name": names[-negative_id], "score": score}
+            for score, negative_id in sorted(top, reverse=True)
+        ]
@@ -0,0 +1,115 @@
+"""
+Browse-query benchmark for the NumPy product mirror.
+
+Runs analytical-style catalog queries (category + price range + rating
+sort and friends) at 10k, 100k and 1M products three ways:
+
+  scan     list comprehensions and a full sort, as get_products did
+           before the store had indexes
+  indexes  the set/sorted-index path (PRODUCT_COLUMNS=0)
+  numpy    vectorized masks and argpartition over the columnar mirror
+
+Prints the best of several runs per query in milliseconds. Needs NumPy.
+"""
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+# The module-level store stays in memory instead of opening ./data
+os.environ["DATA_DIR"] = ""
+
+from app.columns import ProductColumns, np  # noqa: E402
+from app.db import Database  # noqa: E402
+from app.records import ProductRecord  # noqa: E402
+
+SIZES = [10_000, 100_000, 1_000_000]
+RUNS = 5
+CATEGORIES = ["electronics", "home", "shoes", "garden", "toys", "books", "sports", "beauty"]
+
+QUERIES = {
+    "category+price, rating desc": dict(category="home", min_price=100, max_price=400,
+                                        sort_by="rating", sort_order="desc"),
+    "price range, price asc p10": dict(min_price=50, max_price=900, sort_by="price", offset=90),
+    "all active, rating desc": dict(sort_by="rating", sort_order="desc"),
+    "category, id asc p5": dict(category="toys", offset=40),
+}
+
+
+def build(size, seed=0):
+    rnd = random.Random(seed)
+    db = Database()
+    db.products = [
+        ProductRecord(
+            id=i,
+            name=f"Product {i}",
+            price=round(rnd.uniform(1, 1000), 2),
+            category=rnd.choice(CATEGORIES),
+            stock=rnd.randint(0, 500),
+            description=None,
+            imageUrl=None,
+            isActive=rnd.random() < 0.9,
+            tags=[],
+            rating=round(rnd.uniform(0, 5), 1),
+            createdAt="2024-01-15"
+        )
+        for i in range(1, size + 1)
+    ]
+    db.products_by_id = {p["id"]: p for p in db.products}
+    return db
+
+
+def scan(db, category=None, min_price=None, max_price=None, is_active=True,
+         sort_by="id", sort_order="asc", offset=0, limit=10):
+    products = db.products
+    if category:
+        products = [p for p in products if p["category"].lower() == category.lower()]
+    if min_price is not None:
+        products = [p for p in products if p["price"] >= min_price]
+    if max_price is not None:
+        products = [p for p in products if p["price"] <= max_price]
+    if is_active is not None:
+        products = [p for p in products if p["isActive"] == is_active]
+    products = sorted(products, key=lambda p: p[sort_by], reverse=sort_order == "desc")
+    return len(products), products[offset:offset + limit]
+
+
+def best(func, **params):
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        result = func(**params)
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000, result
+
+
+def run_benchmark():
+    print(f"{'products':>10}  {'query':<30} {'scan':>9} {'indexes':>9} {'numpy':>9}")
+    for size in SIZES:
+        db = build(size)
+        start = time.perf_counter()
+        db.__dict__["product_columns"] = None
+        db.product_index
+        index_build = time.perf_counter() - start
+        start = time.perf_counter()
+        columns = ProductColumns(db.products)
+        columns_build = time.perf_counter() - start
+
+        for name, params in QUERIES.items():
+            scan_ms, expected = best(scan, db=db, **params)
+            db.__dict__["product_columns"] = None
+            index_ms, by_index = best(db.query_products, **params)
+            db.__dict__["product_columns"] = columns
+            numpy_ms, by_columns = best(db.query_products, **params)
+            assert by_index == by_columns
+            assert by_columns[0] == expected[0]
+            print(f"{size:>10}  {name:<30} {scan_ms:>7.2f}ms {index_ms:>7.2f}ms {numpy_ms:>7.2f}ms")
+        print(f"{'':>10}  build: indexes {index_build:.1f}s, numpy mirror {columns_build:.1f}s\n")
+
+
+if __name__ == "__main__":
+    if np is None:
+        sys.exit("bench_columns.py needs NumPy (pip install numpy)")
+    run_benchmark()
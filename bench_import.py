@@ -0,0 +1,110 @@
+"""
+Bulk import benchmark.
+
+Starts the API (in-memory store with its journal, then SQLite) and streams
+a generated NDJSON catalog of PRODUCTS items to POST /products/import,
+reading the per-record results as they come back. Prints the wall time,
+records/second and the server's peak resident memory.
+
+    python bench_import.py [products]
+"""
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+PRODUCTS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+CATEGORIES = ["electronics", "home", "shoes", "garden", "toys", "books", "sports", "beauty"]
+TAGS = ["sale", "eco", "new", "premium", "bundle"]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_server(base, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(base + "/health", timeout=1).status_code == 200:
+                return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError("Server did not start")
+
+
+def catalog(count, chunk=1000):
+    """NDJSON body in chunks of `chunk` records."""
+    for start in range(0, count, chunk):
+        lines = []
+        for i in range(start, min(start + chunk, count)):
+            lines.append(json.dumps({
+                "name": f"Product {i}",
+                "price": round(1 + (i * 7919) % 100_000 / 100, 2),
+                "category": CATEGORIES[i % len(CATEGORIES)],
+                "stock": i % 500,
+                "description": f"Imported product number {i}",
+                "tags": [TAGS[i % len(TAGS)], TAGS[i % 3]],
+                "rating": (i % 50) / 10,
+            }))
+        yield ("\n".join(lines) + "\n").encode()
+
+
+def peak_rss_mib(pid):
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def measure(backend):
+    data_dir = tempfile.mkdtemp(prefix="bench-import-")
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, DATABASE_BACKEND=backend, DATA_DIR=data_dir, SNAPSHOT_INTERVAL="0")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env
+    )
+    try:
+        wait_for_server(base)
+        token = requests.post(
+            base + "/auth/login", json={"username": "admin_user", "password": "password123"}
+        ).json()["access_token"]
+        start = time.perf_counter()
+        response = requests.post(
+            base + "/products/import",
+            data=catalog(PRODUCTS),
+            headers={"Authorization": f"Bearer {token}", "Content-Type": "application/x-ndjson"},
+            stream=True
+        )
+        results = 0
+        summary = None
+        for line in response.iter_lines():
+            results += 1
+            summary = line
+        elapsed = time.perf_counter() - start
+        assert json.loads(summary)["summary"]["created"] == PRODUCTS, summary
+        assert results == PRODUCTS + 1
+        print(f"{backend:>8}: {PRODUCTS} products in {elapsed:6.1f}s  "
+              f"{PRODUCTS / elapsed:8.0f}/s  peak RSS {peak_rss_mib(server.pid):6.0f} MiB")
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    for backend in ("memory", "sqlite"):
+        measure(backend)
@@ -0,0 +1,110 @@
+"""
+Memory report for the in-memory store's record layout.
+
+Builds the same orders and products twice - as the plain dicts the store
+used to hold (plus their id -> dict index) and as the compact records it
+holds now (OrderTable columns, slotted ProductRecord) - and reports the
+bytes traced by tracemalloc for each. Order fields arrive the way the
+orders router produces them: strings decoded from a JSON request body,
+numbers computed per order.
+"""
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+from app.records import OrderTable, ProductRecord  # noqa: E402
+
+ORDERS = int(os.getenv("BENCH_ORDERS", "1000000"))
+PRODUCTS = int(os.getenv("BENCH_PRODUCTS", "100000"))
+
+ORDER_BODY = json.dumps({"shipping_address": "123 Main St, City", "payment_method": "credit_card"})
+
+
+def make_order(i):
+    body = json.loads(ORDER_BODY)
+    items = [
+        {"product_id": 1 + (i + n) % 5000, "quantity": 1 + n, "price_at_purchase": 10 + (i + n) % 500}
+        for n in range(1 + i % 3)
+    ]
+    return {
+        "id": i + 1,
+        "user_id": 1 + i % 20000,
+        "cart_id": i + 1,
+        "items": items,
+        "total": sum(item["price_at_purchase"] * item["quantity"] for item in items),
+        "status": "pending",
+        "shipping_address": body["shipping_address"],
+        "payment_method": body["payment_method"],
+        "created_at": "2024-01-15"
+    }
+
+
+def make_product(i):
+    return {
+        "id": i + 1,
+        "name": f"Product {i}",
+        "price": 10 + i % 500,
+        "category": ("electronics", "home", "shoes")[i % 3],
+        "stock": 100,
+        "description": f"Benchmark product number {i}",
+        "imageUrl": None,
+        "isActive": True,
+        "tags": ["bench", f"t{i % 50}"],
+        "rating": (i % 50) / 10,
+        "createdAt": "2024-01-15"
+    }
+
+
+def dict_orders(n):
+    orders = [make_order(i) for i in range(n)]
+    return orders, {o["id"]: o for o in orders}
+
+
+def table_orders(n):
+    orders = OrderTable()
+    for i in range(n):
+        orders.append(make_order(i))
+    return orders
+
+
+def dict_products(n):
+    products = [make_product(i) for i in range(n)]
+    return products, {p["id"]: p for p in products}
+
+
+def record_products(n):
+    products = [ProductRecord(**make_product(i)) for i in range(n)]
+    return products, {p["id"]: p for p in products}
+
+
+def traced(build, n):
+    """Bytes still allocated once `build(n)` returns, and the build time."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    data = build(n)
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    gc.collect()
+    return current, elapsed
+
+
+def report(label, n, before, after):
+    (old_bytes, old_time), (new_bytes, new_time) = before, after
+    print(f"{label} ({n:,})")
+    print(f"   dicts:   {old_bytes / 2**20:8.1f} MiB  {old_bytes / n:6.0f} B/record  built in {old_time:.1f}s")
+    print(f"   compact: {new_bytes / 2**20:8.1f} MiB  {new_bytes / n:6.0f} B/record  built in {new_time:.1f}s")
+    print(f"   reduction: {old_bytes / new_bytes:.1f}x")
+
+
+if __name__ == "__main__":
+    report("Orders", ORDERS, traced(dict_orders, ORDERS), traced(table_orders, ORDERS))
+    report("Products", PRODUCTS, traced(dict_products, PRODUCTS), traced(record_products, PRODUCTS))
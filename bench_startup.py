@@ -0,0 +1,102 @@
+"""
+Startup-time benchmark for the persisted in-memory database.
+
+Builds data directories of increasing size and measures, in a fresh
+process each time, how long Database() takes to come up when it boots
+from the snapshot versus replaying the full journal, plus the cost of the
+first product query (which decodes the products table on demand).
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+# The module-level store stays in memory instead of opening ./data
+os.environ["DATA_DIR"] = ""
+
+SIZES = [1_000, 10_000, 100_000]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from app.db import Database
+db = Database(sys.argv[1])
+boot = time.perf_counter() - start
+start = time.perf_counter()
+db.query_products(limit=10)
+first_query = time.perf_counter() - start
+print(json.dumps({"boot": boot, "first_query": first_query}))
+"""
+
+
+def populate(data_dir, size):
+    """Write `size` products and orders through the journal."""
+    from app.db import Database
+
+    db = Database(data_dir)
+    for i in range(size):
+        db.add_product({
+            "id": db.get_next_product_id(),
+            "name": f"Product {i}",
+            "price": 10 + i % 500,
+            "category": ("electronics", "home", "shoes")[i % 3],
+            "stock": 100,
+            "description": f"Benchmark product number {i}",
+            "imageUrl": None,
+            "isActive": True,
+            "tags": ["bench", f"t{i % 50}"],
+            "rating": (i % 50) / 10,
+            "createdAt": "2024-01-15"
+        })
+        db.add_order({
+            "id": db.get_next_order_id(),
+            "user_id": 1,
+            "cart_id": 1,
+            "items": [{"product_id": 1, "quantity": 1, "price_at_purchase": 999}],
+            "total": 999,
+            "status": "pending",
+            "shipping_address": "123 Main St, City",
+            "payment_method": "credit_card",
+            "created_at": "2024-01-15"
+        })
+    return db
+
+
+def probe(data_dir):
+    env = dict(os.environ, SNAPSHOT_INTERVAL="0")
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, data_dir],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output)
+
+
+def run_benchmark():
+    print(f"{'records':>10} {'mode':>9} {'boot':>10} {'1st query':>10}")
+    for size in SIZES:
+        snapshot_dir = tempfile.mkdtemp(prefix="bench-snapshot-")
+        journal_dir = tempfile.mkdtemp(prefix="bench-journal-")
+        try:
+            db = populate(snapshot_dir, size)
+            db.journal.flush()
+            shutil.rmtree(journal_dir)
+            shutil.copytree(snapshot_dir, journal_dir)
+            db.close()  # writes the snapshot
+
+            for mode, data_dir in (("journal", journal_dir), ("snapshot", snapshot_dir)):
+                result = probe(data_dir)
+                print(f"{size:>10} {mode:>9} {result['boot'] * 1000:>8.1f}ms {result['first_query'] * 1000:>8.1f}ms")
+        finally:
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+            shutil.rmtree(journal_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    start = time.time()
+    run_benchmark()
+    print(f"\nDone in {time.time() - start:.1f}s")
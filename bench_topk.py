@@ -0,0 +1,106 @@
+"""
+Top-k page selection benchmark.
+
+Builds the in-memory store with PRODUCTS products and as many orders, then
+times first pages (page 1-3, limit 20) of the listings that are picked out
+of a result set rather than walked along a sorted index: a category sorted
+by name, search results by relevance, and one customer's orders. Each runs
+with full sorts (TOP_K_RATIO disabled) and with top-k selection, and the
+pages must come out the same. Prints the best of several runs per page in
+milliseconds.
+
+    python bench_topk.py [products]
+"""
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+# The module-level store stays in memory instead of opening ./data
+os.environ["DATA_DIR"] = ""
+
+from app import indexes  # noqa: E402
+from app.db import Database  # noqa: E402
+
+PRODUCTS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+CATEGORIES = [f"category-{i}" for i in range(20)]
+WORDS = ["wireless", "steel", "cotton", "ceramic", "leather", "garden", "travel", "classic"]
+STATUSES = ["pending", "processing", "shipped", "delivered", "cancelled"]
+RUNS = 20
+
+
+def build() -> Database:
+    random.seed(7)
+    db = Database()
+    db.import_products([
+        {
+            "name": f"{random.choice(WORDS)} {random.choice(WORDS)} item {i}",
+            "price": round(random.uniform(1, 1000), 2),
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "stock": i % 100,
+            "description": f"{random.choice(WORDS)} product number {i}",
+            "imageUrl": None,
+            "isActive": True,
+            "tags": [random.choice(WORDS)],
+            "rating": round(random.uniform(0, 5), 1),
+            "createdAt": "2024-01-15",
+        }
+        for i in range(PRODUCTS)
+    ])
+    for i in range(PRODUCTS):
+        db.add_order({
+            "id": db.get_next_order_id(),
+            # One busy account holds a fifth of the orders
+            "user_id": 1 if i % 5 == 0 else random.randint(2, 5000),
+            "cart_id": i + 1,
+            "items": [{"product_id": random.randint(1, PRODUCTS), "quantity": 1, "price_at_purchase": 10.0}],
+            "total": round(random.uniform(5, 2000), 2),
+            "status": random.choice(STATUSES),
+            "shipping_address": "1 Bench St",
+            "payment_method": "card",
+            "created_at": f"2024-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}",
+        })
+    return db
+
+
+def pages(query):
+    return [query(offset) for offset in (0, 20, 40)]
+
+
+def timed(query):
+    best = float("inf")
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        result = pages(query)
+        best = min(best, (time.perf_counter() - start) / 3)
+    return best, result
+
+
+def main():
+    db = build()
+    cases = {
+        "category by name": lambda offset: db.query_products(
+            category="category-3", sort_by="name", offset=offset, limit=20)[1],
+        "search by relevance": lambda offset: db.query_products(
+            search="leather", sort_by="relevance", offset=offset, limit=20)[1],
+        "one user's orders by total": lambda offset: db.query_orders(
+            user_id=1, sort_by="total", sort_order="desc", offset=offset, limit=20)[1],
+        "one user's orders by date": lambda offset: db.query_orders(
+            user_id=1, sort_by="created_at", offset=offset, limit=20)[1],
+    }
+    ratio = indexes.TOP_K_RATIO
+    print(f"{PRODUCTS} products and orders, ms per page (pages 1-3, limit 20)")
+    for name, query in cases.items():
+        indexes.TOP_K_RATIO = float("inf")
+        full, expected = timed(query)
+        indexes.TOP_K_RATIO = ratio
+        top, result = timed(query)
+        assert [[dict(row)["id"] for row in page] for page in result] == \
+            [[dict(row)["id"] for row in page] for page in expected], name
+        print(f"{name:>28}: full sort {full * 1000:7.2f}  top-k {top * 1000:7.2f}  x{full / top:4.1f}")
+
+
+if __name__ == "__main__":
+    main()
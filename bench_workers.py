@@ -0,0 +1,154 @@
+"""
+Multi-worker throughput benchmark.
+
+Starts the API on the shared SQLite backend with 1, 2 and 4 uvicorn
+workers and drives it with several client processes issuing catalog
+reads over keep-alive connections. The response cache is off and the
+pages, price floors and ids requested advance with every request, so
+each one runs its query instead of being served from the cache or
+shared with a concurrent identical read.
+
+Prints requests/second per run and the speedup over the single-worker
+in-memory store, the default deployment. Scaling is bounded by the
+number of CPU cores (clients share the machine with the server).
+"""
+import http.client
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+# The module-level store stays in memory instead of opening ./data
+os.environ["DATA_DIR"] = ""
+
+WORKER_COUNTS = [1, 2, 4]
+CLIENTS = 4
+DURATION = 10
+PRODUCTS = 10_000
+# Formatted per request from a counter that advances across clients, so
+# concurrent requests never coincide
+PATHS = [
+    "/products/?category=electronics&sort_by=price&limit=20&page={page}",
+    "/products/?search=product&min_price={price}&limit=10",
+    "/products/{id}",
+    "/products/?sort_by=rating&sort_order=desc&limit=20&page={page}",
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def populate(db):
+    for i in range(PRODUCTS):
+        db.add_product({
+            "id": db.get_next_product_id(),
+            "name": f"Product {i}",
+            "price": 10 + i % 500,
+            "category": ("electronics", "home", "shoes")[i % 3],
+            "stock": 100,
+            "description": f"Benchmark product number {i}",
+            "imageUrl": None,
+            "isActive": True,
+            "tags": ["bench"],
+            "rating": (i % 50) / 10,
+            "createdAt": "2024-01-15"
+        })
+    db.close()
+
+
+def client(index, port, deadline, results):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    count = errors = 0
+    while time.time() < deadline:
+        sent = count + errors
+        n = index + sent // len(PATHS) * CLIENTS
+        path = PATHS[sent % len(PATHS)].format(page=1 + n % 150, price=10 + n % 500, id=1 + n % PRODUCTS)
+        conn.request("GET", path)
+        response = conn.getresponse()
+        response.read()
+        if response.status == 200:
+            count += 1
+        else:
+            errors += 1
+    results.put((count, errors))
+
+
+def wait_for_server(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("Server did not start")
+
+
+def measure(workers, env):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT, env=env
+    )
+    try:
+        wait_for_server(port)
+        time.sleep(1)  # let every worker finish booting
+        results = multiprocessing.Queue()
+        deadline = time.time() + DURATION
+        clients = [
+            multiprocessing.Process(target=client, args=(i, port, deadline, results))
+            for i in range(CLIENTS)
+        ]
+        for p in clients:
+            p.start()
+        totals = [results.get() for _ in clients]
+        for p in clients:
+            p.join()
+        return sum(c for c, _ in totals) / DURATION, sum(e for _, e in totals)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run_benchmark():
+    from app.db import Database
+    from app.db_production import SQLiteDatabase
+
+    data_dir = tempfile.mkdtemp(prefix="bench-workers-")
+    try:
+        memory_dir = os.path.join(data_dir, "memory")
+        path = os.path.join(data_dir, "ecommerce.db")
+        for db in (Database(memory_dir), SQLiteDatabase(path)):
+            populate(db)
+            db.close()
+        # Every client shares one IP; the rate limiter would cap the run
+        env = dict(os.environ, RATE_LIMIT_ENABLED="0", RESPONSE_CACHE_SIZE="0")
+        runs = [("memory", 1, dict(env, DATABASE_BACKEND="memory", DATA_DIR=memory_dir))]
+        sqlite_env = dict(env, DATABASE_BACKEND="sqlite", SQLITE_PATH=path, DATA_DIR=data_dir)
+        runs += [("sqlite", workers, sqlite_env) for workers in WORKER_COUNTS]
+
+        print(f"CPU cores: {os.cpu_count()}, clients: {CLIENTS}, {DURATION}s per run, response cache off")
+        baseline = None
+        for backend, workers, run_env in runs:
+            rate, errors = measure(workers, run_env)
+            baseline = baseline or rate
+            print(f"   {backend:6} {workers} worker(s): {rate:8.0f} req/s  "
+                  f"vs memory {rate / baseline:4.2f}x  errors {errors}")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -1,5 +1,9 @@
+import asyncio
+import os
 import sys
 sys.path.insert(0, '.')
+# Check against the seed data in memory, not ./data (which a running server locks)
+os.environ["DATA_DIR"] = ""
 
 print("Debugging authentication...")
 
@@ -13,7 +17,7 @@ try:
     print(f"✅ Database has {len(db.users)} users")
     
     # Try to authenticate
-    user = authenticate_user("john_doe", "password123")
+    user = asyncio.run(authenticate_user("john_doe", "password123"))
     if user:
         print(f"✅ Authentication successful for john_doe: {user.username}")
     else:
@@ -0,0 +1,898 @@
+"""
+LIVE-SERVER CHECKS
+Behaviour that needs a server of its own: restarts and crashes,
+concurrent writes, caching, rate limits and sessions
+
+Each check gets a fresh server (on a free port, with a fresh data
+directory, and any settings the check needs) for each backend, so it can
+stop, kill and restart it. Named so that pytest does not collect it.
+Usage: python live_checks.py [memory|sqlite ...]
+"""
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BACKENDS = sys.argv[1:] or ["memory", "sqlite"]
+TEST_RESULTS = {"passed": 0, "failed": 0, "total": 0}
+BASE_URL = None
+
+def print_header(text):
+    print("\n" + "=" * 60)
+    print(f"📋 {text}")
+    print("=" * 60)
+
+def print_test(name, passed=True, details=""):
+    TEST_RESULTS["total"] += 1
+    if passed:
+        TEST_RESULTS["passed"] += 1
+        print(f"✅ PASS: {name}")
+    else:
+        TEST_RESULTS["failed"] += 1
+        print(f"❌ FAIL: {name}")
+    if details:
+        print(f"   {details}")
+
+def make_request(method, endpoint, data=None, token=None, headers=None):
+    """Make HTTP request and return response"""
+    headers = dict(headers or {})
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    url = f"{BASE_URL}{endpoint}"
+    if method == "GET":
+        return requests.get(url, headers=headers, params=data)
+    return requests.request(method, url, headers=headers, json=data)
+
+def login(username, password="password123"):
+    response = make_request("POST", "/auth/login", {"username": username, "password": password})
+    return response.json() if response.status_code == 200 else {}
+
+class Server:
+    """The API in a subprocess, on one data directory across restarts"""
+
+    def __init__(self, backend, **env):
+        self.data_dir = tempfile.mkdtemp(prefix="live-checks-")
+        self.env = {
+            **os.environ,
+            "DATABASE_BACKEND": backend,
+            "DATA_DIR": self.data_dir,
+            "RATE_LIMIT_ENABLED": "0",
+            "BCRYPT_ROUNDS": "4",
+            **env
+        }
+        self.process = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def start(self):
+        global BASE_URL
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        BASE_URL = f"http://127.0.0.1:{port}"
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=ROOT, env=self.env
+        )
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                if requests.get(f"{BASE_URL}/health", timeout=1).status_code == 200:
+                    return
+            except requests.exceptions.ConnectionError:
+                time.sleep(0.2)
+        raise RuntimeError("Server did not start")
+
+    def stop(self, sig=signal.SIGTERM):
+        if self.process.poll() is None:
+            self.process.send_signal(sig)
+        self.process.wait()
+
+def check_ranked_search(server):
+    """Test that search matches every term, ranks by relevance and follows updates"""
+    print_header("RANKED SEARCH")
+
+    admin_token = login("admin_user")["access_token"]
+    ids = {}
+    for name, description in [
+        ("Zephyr Zephyr Kettle", "A zephyr of a kettle"),
+        ("Copper Kettle", "Quiet as a zephyr"),
+        ("Zephyr Teapot", "Holds four cups"),
+    ]:
+        ids[name] = make_request("POST", "/products/", {
+            "name": name, "description": description, "price": 30.0, "category": "kitchen",
+            "stock": 5, "tags": ["tea"]
+        }, token=admin_token).json()["id"]
+
+    response = make_request("GET", "/products/", {"search": "zephyr", "sort_by": "relevance"})
+    found = [p["id"] for p in response.json().get("items", [])]
+    print_test("Every match found, best match first",
+               sorted(found) == sorted(ids.values()) and found[0] == ids["Zephyr Zephyr Kettle"],
+               f"Status: {response.status_code}, Ids: {found}")
+
+    response = make_request("GET", "/products/", {"search": "zephyr kettle"})
+    found = sorted(p["id"] for p in response.json().get("items", []))
+    print_test("Every term must match",
+               found == sorted([ids["Zephyr Zephyr Kettle"], ids["Copper Kettle"]]),
+               f"Ids: {found}")
+
+    response = make_request("GET", "/products/", {"search": "ephyr"})
+    print_test("Terms match inside words", response.json().get("total") == 3,
+               f"Total: {response.json().get('total')}")
+
+    make_request("PUT", f"/products/{ids['Copper Kettle']}", {"description": "Whistles when done"},
+                 token=admin_token)
+    response = make_request("GET", "/products/", {"search": "zephyr"})
+    found = [p["id"] for p in response.json().get("items", [])]
+    print_test("Updated product leaves the results", ids["Copper Kettle"] not in found and len(found) == 2,
+               f"Ids: {found}")
+
+def check_filtered_sorts(server):
+    """Test that category and price filtered sorts agree with the unfiltered listing"""
+    print_header("FILTERED SORTS")
+
+    admin_token = login("admin_user")["access_token"]
+    ids = []
+    for i in range(40):
+        # Repeated prices and ratings, so ties need ordering too
+        ids.append(make_request("POST", "/products/", {
+            "name": f"Sorted Item {i}", "price": 10.0 + (i * 7) % 13, "category": ["alpha", "beta"][i % 2],
+            "stock": i, "rating": float(i % 5)
+        }, token=admin_token).json()["id"])
+    # Changes after the catalog is loaded must reach the filtered path too
+    for product_id in ids[:6]:
+        make_request("PUT", f"/products/{product_id}", {"price": 15.5, "rating": 4.5}, token=admin_token)
+    for product_id in ids[6:9]:
+        make_request("DELETE", f"/products/{product_id}", token=admin_token)
+    make_request("PUT", f"/products/{ids[9]}", {"category": "alpha"}, token=admin_token)
+
+    mismatches = []
+    for sort_by in ("id", "price", "rating"):
+        for sort_order in ("asc", "desc"):
+            # Unfiltered listings walk the sorted indexes
+            listing, cursor = [], None
+            while True:
+                params = {"sort_by": sort_by, "sort_order": sort_order, "limit": 100}
+                if cursor:
+                    params["cursor"] = cursor
+                body = make_request("GET", "/products/", params).json()
+                listing += body["items"]
+                cursor = body["next_cursor"]
+                if not cursor:
+                    break
+            for category in ("alpha", "beta"):
+                expected = [p["id"] for p in listing
+                            if p["category"] == category and 12 <= p["price"] <= 20]
+                found = [p["id"] for p in make_request("GET", "/products/", {
+                    "category": category, "min_price": 12, "max_price": 20,
+                    "sort_by": sort_by, "sort_order": sort_order, "limit": 100
+                }).json()["items"]]
+                second_page = [p["id"] for p in make_request("GET", "/products/", {
+                    "category": category, "min_price": 12, "max_price": 20,
+                    "sort_by": sort_by, "sort_order": sort_order, "limit": 4, "page": 2
+                }).json()["items"]]
+                if found != expected or second_page != expected[4:8]:
+                    mismatches.append((sort_by, sort_order, category))
+    print_test("Filtered pages match the filtered listing", not mismatches,
+               f"Mismatched: {mismatches}" if mismatches else "")
+
+def check_response_cache(server):
+    """Test ETag revalidation and that product writes invalidate cached reads"""
+    print_header("RESPONSE CACHE")
+
+    admin_token = login("admin_user")["access_token"]
+    first = make_request("GET", "/products/1")
+    etag = first.headers.get("ETag")
+    print_test("Catalog read carries an ETag", first.status_code == 200 and bool(etag),
+               f"Status: {first.status_code}, ETag: {etag}")
+
+    response = make_request("GET", "/products/1", headers={"If-None-Match": etag})
+    print_test("Matching If-None-Match gets 304 without a body",
+               response.status_code == 304 and not response.content,
+               f"Status: {response.status_code}")
+    cache = make_request("GET", "/metrics").json()["response_cache"]
+    print_test("Repeat read served from the cache", cache["hits"] >= 1 and cache["not_modified"] >= 1,
+               f"Cache: {cache}")
+
+    categories = make_request("GET", "/products/categories").json()["categories"]
+    make_request("PUT", "/products/1", {"stock": first.json()["stock"] + 7}, token=admin_token)
+    response = make_request("GET", "/products/1", headers={"If-None-Match": etag})
+    print_test("Updated product is sent again with a new ETag",
+               response.status_code == 200 and response.headers.get("ETag") != etag
+               and response.json()["stock"] == first.json()["stock"] + 7,
+               f"Status: {response.status_code}, ETag: {response.headers.get('ETag')}")
+
+    make_request("POST", "/products/", {
+        "name": "Cache Buster", "price": 5.0, "category": "cache-check", "stock": 1
+    }, token=admin_token)
+    response = make_request("GET", "/products/categories")
+    print_test("New category shows up in a cached listing",
+               "cache-check" in response.json()["categories"] and "cache-check" not in categories,
+               f"Categories: {response.json()['categories']}")
+
+def check_single_flight(server):
+    """Test that concurrent identical reads share one run of the route"""
+    print_header("SINGLE-FLIGHT READS")
+
+    # The response cache is off for this server, so only coalescing saves work
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        responses = list(executor.map(
+            lambda _: make_request("GET", "/products/", {"sort_by": "price"}), range(48)
+        ))
+    statuses = {r.status_code for r in responses}
+    print_test("Every concurrent read answered alike",
+               statuses == {200} and len({r.content for r in responses}) == 1,
+               f"Statuses: {statuses}")
+    flights = make_request("GET", "/metrics").json()["single_flight"]
+    print_test("Identical reads coalesced",
+               flights["coalesced"] > 0 and flights["flights"] + flights["coalesced"] == 48,
+               f"Single flight: {flights}")
+
+def check_facet_counts(server):
+    """Test that facet counts and categories follow product writes"""
+    print_header("FACET COUNTS")
+
+    admin_token = login("admin_user")["access_token"]
+
+    def facets_agree():
+        # The running counts against counts over the full active listing
+        listing = make_request("GET", "/products/", {"limit": 100}).json()["items"]
+        facets = make_request("GET", "/products/facets").json()
+        categories, tags = {}, {}
+        for product in listing:
+            categories[product["category"]] = categories.get(product["category"], 0) + 1
+            for tag in {t.lower() for t in product["tags"]}:
+                tags[tag] = tags.get(tag, 0) + 1
+        buckets = sum(bucket["count"] for bucket in facets["price_buckets"])
+        return (facets["total"] == len(listing) == buckets
+                and facets["categories"] == categories and facets["tags"] == tags), facets
+
+    product = make_request("POST", "/products/", {
+        "name": "Facet Lamp", "price": 30.0, "category": "lighting", "stock": 3, "tags": ["Desk", "led"]
+    }, token=admin_token).json()
+    agree, facets = facets_agree()
+    print_test("New product counted", agree and facets["categories"].get("lighting") == 1
+               and facets["tags"].get("desk") == 1, f"Facets: {facets}")
+
+    make_request("PUT", f"/products/{product['id']}", {
+        "price": 300.0, "category": "lamps", "tags": ["floor"]
+    }, token=admin_token)
+    agree, facets = facets_agree()
+    categories = make_request("GET", "/products/categories").json()["categories"]
+    print_test("Updated product moves between counts",
+               agree and "lighting" not in facets["categories"] and "desk" not in facets["tags"]
+               and "lamps" in categories and "lighting" not in categories,
+               f"Facets: {facets}, Categories: {categories}")
+
+    make_request("DELETE", f"/products/{product['id']}", token=admin_token)
+    agree, facets = facets_agree()
+    categories = make_request("GET", "/products/categories").json()["categories"]
+    print_test("Deactivated product no longer counted",
+               agree and "lamps" not in facets["categories"] and "lamps" not in categories,
+               f"Facets: {facets}, Categories: {categories}")
+
+    response = make_request("GET", "/products/facets", {"category": "electronics"})
+    print_test("Filtered facets count only matches",
+               response.json()["categories"] == {"electronics": response.json()["total"]},
+               f"Facets: {response.json()}")
+
+def check_bulk_import(server):
+    """Test that NDJSON and CSV imports create, upsert and report bad records"""
+    print_header("BULK IMPORT")
+
+    admin_token = login("admin_user")["access_token"]
+    headers = {"Authorization": f"Bearer {admin_token}"}
+
+    body = "\n".join(json.dumps(record) for record in [
+        {"name": "Imported Kettle", "price": 25.0, "category": "imports", "stock": 4, "tags": ["steel"]},
+        {"id": 1, "name": "Renamed Laptop", "price": 1999.0, "category": "electronics", "stock": 9},
+        {"name": "Broken Record", "price": -1, "category": "imports", "stock": 1},
+        {"name": "Imported Mug", "price": 8.0, "category": "imports", "stock": 40},
+    ]) + "\n"
+    response = requests.post(f"{BASE_URL}/products/import", data=body.encode(),
+                             headers={**headers, "Content-Type": "application/x-ndjson"})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    statuses = [line.get("status") for line in lines[:-1]]
+    print_test("NDJSON results in input order",
+               statuses == ["created", "updated", "error", "created"]
+               and [line["line"] for line in lines[:-1]] == [1, 2, 3, 4],
+               f"Status: {response.status_code}, Results: {lines[:-1]}")
+    print_test("Summary counts created, updated and failed",
+               lines[-1] == {"summary": {"created": 2, "updated": 1, "failed": 1}},
+               f"Summary: {lines[-1]}")
+
+    response = make_request("GET", "/products/1")
+    print_test("Upserted product replaced", response.json().get("name") == "Renamed Laptop"
+               and response.json().get("stock") == 9, f"Product: {response.json()}")
+    response = make_request("GET", "/products/", {"search": "kettle", "category": "imports"})
+    print_test("Imported product searchable", response.json().get("total") == 1,
+               f"Total: {response.json().get('total')}")
+
+    kettle_id = lines[0]["id"]
+    body = ("id,name,price,category,stock,tags\n"
+            f"{kettle_id},Imported Kettle,19.5,imports,2,steel|sale\n"
+            ",\"Teapot, large\",30,imports,1,\n")
+    response = requests.post(f"{BASE_URL}/products/import", data=body.encode(),
+                             headers={**headers, "Content-Type": "text/csv"})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    print_test("CSV import upserts by id", lines[-1] == {"summary": {"created": 1, "updated": 1, "failed": 0}},
+               f"Status: {response.status_code}, Results: {lines}")
+    response = make_request("GET", f"/products/{kettle_id}")
+    print_test("CSV values applied", response.json().get("price") == 19.5
+               and response.json().get("tags") == ["steel", "sale"], f"Product: {response.json()}")
+
+    response = requests.post(f"{BASE_URL}/products/import", data=b"{}",
+                             headers={"Content-Type": "application/x-ndjson"})
+    print_test("Import needs an admin", response.status_code in (401, 403),
+               f"Status: {response.status_code}")
+
+def check_export_round_trip(server):
+    """Test that exports list every record and a CSV export imports back unchanged"""
+    print_header("EXPORT ROUND TRIP")
+
+    admin_token = login("admin_user")["access_token"]
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    make_request("POST", "/products/", {
+        "name": "Export, \"Quoted\" Lamp", "price": 45.5, "category": "lighting", "stock": 2,
+        "description": "Two\nlines", "tags": ["desk", "led"]
+    }, token=admin_token)
+    make_request("DELETE", "/products/2", token=admin_token)
+
+    def export(format, gzip=False):
+        return requests.get(f"{BASE_URL}/products/export", params={"format": format, "gzip": gzip},
+                            headers=headers)
+
+    before = [json.loads(line) for line in export("ndjson").text.splitlines()]
+    ids = [product["id"] for product in before]
+    print_test("NDJSON export lists every product in id order, inactive ones too",
+               ids == sorted(ids) and len(ids) == 6 and 2 in ids, f"Ids: {ids}")
+
+    response = export("ndjson", gzip=True)
+    print_test("Gzipped export has the same records",
+               response.headers.get("Content-Encoding") == "gzip"
+               and [json.loads(line) for line in response.text.splitlines()] == before,
+               f"Content-Encoding: {response.headers.get('Content-Encoding')}")
+
+    response = export("csv")
+    imported = requests.post(f"{BASE_URL}/products/import", data=response.content,
+                             headers={**headers, "Content-Type": "text/csv"})
+    summary = json.loads(imported.text.splitlines()[-1])
+    after = [json.loads(line) for line in export("ndjson").text.splitlines()]
+    print_test("CSV export imports back unchanged",
+               summary == {"summary": {"created": 0, "updated": 6, "failed": 0}} and after == before,
+               f"Summary: {summary}")
+
+    response = requests.get(f"{BASE_URL}/orders/export", headers=headers)
+    orders = [json.loads(line) for line in response.text.splitlines()]
+    total = make_request("GET", "/orders/", {"limit": 100}, token=admin_token).json()["total"]
+    print_test("Order export lists every order", bool(orders) and len(orders) == total,
+               f"Exported: {len(orders)}, Total: {total}")
+
+    response = requests.get(f"{BASE_URL}/products/export", params={"format": "xml"}, headers=headers)
+    print_test("Unknown export format rejected", response.status_code == 400,
+               f"Status: {response.status_code}")
+
+def check_suggest(server):
+    """Test autocomplete by prefix and near miss, and that it follows product writes"""
+    print_header("AUTOCOMPLETE")
+
+    admin_token = login("admin_user")["access_token"]
+    ids = {}
+    for name, rating in [("Quasar Speaker", 4.0), ("Quasar Lamp", 2.0), ("Quartz Clock", 5.0)]:
+        ids[name] = make_request("POST", "/products/", {
+            "name": name, "price": 10.0, "category": "gadgets", "stock": 1, "rating": rating
+        }, token=admin_token).json()["id"]
+
+    def suggested(q, **params):
+        response = make_request("GET", "/products/suggest", {"q": q, **params})
+        return [s["id"] for s in response.json().get("suggestions", [])]
+
+    found = suggested("qu")
+    print_test("Prefix matches ranked best first",
+               found == [ids["Quartz Clock"], ids["Quasar Speaker"], ids["Quasar Lamp"]], f"Ids: {found}")
+    found = suggested("quasar sp")
+    print_test("Earlier words narrow the matches", found == [ids["Quasar Speaker"]], f"Ids: {found}")
+    found = suggested("quasr")
+    print_test("Typo still suggests", {ids["Quasar Speaker"], ids["Quasar Lamp"]} <= set(found),
+               f"Ids: {found}")
+    found = suggested("quasr", fuzzy="false")
+    print_test("No typo matching with fuzzy off", found == [], f"Ids: {found}")
+
+    make_request("DELETE", f"/products/{ids['Quasar Speaker']}", token=admin_token)
+    make_request("PUT", f"/products/{ids['Quasar Lamp']}", {"name": "Nebula Lamp"}, token=admin_token)
+    found = suggested("quasar")
+    print_test("Deactivated and renamed products drop out", found == [], f"Ids: {found}")
+    found = suggested("nebu")
+    print_test("Renamed product found by its new name", found == [ids["Quasar Lamp"]], f"Ids: {found}")
+
+def check_token_cache(server):
+    """Test that cached tokens stop resolving to stale users once the user changes"""
+    print_header("TOKEN CACHE")
+
+    admin_token = login("admin_user")["access_token"]
+    user = make_request("POST", "/auth/signup", {
+        "username": "cached_user", "email": "cached_user@example.com", "password": "secret123"
+    }).json()
+    token = login("cached_user", "secret123")["access_token"]
+    make_request("GET", "/auth/me", token=token)
+    make_request("GET", "/auth/me", token=token)
+    cache = make_request("GET", "/metrics").json()["token_cache"]
+    print_test("Repeat token served from the cache", cache["hits"] >= 1, f"Token cache: {cache}")
+
+    make_request("PUT", f"/users/{user['id']}", {"email": "moved@example.com"}, token=admin_token)
+    response = make_request("GET", "/auth/me", token=token)
+    print_test("Updated user seen at once", response.json().get("email") == "moved@example.com",
+               f"Status: {response.status_code}, Email: {response.json().get('email')}")
+
+    make_request("PUT", f"/users/{user['id']}", {"username": "renamed_user"}, token=admin_token)
+    response = make_request("GET", "/auth/me", token=token)
+    print_test("Token of a renamed user rejected", response.status_code == 401,
+               f"Status: {response.status_code}")
+
+    token = login("renamed_user", "secret123")["access_token"]
+    make_request("GET", "/auth/me", token=token)
+    make_request("DELETE", f"/users/{user['id']}", token=admin_token)
+    response = make_request("GET", "/auth/me", token=token)
+    print_test("Token of a deactivated user rejected", response.status_code in (400, 401),
+               f"Status: {response.status_code}")
+
+def check_hash_pool_limit(server):
+    """Test that a full password hashing queue turns signups away with 503"""
+    print_header("PASSWORD HASHING QUEUE")
+
+    # One hashing thread and one waiting slot on this server, at full cost
+    def signup(i):
+        return make_request("POST", "/auth/signup", {
+            "username": f"queued_user{i}", "email": f"queued_user{i}@example.com", "password": "secret123"
+        })
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(signup, range(8)))
+    statuses = sorted(r.status_code for r in responses)
+    busy = [r for r in responses if r.status_code == 503]
+    print_test("Signups past the queue limit get 503",
+               bool(busy) and set(statuses) <= {200, 503} and 200 in statuses,
+               f"Statuses: {statuses}")
+    print_test("503 says when to retry", all(r.headers.get("Retry-After") == "1" for r in busy),
+               f"Retry-After: {[r.headers.get('Retry-After') for r in busy]}")
+    hashing = make_request("GET", "/metrics").json()["password_hashing"]
+    print_test("Rejections counted", hashing["rejected"] == len(busy) and hashing["queued"] == 0,
+               f"Password hashing: {hashing}")
+
+    response = signup(len(responses))
+    print_test("Signup works again once the queue drains", response.status_code == 200,
+               f"Status: {response.status_code}")
+
+def check_rate_limits(server):
+    """Test that budgets are kept per forwarded client IP and per verified token"""
+    print_header("RATE LIMITS")
+
+    def from_ip(ip, method, endpoint, data=None, token=None):
+        return make_request(method, endpoint, data, token=token, headers={"X-Forwarded-For": ip})
+
+    # Three catalog reads and two logins per client on this server
+    statuses = [from_ip("10.0.0.1", "GET", "/products/").status_code for _ in range(4)]
+    response = from_ip("10.0.0.1", "GET", "/products/")
+    print_test("Client over its budget gets 429",
+               statuses == [200, 200, 200, 429] and response.headers.get("Retry-After") is not None,
+               f"Statuses: {statuses}, Retry-After: {response.headers.get('Retry-After')}")
+    response = from_ip("10.0.0.2", "GET", "/products/")
+    print_test("Another client behind the same proxy is unaffected", response.status_code == 200,
+               f"Status: {response.status_code}")
+
+    response = from_ip("10.0.0.1", "GET", "/products/", token="not-a-verified-token")
+    print_test("Unverified token does not buy a fresh budget", response.status_code == 429,
+               f"Status: {response.status_code}")
+    token = from_ip("10.0.0.3", "POST", "/auth/login",
+                    {"username": "john_doe", "password": "password123"}).json()["access_token"]
+    from_ip("10.0.0.1", "GET", "/auth/me", token=token)
+    response = from_ip("10.0.0.1", "GET", "/products/", token=token)
+    print_test("Verified token has a budget of its own", response.status_code == 200,
+               f"Status: {response.status_code}")
+
+    statuses = [from_ip("10.0.0.4", "POST", "/auth/login",
+                        {"username": "john_doe", "password": "wrong"}).status_code for _ in range(3)]
+    print_test("Login attempts throttled", statuses == [401, 401, 429], f"Statuses: {statuses}")
+
+def check_durability(server):
+    """Test that writes survive a clean restart and a crash"""
+    print_header("DURABILITY ACROSS RESTARTS")
+
+    admin_token = login("admin_user")["access_token"]
+
+    product = make_request("POST", "/products/", {
+        "name": "Durable Widget", "price": 12.5, "category": "test", "stock": 30, "tags": ["durable"]
+    }, token=admin_token).json()
+    make_request("PUT", f"/products/{product['id']}", {"stock": 25}, token=admin_token)
+    make_request("POST", "/auth/signup", {
+        "username": "durable_user", "email": "durable@example.com", "password": "secret123"
+    })
+
+    # Clean shutdown: the store writes its snapshot on the way out
+    server.stop()
+    server.start()
+    response = make_request("GET", f"/products/{product['id']}")
+    print_test("Product update kept after restart",
+               response.status_code == 200 and response.json()["stock"] == 25,
+               f"Status: {response.status_code}, Stock: {response.json().get('stock', 'N/A')}")
+    print_test("Signed-up user can log in after restart",
+               bool(login("durable_user", "secret123")))
+
+    # Crash: only what was journaled (or committed) before the kill is left
+    admin_token = login("admin_user")["access_token"]
+    make_request("PUT", f"/products/{product['id']}", {"stock": 7}, token=admin_token)
+    second = make_request("POST", "/products/", {
+        "name": "Journaled Widget", "price": 3.0, "category": "test", "stock": 5
+    }, token=admin_token).json()
+    time.sleep(0.5)  # past the journal's group-commit interval
+    server.stop(signal.SIGKILL)
+    server.start()
+    response = make_request("GET", f"/products/{product['id']}")
+    print_test("Update replayed after a crash",
+               response.status_code == 200 and response.json()["stock"] == 7,
+               f"Stock: {response.json().get('stock', 'N/A')} (expected 7)")
+    response = make_request("GET", f"/products/{second['id']}")
+    print_test("Product created before a crash is back",
+               response.status_code == 200 and response.json()["name"] == "Journaled Widget",
+               f"Status: {response.status_code}")
+    response = make_request("POST", "/products/", {
+        "name": "After Crash", "price": 1.0, "category": "test", "stock": 1
+    }, token=login("admin_user")["access_token"])
+    print_test("Ids keep counting after a crash",
+               response.status_code in [200, 201] and response.json()["id"] > second["id"],
+               f"New id: {response.json().get('id', 'N/A')}, last before crash: {second['id']}")
+
+def check_null_product_update(server):
+    """Test that nulls for required product fields change nothing"""
+    print_header("PRODUCT UPDATES WITH NULLS")
+
+    admin_token = login("admin_user")["access_token"]
+
+    product = make_request("POST", "/products/", {
+        "name": "Nullable Gadget", "price": 42.0, "category": "test", "stock": 9, "rating": 4.2
+    }, token=admin_token).json()
+
+    def listings():
+        by_rating = make_request("GET", "/products/", {"sort_by": "rating", "limit": 100}).json()["items"]
+        found = make_request("GET", "/products/", {"search": "gadget", "limit": 100}).json()["items"]
+        return [p["id"] for p in by_rating], [p["id"] for p in found]
+
+    before = listings()
+    response = make_request("PUT", f"/products/{product['id']}", {
+        "rating": None, "name": None, "price": None, "tags": None, "stock": 4
+    }, token=admin_token)
+    print_test("Update with nulls succeeds",
+               response.status_code == 200,
+               f"Status: {response.status_code}")
+    updated = make_request("GET", f"/products/{product['id']}").json()
+    print_test("Nulls dropped, other fields applied",
+               updated["rating"] == 4.2 and updated["name"] == "Nullable Gadget" and updated["stock"] == 4,
+               f"Rating: {updated.get('rating')}, Name: {updated.get('name')}, Stock: {updated.get('stock')}")
+    print_test("Sort and search results unchanged",
+               listings() == before and product["id"] in before[0] and product["id"] in before[1],
+               f"{len(before[0])} products by rating, {len(before[1])} search matches")
+
+    response = make_request("PUT", f"/products/{product['id']}", {"description": None}, token=admin_token)
+    print_test("Description can still be cleared",
+               response.status_code == 200 and response.json()["description"] is None,
+               f"Status: {response.status_code}")
+
+def check_null_order_update(server):
+    """Test that a null order status changes nothing"""
+    print_header("ORDER UPDATES WITH NULLS")
+
+    admin_token = login("admin_user")["access_token"]
+
+    def by_status():
+        data = make_request("GET", "/orders/", {"sort_by": "status", "limit": 100}, token=admin_token).json()
+        return [(o["id"], o["status"]) for o in data["items"]]
+
+    before = by_status()
+    order_id = before[0][0]
+    response = make_request("PUT", f"/orders/{order_id}/status", {"status": None}, token=admin_token)
+    print_test("Null status update succeeds",
+               response.status_code == 200,
+               f"Status: {response.status_code}")
+    print_test("Orders by status unchanged",
+               by_status() == before,
+               f"{len(before)} orders")
+    response = make_request("PUT", f"/orders/{order_id}/status",
+                            {"status": None, "shipping_address": "9 New Rd"}, token=admin_token)
+    print_test("Other fields still applied",
+               response.status_code == 200 and response.json()["shipping_address"] == "9 New Rd"
+               and response.json()["status"] == before[0][1],
+               f"Status: {response.status_code}")
+    response = make_request("PUT", f"/orders/{order_id}/status", {"status": "shipped"}, token=admin_token)
+    after = dict(by_status())
+    print_test("Status still updates and re-sorts",
+               response.status_code == 200 and after.get(order_id) == "shipped" and len(after) == len(before),
+               f"Status: {response.status_code}")
+
+def check_data_dir_lock(server):
+    """Test that a second process cannot open a data directory in use"""
+    print_header("DATA DIRECTORY LOCK")
+
+    if server.env["DATABASE_BACKEND"] != "memory":
+        print("⚠️  Skipping - the SQLite file is shared between processes by design")
+        return
+    other = subprocess.run([sys.executable, "-c", "import app.db"], cwd=ROOT, env=server.env,
+                           capture_output=True, text=True, timeout=30)
+    print_test("Second process on the same DATA_DIR refused",
+               other.returncode != 0 and "in use by another process" in other.stderr,
+               f"Exit code: {other.returncode}")
+    print_test("Running server unaffected",
+               make_request("GET", "/products/1").status_code == 200)
+
+def check_product_batch(server):
+    """Test GET and POST /products/batch against single lookups and the id limit"""
+    print_header("PRODUCT BATCH")
+
+    ids = [3, 999999, 1, 3]
+    singles = [make_request("GET", f"/products/{i}") for i in ids]
+    expected = [r.json() if r.status_code == 200 else {"id": i, "error": "Product not found"}
+                for i, r in zip(ids, singles)]
+    by_get = make_request("GET", "/products/batch", {"ids": ",".join(map(str, ids))}).json()
+    by_post = make_request("POST", "/products/batch", {"ids": ids}).json()
+    print_test("GET batch matches single lookups, in request order",
+               by_get["items"] == expected and by_get["missing"] == [999999],
+               f"{len(by_get['items'])} items, missing {by_get['missing']}")
+    print_test("POST batch matches GET batch", by_post == by_get)
+
+    # Both take up to the same number of ids
+    codes = [make_request("GET", "/products/batch", {"ids": ",".join(["1"] * n)}).status_code
+             for n in (100, 101)]
+    codes += [make_request("POST", "/products/batch", {"ids": [1] * n}).status_code for n in (100, 101)]
+    print_test("100 ids allowed and 101 refused, by GET and POST",
+               codes[0] == 200 and codes[1] == 400 and codes[2] == 200 and codes[3] == 422,
+               f"Status codes: {codes}")
+
+def check_seed_passwords(server):
+    """Test that seed accounts take only their own password"""
+    print_header("SEED ACCOUNT PASSWORDS")
+
+    for username in ("admin_user", "john_doe"):
+        print_test(f"{username} refuses the placeholder's password",
+                   not login(username, "secret"))
+        print_test(f"{username} accepts password123",
+                   bool(login(username)))
+
+def check_duplicate_signup(server):
+    """Test that a taken username or email costs no hash and no user id"""
+    print_header("DUPLICATE SIGNUPS")
+
+    def signup(username, email):
+        return make_request("POST", "/auth/signup", {"username": username, "email": email, "password": "secret123"})
+
+    first = signup("dupe_first", "dupe_first@example.com").json()
+    hashed = make_request("GET", "/metrics").json()["password_hashing"]["completed"]
+    codes = [signup("dupe_first", "other@example.com").status_code,
+             signup("dupe_other", "DUPE_FIRST@example.com").status_code]
+    after = make_request("GET", "/metrics").json()["password_hashing"]["completed"]
+    print_test("Taken username and email refused", codes == [400, 400],
+               f"Status codes: {codes}")
+    print_test("No password hashed for them", after == hashed,
+               f"Hashes before: {hashed}, after: {after}")
+    second = signup("dupe_second", "dupe_second@example.com").json()
+    print_test("No user id used up", second["id"] == first["id"] + 1,
+               f"Ids: {first['id']}, then {second['id']}")
+
+def check_concurrent_signups(server):
+    """Test that racing signups for one username or email create one user"""
+    print_header("CONCURRENT SIGNUPS")
+
+    def signup(i, username, email):
+        return make_request("POST", "/auth/signup", {
+            "username": username(i), "email": email(i), "password": "secret123"
+        }).status_code
+
+    cases = [
+        ("Same username", lambda i: "racer", lambda i: f"racer{i}@example.com"),
+        ("Same email, any case", lambda i: f"racer_{i}", lambda i: "RACER@example.com" if i % 2 else "racer@EXAMPLE.com"),
+    ]
+    for name, username, email in cases:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            codes = list(pool.map(lambda i: signup(i, username, email), range(8)))
+        print_test(f"{name}: exactly one signup succeeds",
+                   codes.count(200) == 1 and codes.count(400) == 7,
+                   f"Status codes: {sorted(codes)}")
+
+def check_concurrent_orders(server):
+    """Test that racing orders never sell more than the stock"""
+    print_header("CONCURRENT ORDERS")
+
+    customer_token = login("john_doe")["access_token"]
+    admin_token = login("admin_user")["access_token"]
+
+    product = make_request("POST", "/products/", {
+        "name": "Scarce Widget", "price": 5.0, "category": "test", "stock": 10
+    }, token=admin_token).json()
+    carts = [
+        make_request("POST", "/carts/", {"items": [{"product_id": product["id"], "quantity": 3}]},
+                     token=customer_token).json()["id"]
+        for _ in range(6)
+    ]
+
+    def place(cart_id):
+        return make_request("POST", "/orders/", {
+            "cart_id": cart_id, "shipping_address": "1 Race St", "payment_method": "credit_card"
+        }, token=customer_token).status_code
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        codes = list(pool.map(place, carts))
+    stock = make_request("GET", f"/products/{product['id']}").json()["stock"]
+    print_test("Three of six orders of 3 fit a stock of 10",
+               codes.count(200) == 3 and codes.count(409) == 3,
+               f"Status codes: {sorted(codes)}")
+    print_test("Stock decremented once per accepted order",
+               stock == 10 - 3 * codes.count(200),
+               f"Stock left: {stock}")
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        codes = list(pool.map(place, [carts[codes.index(200)]] * 4))
+    print_test("A completed cart cannot be ordered again",
+               codes == [409] * 4,
+               f"Status codes: {sorted(codes)}")
+    print_test("Unknown cart is not found",
+               place(999999) == 404)
+
+def check_cursor_pagination(server):
+    """Test that cursor pages list the same products as offset pages"""
+    print_header("CURSOR VS OFFSET PAGINATION")
+
+    queries = [
+        {"sort_by": "id"},
+        {"sort_by": "price", "sort_order": "desc"},
+        {"sort_by": "rating"},
+        {"sort_by": "name", "category": "electronics"},
+        {"sort_by": "price", "min_price": 20, "max_price": 500},
+    ]
+    for query in queries:
+        by_page, page = [], 1
+        while True:
+            data = make_request("GET", "/products/", dict(query, limit=3, page=page)).json()
+            by_page += [p["id"] for p in data["items"]]
+            if page >= data["total_pages"]:
+                break
+            page += 1
+        by_cursor, params = [], dict(query, limit=3)
+        while True:
+            data = make_request("GET", "/products/", params).json()
+            by_cursor += [p["id"] for p in data["items"]]
+            if not data.get("next_cursor"):
+                break
+            params = dict(query, limit=3, cursor=data["next_cursor"])
+        print_test(f"Same order by cursor and by page: {query}",
+                   by_page == by_cursor and len(by_page) > 0,
+                   f"{len(by_page)} products by page, {len(by_cursor)} by cursor")
+
+def check_refresh_tokens(server):
+    """Test refresh-token rotation and revocation"""
+    print_header("REFRESH TOKENS")
+
+    tokens = login("john_doe")
+    response = make_request("POST", "/auth/refresh", {"refresh_token": tokens["refresh_token"]})
+    print_test("Refresh token trades for new tokens", response.status_code == 200,
+               f"Status: {response.status_code}")
+    rotated = response.json()
+    response = make_request("POST", "/auth/refresh", {"refresh_token": tokens["refresh_token"]})
+    print_test("Used refresh token is rejected", response.status_code == 401,
+               f"Status: {response.status_code}")
+
+    response = make_request("GET", "/auth/me", token=rotated["access_token"])
+    print_test("New access token works", response.status_code == 200,
+               f"Status: {response.status_code}")
+    make_request("POST", "/auth/logout", token=rotated["access_token"])
+    response = make_request("GET", "/auth/me", token=rotated["access_token"])
+    print_test("Access token revoked at logout", response.status_code == 401,
+               f"Status: {response.status_code}")
+    response = make_request("POST", "/auth/refresh", {"refresh_token": rotated["refresh_token"]})
+    print_test("Refresh token revoked at logout", response.status_code == 401,
+               f"Status: {response.status_code}")
+
+    # A password change signs out every session of the user
+    admin_token = login("admin_user")["access_token"]
+    user = make_request("POST", "/auth/signup", {
+        "username": "session_user", "email": "session_user@example.com", "password": "secret123"
+    }).json()
+    sessions = [login("session_user", "secret123") for _ in range(2)]
+    make_request("PUT", f"/users/{user['id']}", {"password": "another123"}, token=admin_token)
+    codes = [make_request("GET", "/auth/me", token=s["access_token"]).status_code for s in sessions]
+    codes += [make_request("POST", "/auth/refresh", {"refresh_token": s["refresh_token"]}).status_code
+              for s in sessions]
+    print_test("Password change revokes every session", codes == [401] * 4,
+               f"Status codes: {codes}")
+
+def check_revoke_swept_sessions(server):
+    """Test that revoking a user reaches tokens of sessions no longer stored"""
+    print_header("REVOKING SWEPT SESSIONS")
+
+    admin_token = login("admin_user")["access_token"]
+    user = make_request("POST", "/auth/signup", {
+        "username": "swept_user", "email": "swept_user@example.com", "password": "secret123"
+    }).json()
+    access_token = login("swept_user", "secret123")["access_token"]
+    response = make_request("GET", "/auth/me", token=access_token)
+    print_test("Access token works", response.status_code == 200,
+               f"Status: {response.status_code}")
+
+    # The session outlives its refresh TTL and the next login sweeps it
+    # (the memory store also evicts it, holding one session)
+    time.sleep(1.5)
+    login("john_doe")
+    make_request("PUT", f"/users/{user['id']}", {"password": "another123"}, token=admin_token)
+    response = make_request("GET", "/auth/me", token=access_token)
+    print_test("Password change revokes a swept session's token", response.status_code == 401,
+               f"Status: {response.status_code}")
+
+    tokens = login("swept_user", "another123")
+    response = make_request("GET", "/auth/me", token=tokens.get("access_token"))
+    print_test("Login after the change works", response.status_code == 200,
+               f"Status: {response.status_code}")
+
+# Each check with the settings its server needs
+CHECKS = [
+    (check_null_product_update, {}),
+    (check_ranked_search, {}),
+    (check_filtered_sorts, {}),
+    (check_response_cache, {}),
+    (check_single_flight, {"RESPONSE_CACHE_SIZE": "0"}),
+    (check_facet_counts, {}),
+    # Small batches, so results stream back in several pieces
+    (check_bulk_import, {"IMPORT_BATCH_SIZE": "2"}),
+    # Small chunks, so exports take several reads of the store
+    (check_export_round_trip, {"EXPORT_CHUNK_SIZE": "2"}),
+    # SQLite workers otherwise pick up writes to their suggest trie later
+    (check_suggest, {"SUGGEST_REFRESH_INTERVAL": "0"}),
+    (check_token_cache, {}),
+    (check_null_order_update, {}),
+    (check_product_batch, {}),
+    (check_seed_passwords, {}),
+    (check_hash_pool_limit, {"HASH_WORKERS": "1", "HASH_QUEUE_LIMIT": "1", "BCRYPT_ROUNDS": "12"}),
+    (check_durability, {}),
+    (check_data_dir_lock, {}),
+    (check_duplicate_signup, {}),
+    (check_concurrent_signups, {}),
+    (check_concurrent_orders, {}),
+    (check_cursor_pagination, {}),
+    # uvicorn takes client IPs from X-Forwarded-For sent by these peers
+    (check_rate_limits, {
+        "RATE_LIMIT_ENABLED": "1", "RATE_LIMIT_CATALOG": "0.01,3", "RATE_LIMIT_LOGIN": "0.01,2",
+        "FORWARDED_ALLOW_IPS": "127.0.0.1"
+    }),
+    (check_refresh_tokens, {}),
+    (check_revoke_swept_sessions, {
+        "REFRESH_TOKEN_TTL": "1", "SESSION_SWEEP_INTERVAL": "0", "SESSION_STORE_SIZE": "1"
+    }),
+]
+
+def run_live_checks():
+    """Run every check against each backend"""
+    for backend in BACKENDS:
+        print_header(f"🚀 LIVE-SERVER CHECKS ({backend} backend)")
+        for check, env in CHECKS:
+            with Server(backend, **env) as server:
+                check(server)
+
+    print_header("📊 TEST SUMMARY")
+    print(f"Total Tests: {TEST_RESULTS['total']}")
+    print(f"✅ Passed: {TEST_RESULTS['passed']}")
+    print(f"❌ Failed: {TEST_RESULTS['failed']}")
+    sys.exit(1 if TEST_RESULTS["failed"] else 0)
+
+if __name__ == "__main__":
+    run_live_checks()
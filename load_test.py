@@ -1,5 +1,8 @@
 """
 Simple load test for API
+
+Start the server with RATE_LIMIT_ENABLED=0: every request comes from one
+IP and would otherwise be throttled.
 """
 import concurrent.futures
 import requests
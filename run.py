@@ -1,10 +1,31 @@
+import os
 import uvicorn
-from app.main import app
+
+# Worker processes. More than one needs a store every worker can share,
+# so multi-worker mode runs on the SQLite backend. An uncached SQLite
+# query costs several times an in-memory one (see bench_workers.py), so
+# extra workers only pay off with cores to spare.
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+# Addresses of the proxies trusted to set X-Forwarded-For/-Proto; the
+# client IP (and so the rate limit bucket) comes from there. "*" trusts
+# any peer, for platforms whose proxy address is not known in advance.
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
 
 if __name__ == "__main__":
+    if WORKERS > 1:
+        backend = os.environ.setdefault("DATABASE_BACKEND", "sqlite")
+        if backend != "sqlite":
+            raise SystemExit(
+                f"WORKERS={WORKERS} needs DATABASE_BACKEND=sqlite; "
+                f"with the {backend} backend each worker would have its own copy of the data"
+            )
     uvicorn.run(
-        app,
+        "app.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=False
+        reload=False,
+        workers=WORKERS,
+        proxy_headers=True,
+        forwarded_allow_ips=FORWARDED_ALLOW_IPS
     )